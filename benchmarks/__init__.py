@@ -0,0 +1,123 @@
+"""
+.. currentmodule:: benchmarks
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+The benchmarks of fbml. A benchmark is a function of a size, which builds
+its input and returns the callable to measure. A benchmark whose input is
+changed by the call instead returns a pair of a setup, which builds a fresh
+input before each call without being timed, and the callable of the input.
+Each callable is timed with :func:`time.perf_counter` and its peak memory is
+measured with :mod:`tracemalloc`, and the results are written as JSON, so
+the results of two versions can be compared. Run the suite with::
+
+    python -m benchmarks --output results.json
+
+"""
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+from collections import namedtuple
+
+import logging
+L = logging.getLogger(__name__)
+
+Benchmark = namedtuple('Benchmark', ['name', 'function', 'sizes'])
+
+Result = namedtuple('Result', [
+    'name', 'size', 'repeat', 'best', 'median', 'peak_bytes'
+])
+
+Skipped = namedtuple('Skipped', ['name', 'reason'])
+
+BENCHMARKS = []
+
+
+class Skip(Exception):
+    """ Raised by a benchmark which can not run in this environment """
+
+
+def benchmark(*sizes):
+    """ Registers a benchmark, which is run for each of the sizes """
+    def register(function):
+        BENCHMARKS.append(Benchmark(function.__name__, function, sizes))
+        return function
+    return register
+
+
+def measure(name, size, run, repeat):
+    """
+    Times the callable, and measures the peak memory of one call. The
+    callable can also be a pair of a setup and the callable, see the module.
+    """
+    setup = None
+    if isinstance(run, tuple):
+        setup, run = run
+
+    def inputs():
+        return () if setup is None else (setup(), )
+
+    times = []
+    for _ in range(repeat):
+        arguments = inputs()
+        start = time.perf_counter()
+        run(*arguments)
+        times.append(time.perf_counter() - start)
+
+    arguments = inputs()
+    tracemalloc.start()
+    try:
+        run(*arguments)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return Result(
+        name, size, repeat, min(times), statistics.median(times), peak
+    )
+
+
+def run(pattern='', repeat=5):
+    """
+    Runs the benchmarks whose name contains the pattern.
+
+    :returns: the list of :class:`Result` and :class:`Skipped`
+    """
+    from benchmarks import suite  # registers the benchmarks
+
+    results = []
+    for name, function, sizes in BENCHMARKS:
+        if pattern not in name:
+            continue
+        for size in sizes:
+            try:
+                callable_ = function(size)
+            except Skip as skip:
+                L.info('Skipped %s: %s', name, skip)
+                results.append(Skipped(name, str(skip)))
+                break
+            result = measure(name, size, callable_, repeat)
+            L.info('%s[%s] %.6fs %s bytes', name, size, result.best,
+                   result.peak_bytes)
+            results.append(result)
+    return results
+
+
+def report(results):
+    """ Returns the results as a JSON document """
+    return {
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'results': [
+            dict(result._asdict(), skipped=isinstance(result, Skipped))
+            for result in results
+        ],
+    }
+
+
+def write(results, stream=sys.stdout):
+    json.dump(report(results), stream, indent=2, sort_keys=True)
+    stream.write('\n')
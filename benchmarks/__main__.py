@@ -0,0 +1,24 @@
+"""
+Runs the benchmarks, see :mod:`benchmarks`.
+"""
+import argparse
+import logging
+
+from benchmarks import run, write
+
+parser = argparse.ArgumentParser(prog='python -m benchmarks')
+parser.add_argument('pattern', nargs='?', default='',
+                    help='only run the benchmarks containing the pattern')
+parser.add_argument('-o', '--output', help='the JSON file of the results')
+parser.add_argument('-r', '--repeat', type=int, default=5,
+                    help='the number of timed runs of each benchmark')
+parser.add_argument('-v', '--verbose', action='store_true')
+args = parser.parse_args()
+
+logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+results = run(args.pattern, args.repeat)
+if args.output:
+    with open(args.output, 'w') as stream:
+        write(results, stream)
+else:
+    write(results)
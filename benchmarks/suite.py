@@ -0,0 +1,136 @@
+"""
+.. currentmodule:: benchmarks.suite
+
+The benchmarks of the model, the analyses, the visitors and the backend.
+The graphs are build by the functions below, parameterized by their size.
+
+"""
+from benchmarks import benchmark, Skip
+
+from fbml.model import Function, Method
+from fbml.analysis import Value, TypeSet, FiniteSet
+from fbml.visitor import Cleaner
+from fbml import buildin, node
+
+
+def chain(size):
+    """ A node of size nested negations of x """
+    top = node('x')
+    for _ in range(size):
+        top = node(buildin.neg, {'a': top})
+    return top
+
+
+def ladder(size):
+    """ A node of size additions, where each uses the previous twice """
+    top = node('x')
+    for _ in range(size):
+        top = node(buildin.add, {'a': top, 'b': top})
+    return top
+
+
+def nested(size):
+    """
+    A function of size nested functions, each calling the next with the
+    negated number if it is less than 10.
+    """
+    function = Function({'const': 10}, [Method(
+        node(buildin.lt, {'a': node('number'), 'b': node('const')}),
+        node('number'),
+    )], 'base')
+    for level in range(size):
+        function = Function({'const': 10}, [
+            Method(
+                node(buildin.lt, {'a': node('number'), 'b': node('const')}),
+                node(function, {
+                    'number': node(buildin.neg, {'a': node('number')})
+                })
+            ),
+            Method(
+                node(buildin.ge, {'a': node('number'), 'b': node('const')}),
+                node('number')
+            )
+        ], 'level%s' % level)
+    return function
+
+
+@benchmark(100, 1000, 10000)
+def node_construction(size):
+    return lambda: chain(size)
+
+
+@benchmark(10, 100, 1000)
+def function_construction(size):
+    return lambda: nested(size)
+
+
+@benchmark(100, 1000, 10000)
+def precedes(size):
+    # A fresh graph for each call, as the schedule is cached on the node
+    return (lambda: ladder(size)), (lambda top: top.precedes())
+
+
+@benchmark(10, 50, 150)
+def value_call(size):
+    function = nested(size)
+    evaluator = Value()
+    return lambda: evaluator.call(function, number=3)
+
+
+@benchmark(10, 50, 150, 5000)
+def value_stack_call(size):
+    function = nested(size)
+    evaluator = Value()
+    evaluator.recursive = False
+    return lambda: evaluator.call(function, number=3)
+
+
+@benchmark(10, 50, 150)
+def typeset_call(size):
+    function = nested(size)
+    evaluator = TypeSet()
+    return lambda: evaluator.call(function, number=TypeSet.INTEGER)
+
+
+@benchmark(10, 100, 1000)
+def finiteset_apply(size):
+    evaluator = FiniteSet()
+    numbers = frozenset(range(size))
+    return lambda: evaluator.call(buildin.add, a=numbers, b=numbers)
+
+
+@benchmark(10, 50, 150)
+def cleaner_call(size):
+    function = nested(size)
+    cleaner = Cleaner(TypeSet())
+    return lambda: cleaner.call(function, number=TypeSet.INTEGER)
+
+
+def ladder_function(size):
+    """ A function with a single method, returning the ladder of x """
+    return Function({'test': True}, [Method(node('test'), ladder(size))])
+
+
+def llvm_backend():
+    try:
+        from fbml.backend import llvm_
+    except ImportError as exc:
+        raise Skip('llvm is not available: %s' % exc)
+    return llvm_
+
+
+@benchmark(10, 100, 1000)
+def llvm_compile(size):
+    llvm_ = llvm_backend()
+    types = {'x': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(ladder_function(size), **types)
+    return lambda: llvm_.LLVMBackend().callable(function, types)
+
+
+@benchmark(10, 100, 1000)
+def llvm_call(size):
+    llvm_ = llvm_backend()
+    types = {'x': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(ladder_function(size), **types)
+    native = llvm_.LLVMBackend().callable(function, types)
+    return lambda: native(x=1)
@@ -4,6 +4,7 @@
 """
 import operator as opr
 import itertools
+from functools import reduce
 from collections import namedtuple
 
 import logging
@@ -34,8 +35,35 @@ def reflex(x):
     return x
 
 
+class Top(object):
+
+    """
+    The top element of the finite sets, used when a set has grown beyond the
+    limit of the evaluator. Any value is possible.
+    """
+
+    __slots__ = ()
+
+    cardinality = 'TOP'
+
+    def __repr__(self):
+        return 'FiniteSet.TOP'
+
+
 class FiniteSet (visitor.Evaluator):
 
+    """
+    The finite set evaluator, each value is the set of every possible value.
+
+    :param limit: The maximal number of elements in a set, larger sets are
+        widened to :attr:`TOP`. As default the sets are unbounded.
+
+    A guard of :attr:`TOP` may or may not allow its method, so the result of
+    the method is :attr:`TOP`, which absorbs the results of the other
+    methods. A widened argument therefore results in :attr:`TOP`, unknown,
+    and not in the :attr:`extremum`.
+    """
+
     METHOD_MAPPING = {
         'load': reflex,
         'i_map': reflex,
@@ -67,26 +95,59 @@ class FiniteSet (visitor.Evaluator):
 
     extremum = frozenset({})
 
+    TOP = Top()
+
+    def __init__(self, limit=None):
+        self.limit = limit
+
+    def configuration(self):
+        return (self.limit, )
+
     @classmethod
     def const(cls, value):
         """ Returns a constant set """
         return frozenset({value})
 
+    def exceeds(self, size):
+        """ Returns true if the size exceeds the limit """
+        return self.limit is not None and size > self.limit
+
+    def widen(self, values):
+        """ Widens the set to TOP if it has more elements than the limit """
+        return self.TOP if self.exceeds(len(values)) else values
+
     def transform(self, name, value):
-        return value if isinstance(value, frozenset) else self.const(value)
+        if value is self.TOP:
+            return value
+        elif isinstance(value, frozenset):
+            return self.widen(value)
+        else:
+            return self.const(value)
 
     def merge(self, first, other):
         """ Merges two finitesets """
-        return frozenset(first | other)
+        if first is self.TOP or other is self.TOP:
+            return self.TOP
+        return self.widen(frozenset(first | other))
 
     def allow(self, constraint):
-        """ Check if a constraint is uphold """
-        truth = frozenset({True}) == constraint
-        L.debug('allow %s -> %s', constraint, truth)
-        return truth
+        """
+        Check if a constraint is uphold, or may be uphold if it is
+        :attr:`TOP`, so the statement of the method is visited.
+        """
+        return constraint is self.TOP or frozenset({True}) == constraint
+
+    def exit_method(self, method, guard, statement):
+        if guard is self.TOP:
+            return self.TOP
+        return super(FiniteSet, self).exit_method(method, guard, statement)
 
     def apply(self, method, args_sets):
-        """ Applies the arg_set of the method """
+        """
+        Applies the arg_set of the method. If any of the arguments is TOP, or
+        the number of combinations of the arguments exceeds the limit, the
+        result is TOP.
+        """
         pymethod = self.METHOD_MAPPING[method.code]
 
         def call(args):
@@ -94,13 +155,188 @@ class FiniteSet (visitor.Evaluator):
             retval = pymethod(*args)
             return retval
 
-        retval = frozenset(
-            call(args) for args in itertools.product(*args_sets)
-        )
-        L.debug("%r%s -> %s", method, args_sets, retval)
+        if not all(args_sets):
+            retval = self.extremum
+        elif any(args is self.TOP for args in args_sets) or \
+                self.exceeds(reduce(opr.mul, map(len, args_sets), 1)):
+            retval = self.TOP
+        else:
+            retval = self.widen(frozenset(
+                call(args) for args in itertools.product(*args_sets)
+            ))
         return retval
 
 
+Range = namedtuple('Range', ['low', 'high', 'types'])
+
+BOOL_TYPES = frozenset({bool})
+INFINITY = float('inf')
+
+
+def promote(first, second):
+    """ The python type of arithmetic on the two types """
+    return float if float in (first, second) else int
+
+
+def arithmetic(function):
+    """
+    Creates a transfer function of the ranges, from a function returning the
+    bounds.
+    """
+    def transfer(*args):
+        low, high = function(*args)
+        types = frozenset(
+            promote(first, second)
+            for first in args[0].types for second in args[-1].types
+        )
+        return Range(low, high, types)
+    return transfer
+
+
+def multiply(first, second):
+    """ Multiplies two bounds, where zero times infinity is zero """
+    return 0 if first == 0 or second == 0 else first * second
+
+
+def truth(can_be_true, can_be_false):
+    """ Returns the boolean range of the possible outcomes """
+    return Range(not can_be_false, can_be_true, BOOL_TYPES)
+
+
+def less_than(first, second):
+    return truth(first.low < second.high, first.high >= second.low)
+
+
+def less_equal(first, second):
+    return truth(first.low <= second.high, first.high > second.low)
+
+
+def equal(first, second):
+    return truth(
+        first.low <= second.high and second.low <= first.high,
+        not first.low == first.high == second.low == second.high
+    )
+
+
+def logical_not(arg):
+    return truth(arg.low <= 0 <= arg.high, not arg.low == arg.high == 0)
+
+
+def logical_and(first, second):
+    if first.types == second.types == BOOL_TYPES:
+        return Range(
+            first.low and second.low, first.high and second.high, BOOL_TYPES
+        )
+    return Range(-INFINITY, INFINITY, frozenset({bool, int}))
+
+
+def is_type(type_):
+    """ Creates the transfer function of a type test """
+    return lambda arg: truth(type_ in arg.types, arg.types != {type_})
+
+
+class Interval (visitor.Evaluator):
+
+    """
+    The interval evaluator is an over approximation of the values as
+    ranges, each with the set of python types in the range. In contrast
+    to the :class:`FiniteSet` every transfer function is constant time, no
+    matter the size of the ranges.
+    """
+
+    TRUE = Range(True, True, BOOL_TYPES)
+
+    METHOD_MAPPING = {
+        'load': reflex,
+        'i_map': reflex,
+        'i_neg': arithmetic(lambda a: (-a.high, -a.low)),
+        'i_add': arithmetic(lambda a, b: (a.low + b.low, a.high + b.high)),
+        'i_sub': arithmetic(lambda a, b: (a.low - b.high, a.high - b.low)),
+        'i_mul': arithmetic(lambda a, b: (
+            min(multiply(x, y) for x in a[:2] for y in b[:2]),
+            max(multiply(x, y) for x in a[:2] for y in b[:2])
+        )),
+        'i_ge': lambda a, b: less_equal(b, a),
+        'i_lt': less_than,
+        'i_le': less_equal,
+        'i_gt': lambda a, b: less_than(b, a),
+        'i_eq': equal,
+        'b_not': logical_not,
+        'b_and': logical_and,
+
+        'boolean': is_type(bool),
+        'integer': is_type(int),
+        'real': is_type(float),
+    }
+    METHOD_MAPPING.update(
+        ('r_' + code[2:], method) for code, method in
+        list(METHOD_MAPPING.items()) if code.startswith('i_')
+    )
+
+    extremum = None
+
+    @classmethod
+    def const(cls, value):
+        """ Returns the range only containing the value """
+        return Range(value, value, frozenset({value.__class__}))
+
+    @classmethod
+    def range(cls, low, high):
+        """ Returns the range from low to high, both included """
+        return Range(low, high, frozenset({low.__class__, high.__class__}))
+
+    def transform(self, name, value):
+        return value if isinstance(value, Range) else self.const(value)
+
+    def merge(self, first, other):
+        """ Merges two ranges into the smallest range containing both """
+        if self.failed(first):
+            return other
+        if self.failed(other):
+            return first
+        return Range(
+            min(first.low, other.low),
+            max(first.high, other.high),
+            first.types | other.types
+        )
+
+    def allow(self, constraint):
+        """ Check if a constraint is uphold """
+        return constraint == self.TRUE
+
+    def apply(self, method, args):
+        """ Applies the transfer function of the method """
+        if any(self.failed(arg) for arg in args):
+            return self.extremum
+        return self.METHOD_MAPPING[method.code](*args)
+
+
+class Value (visitor.Evaluator):
+
+    """
+    The concrete evaluator, it evaluates the functions on plain python
+    values using the same build in methods as the :class:`FiniteSet`. A
+    function where no method matches returns the extremum, None.
+    """
+
+    METHOD_MAPPING = FiniteSet.METHOD_MAPPING
+
+    extremum = None
+
+    def transform(self, name, value):
+        return value
+
+    def allow(self, constraint):
+        """ Only the value True allows a method to execute """
+        return constraint is True
+
+    def apply(self, method, args):
+        """ Applies the python method, unless an argument has failed """
+        if any(self.failed(arg) for arg in args):
+            return self.extremum
+        return self.METHOD_MAPPING[method.code](*args)
+
+
 BasicType = namedtuple('BasicType', ['name'])
 CombinedType = namedtuple('CombinedType', ['types'])
 ListType = namedtuple('ListType', ['type'])
@@ -130,6 +366,12 @@ class TypeSet (visitor.Evaluator):
         bool: BOOLEAN
     }
 
+    LIST_CONSTS = {
+        int: INTEGER_LIST,
+        float: REAL_LIST,
+        bool: BOOL_LIST
+    }
+
     METHOD_MAPPING = {
         'load': lambda x: tuple(x)[0],
         'i_map':    all_is(INTEGER_LIST, INTEGER, extremum),
@@ -173,9 +415,7 @@ class TypeSet (visitor.Evaluator):
         """
         Returns wether the constraint is true or not.
         """
-        truth = constraint == self.BOOLEAN
-        L.debug('allow %s -> %s', constraint, truth)
-        return truth
+        return constraint == self.BOOLEAN
 
     def transform(self, name, value):
         return value if isinstance(value, frozenset) else self.const(value)
@@ -183,14 +423,22 @@ class TypeSet (visitor.Evaluator):
     @classmethod
     def const(cls, value):
         """
-        :returns: the constant of a value
+        :returns: the constant of a value, where a tuple is a list of
+            elements of one type
+
+        :raises ValueError: if a tuple does not have elements of one type
         """
+        if isinstance(value, tuple):
+            classes = set(item.__class__ for item in value)
+            if len(classes) != 1:
+                raise ValueError(
+                    'The elements of %r are not of one type' % (value, )
+                )
+            return cls.LIST_CONSTS[classes.pop()]
         return cls.CONSTS[value.__class__]
 
     def apply(self, method, args_sets):
         """
         :returns: the set for applying the method on the arguments.
         """
-        retval = self.METHOD_MAPPING[method.code](args_sets)
-        L.debug("%r%s -> %s", method, args_sets, retval)
-        return retval
+        return self.METHOD_MAPPING[method.code](args_sets)
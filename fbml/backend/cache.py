@@ -0,0 +1,119 @@
+"""
+.. currentmodule:: fbml.backend.cache
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+A persistent cache of compiled code. Each entry is a single file in the
+cache directory, named by its key, holding the bitcode and the IR of a
+compiled module. Entries are written atomically, so concurrent processes
+never read a partial entry, and the least recently used entries are
+removed when the directory grows beyond its size.
+
+"""
+import os
+import tempfile
+from collections import namedtuple
+from hashlib import blake2b
+
+import logging
+L = logging.getLogger(__name__)
+
+Entry = namedtuple('Entry', ['bitcode', 'ir'])
+
+
+class DiskCache(object):
+
+    """
+    The cache of compiled code in a directory.
+
+    :param directory: The directory of the cache, created if needed.
+
+    :param max_bytes: The maximal size of the entries in the directory.
+    """
+
+    SUFFIX = '.fbc'
+
+    def __init__(self, directory, max_bytes=64 * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(*parts):
+        """
+        :returns: the key of the parts, which should be strings or bytes.
+        """
+        digest = blake2b(digest_size=16)
+        for part in parts:
+            if isinstance(part, str):
+                part = part.encode('UTF-8')
+            digest.update(len(part).to_bytes(4, 'little'))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + self.SUFFIX)
+
+    def load(self, key):
+        """
+        :returns: the :class:`Entry` of the key, or None if it is not cached.
+        """
+        path = self.path(key)
+        try:
+            with open(path, 'rb') as entry_file:
+                data = entry_file.read()
+            os.utime(path)
+        except OSError:
+            return None
+        size = int.from_bytes(data[:8], 'little')
+        L.debug('DiskCache hit %s', key)
+        return Entry(data[8:8 + size], data[8 + size:].decode('UTF-8'))
+
+    def store(self, key, bitcode, ir):
+        """
+        Stores the bitcode and the IR under the key. The entry is written to
+        a temporary file which is then moved into place.
+        """
+        handle, temporary = tempfile.mkstemp(
+            dir=self.directory, suffix='.tmp'
+        )
+        try:
+            with os.fdopen(handle, 'wb') as entry_file:
+                entry_file.write(len(bitcode).to_bytes(8, 'little'))
+                entry_file.write(bitcode)
+                entry_file.write(ir.encode('UTF-8'))
+            os.replace(temporary, self.path(key))
+        except BaseException:
+            os.unlink(temporary)
+            raise
+        self.evict()
+
+    def entries(self):
+        """
+        :returns: the paths, sizes and access times of the entries.
+        """
+        for name in os.listdir(self.directory):
+            if not name.endswith(self.SUFFIX):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            yield path, stat.st_size, stat.st_mtime
+
+    def evict(self):
+        """
+        Removes the least recently used entries, until the size of the
+        entries is within the limit.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[2])
+        size = sum(entry[1] for entry in entries)
+        for path, entry_size, _ in entries:
+            if size <= self.max_bytes:
+                break
+            try:
+                os.unlink(path)
+            except OSError:
+                pass
+            size -= entry_size
+            L.debug('DiskCache evicted %s', path)
@@ -6,29 +6,35 @@ A simple backend written in llvm
 
 """
 #pylint: disable = E1101
-from functools import reduce
 from operator import itemgetter
 import collections
+import ctypes
+import io
 import llvm
 import llvm.core as llvmc
+import llvm.ee as llvmee
+import llvm.passes as llvmpasses
 
 import logging
 L = logging.getLogger(__name__)
 
-from fbml.analysis import TypeSet
+from fbml import model
+from fbml.analysis import TypeSet, ListType
+from fbml.backend.specialize import (
+    signature_arguments, depends, specialize
+)
 
 BUILDIN_MAP = {
     'r_add': 'fadd',
     'r_sub': 'fsub',
     'r_mul': 'fmul',
-    'r_neg': 'fneg',
     'r_div': 'fdiv',
 
-    'r_lt':  llvmc.FCMP_ULT,
-    'r_gt':  llvmc.FCMP_UGT,
-    'r_le':  llvmc.FCMP_ULE,
-    'r_ge':  llvmc.FCMP_UGE,
-    'r_eq':  llvmc.FCMP_UEQ,
+    'r_lt':  llvmc.FCMP_OLT,
+    'r_gt':  llvmc.FCMP_OGT,
+    'r_le':  llvmc.FCMP_OLE,
+    'r_ge':  llvmc.FCMP_OGE,
+    'r_eq':  llvmc.FCMP_OEQ,
 
     'i_add': 'add',
     'i_sub': 'sub',
@@ -41,11 +47,10 @@ BUILDIN_MAP = {
     'i_ge':  llvmc.ICMP_SGE,
     'i_eq':  llvmc.ICMP_EQ,
 
-    'and':   'and_',
+    'b_and': 'and_',
+    'b_not': 'not_',
 }
 
-REAL_MAP = {}
-
 INTEGER_CMP = {
     llvmc.ICMP_SLT,
     llvmc.ICMP_SGT,
@@ -55,20 +60,39 @@ INTEGER_CMP = {
 }
 
 REAL_CMP = {
-    llvmc.FCMP_ULT,
-    llvmc.FCMP_UGT,
-    llvmc.FCMP_ULE,
-    llvmc.FCMP_UGE,
-    llvmc.FCMP_UEQ,
+    llvmc.FCMP_OLT,
+    llvmc.FCMP_OGT,
+    llvmc.FCMP_OLE,
+    llvmc.FCMP_OGE,
+    llvmc.FCMP_OEQ,
 }
 
 
+IDENTITY = {'load', 'i_map', 'r_map'}
+
+TYPE_TESTS = {'integer': 'Integer', 'real': 'Real', 'boolean': 'Boolean'}
+
+
 def buildin_method(bldr, name, args):
     """
-    calls an build in method
+    calls an build in method, the map methods are the identity on the
+    element, as the loop over the list is compiled by
+    :meth:`LLVMBackend.array_callable`. The real comparisons are ordered,
+    so they are false if an argument is NaN, and a real is negated by
+    subtracting it from -0.0, as llvm has no negation of reals.
     """
-    if name == 'load':
+    if name in IDENTITY:
         return args[0]
+    if name in TYPE_TESTS:
+        arg, = args
+        return llvmc.Constant.int(
+            llvmc.Type.int(1),
+            str(arg.type) == str(TYPE_MAP[TYPE_TESTS[name]].internal)
+        )
+    if name == 'r_neg':
+        arg, = args
+        assert arg.type == TYPE_MAP['Real'].internal
+        return bldr.fsub(llvmc.Constant.real(arg.type, -0.0), arg)
     if name in BUILDIN_MAP:
 
         # TESTS
@@ -77,7 +101,7 @@ def buildin_method(bldr, name, args):
         elif name.startswith('r'):
             assert args[0].type == TYPE_MAP['Real'].internal
         else:
-            pass
+            assert args[0].type == TYPE_MAP['Boolean'].internal
 
         funcname = BUILDIN_MAP[name]
         try:
@@ -90,12 +114,8 @@ def buildin_method(bldr, name, args):
             if funcname in INTEGER_CMP:
                 return bldr.icmp(funcname, lhs, rhs)
             elif funcname in REAL_CMP:
-                assert False, 'Real comparation'
                 return bldr.fcmp(funcname, lhs, rhs)
             else:
-                assert not funcname.startswith('f'), "{}({}, {})".format(
-                    funcname, lhs, rhs
-                )
                 return getattr(bldr, funcname)(lhs, rhs)
 
     else:
@@ -160,6 +180,19 @@ def order_arguments(arguments):
     """
     return list(sorted(arguments.items(), key=itemgetter(0)))
 
+
+def split_arguments(arguments):
+    """
+    :returns: the names and the values of the arguments, in alphabetical
+        order of the names
+    """
+    ordered = order_arguments(arguments)
+    return (
+        tuple(name for name, value in ordered),
+        tuple(value for name, value in ordered)
+    )
+
+
 Result = collections.namedtuple('Result', [
     'data',
     'bldr',
@@ -273,23 +306,19 @@ class LLVMCompiler (collections.namedtuple('Context', [
             return self.compile_program_graph(method.statement)
 
     def compile_program_graph(self, basenode):
-        internal = self.copy()
-
-        def reduce_opr(compiler, node):
-            """ reduces the outputs of a compile function """
-            result = compiler.compile_node(node)
-            nternal = compiler.copy().with_builder(result.bldr)
-            internal.datamap[node] = result.data
-            return internal
-
-        internal = reduce(
-            reduce_opr,
-            reversed(basenode.precedes()), self
-        )
-        return Result(internal.datamap[basenode], internal.bldr)
+        variables, steps = basenode.schedule
+        registers = [self.datamap[name] for name in variables]
+        compiler = self
+        for step in steps:
+            result = compiler.compile_node(
+                step.node, [registers[index] for index in step.sources]
+            )
+            compiler = compiler.with_builder(result.bldr)
+            registers.append(result.data)
+        return Result(registers[-1], compiler.bldr)
 
-    def compile_node(self, node):
-        return self.compile_function_call(node)
+    def compile_node(self, node, sources):
+        return self.compile_function_call(node, sources)
 
     def compile_buildin_method(self, method):
         return Result(
@@ -300,20 +329,24 @@ class LLVMCompiler (collections.namedtuple('Context', [
             self.bldr
         )
 
-    def compile_function_call(self, node):
-        if len(node.function.methods) == 1:
+    def compile_function_call(self, node, sources):
+        function = node.function
+        # The sources which are not parameters of a cleaned function are
+        # dropped
+        values = node.arguments(sources)
+        if len(function.methods) == 1:
             # Inline function
-            new_values = {
-                argname: self.datamap[node] for argname, node in
-                zip(node.names, node.sources)
-            }
-            internal = self.update_datamap(new_values)
-            method, = node.function.methods
+            internal = self.update_datamap(
+                (name, llvm_const(value))
+                for name, value in function.bound_value_pairs
+            ).update_datamap(zip(function.signature.parameters, values))
+            method, = function.methods
             return internal.compile_method(method)
         else:
-            arg_val = [self.datamap[n] for n in node.sources]
-            func = self.functions[node]
-            node_data = self.bldr.call(func, arg_val)
+            func = self.functions[(function, tuple(
+                type_set_of(value) for value in values
+            ))]
+            node_data = self.bldr.call(func, list(values))
             return Result(node_data, self.bldr)
 
     def compile_function(self, function):
@@ -326,20 +359,71 @@ class LLVMCompiler (collections.namedtuple('Context', [
 
 
 from collections import namedtuple
-LLVMType = namedtuple('LLVMType', ('internal', 'name', 'char'))
+LLVMType = namedtuple('LLVMType', (
+    'internal', 'name', 'char', 'ctype', 'storage', 'format'
+))
 
 LLVM_TYPE_MAP = {
-    'Integer':   LLVMType(llvmc.Type.int(), 'int', 'i'),
-    'Real':      LLVMType(llvmc.Type.double(), 'real', 'r'),
-    'Boolean':   LLVMType(llvmc.Type.int(1), 'int', 'b')
+    'Integer':   LLVMType(llvmc.Type.int(), 'int', 'i', ctypes.c_int,
+                          llvmc.Type.int(), 'i'),
+    'Real':      LLVMType(llvmc.Type.double(), 'real', 'r', ctypes.c_double,
+                          llvmc.Type.double(), 'd'),
+    'Boolean':   LLVMType(llvmc.Type.int(1), 'int', 'b', ctypes.c_bool,
+                          llvmc.Type.int(8), '?')
 }
 
+INDEX_TYPE = llvmc.Type.int(64)
+
 
 def llvm_type(type_set):
     """ Given a type_set with only one ellement this function will
-        reuturn the llvm type """
+        reuturn the llvm type. A list has the type of its elements, as the
+        loop over the list is compiled by :meth:`LLVMBackend.array_callable`.
+    """
+    if type_set and is_list(type_set):
+        type_set = element_type(type_set)
     type_, = type_set
-    return LLVM_TYPE_MAP[type_]
+    return LLVM_TYPE_MAP[type_.name]
+
+
+def is_list(type_set):
+    """ Returns True if the type_set is the type of a list """
+    return all(isinstance(type_, ListType) for type_ in type_set)
+
+
+def element_type(type_set):
+    """ Returns the type_set of the elements of a list type_set """
+    return frozenset(type_.type for type_ in type_set)
+
+
+def llvm_type_of(internal):
+    """ Returns the :class:`LLVMType` of an internal llvm type """
+    for type_ in LLVM_TYPE_MAP.values():
+        if str(type_.internal) == str(internal):
+            return type_
+    raise KeyError(internal)
+
+
+TYPE_SETS = {
+    'i': TypeSet.INTEGER,
+    'r': TypeSet.REAL,
+    'b': TypeSet.BOOLEAN,
+}
+
+
+def type_set_of(llvm_value):
+    """ Returns the TypeSet of a compiled llvm value """
+    return TYPE_SETS[llvm_type_of(llvm_value.type).char]
+
+
+def ctype_of(internal):
+    """ Returns the ctype of an internal llvm type """
+    return llvm_type_of(internal).ctype
+
+
+def function_name(name, types):
+    """ Returns the name of the llvm function of a signature """
+    return name + '_' + ''.join(llvm_type(arg).char for arg in types)
 
 
 def llvm_const(value):
@@ -358,97 +442,534 @@ def initial_values(names, constants, llvm_function):
     return values
 
 
-def depends(function, types):
-    initial = function.bind_variables(types, TypeSet().transform)
-    used_functions = set()
+class NativeFunction(collections.namedtuple('NativeFunction', [
+        'function', 'names', 'llvm_function', 'cfunction'])):
+    """
+    A python callable of a compiled function. The function is called with
+    the same keyword arguments as the fbml function, or positionally in the
+    order of its signature, and the values are passed directly to the
+    native code.
+    """
+
+    def __call__(self, *values, **arguments):
+        if not arguments and len(values) == len(self.names):
+            return self.cfunction(*values)
+        named = dict(zip(self.names, values))
+        if len(named) != len(values) or named.keys() & arguments.keys():
+            raise model.BadBound(self.function, set(self.names), values)
+        arguments.update(named)
+        try:
+            values = [arguments[name] for name in self.names]
+        except KeyError:
+            values = None
+        if values is None or len(arguments) != len(self.names):
+            raise model.BadBound(self.function, set(self.names), arguments)
+        return self.cfunction(*values)
+
+
+class ArrayFunction(collections.namedtuple('ArrayFunction', [
+        'function', 'names', 'lists', 'result', 'llvm_function',
+        'cfunction'])):
+    """
+    A python callable of a compiled loop over lists. The list arguments are
+    objects supporting the buffer protocol, like NumPy arrays or
+    :class:`array.array`, with the element format of the list type. Writable
+    buffers are passed to the native code without copying. The other
+    arguments are passed as scalars to each iteration.
+    """
+
+    def buffer(self, name, value, type_):
+        """ Returns the ctypes array sharing the memory of the value """
+        view = memoryview(value)
+        if view.ndim != 1 or not view.c_contiguous or \
+                view.format.lstrip('@=<') != type_.format or \
+                view.itemsize != ctypes.sizeof(type_.ctype):
+            raise TypeError(
+                'The argument %s is not a contiguous buffer of %r'
+                % (name, type_.format)
+            )
+        array_type = type_.ctype * len(view)
+        if view.readonly:
+            return array_type.from_buffer_copy(view)
+        return array_type.from_buffer(view)
+
+    def into(self, out, **arguments):
+        """
+        Calls the loop with the arguments, and writes the results to the
+        writable buffer out.
+
+        :returns: out
+        """
+        if set(arguments) != set(self.names):
+            raise model.BadBound(self.function, set(self.names), arguments)
+        values = []
+        lengths = set()
+        for name, list_type in zip(self.names, self.lists):
+            value = arguments[name]
+            if list_type is not None:
+                value = self.buffer(name, value, list_type)
+                lengths.add(len(value))
+            values.append(value)
+        output = self.buffer('out', out, self.result)
+        lengths.add(len(output))
+        if len(lengths) != 1:
+            raise ValueError('The lists have different lengths %s' % lengths)
+        self.cfunction(*(values + [len(output), output]))
+        return out
+
+    def __call__(self, **arguments):
+        """
+        :returns: a memoryview of the results, one for each element of the
+            lists
+        """
+        length = next((
+            len(memoryview(arguments[name]))
+            for name, list_type in zip(self.names, self.lists)
+            if list_type is not None and name in arguments
+        ), 0)
+        out = bytearray(length * ctypes.sizeof(self.result.ctype))
+        return self.into(memoryview(out).cast(self.result.format),
+                         **arguments)
+
+
+BACKEND_VERSION = '1'
+
+# The passes which work on the whole module, these can not be added to a
+# function pass manager, so they only run with the module scope.
+MODULE_PASSES = frozenset([
+    'always-inline', 'argpromotion', 'constmerge', 'deadargelim',
+    'functionattrs', 'globaldce', 'globalopt', 'inline', 'internalize',
+    'ipconstprop', 'ipsccp', 'mergefunc', 'partial-inliner', 'prune-eh',
+    'strip', 'strip-dead-prototypes',
+])
+
+# The passes run on the loops of :meth:`LLVMBackend.build_loop` after the
+# function passes of the standard pipeline.
+LOOP_PASSES = (
+    'mem2reg', 'instcombine', 'simplifycfg', 'loop-rotate', 'licm',
+    'indvars', 'gvn', 'instcombine'
+)
+VECTORIZE_PASSES = ('loop-vectorize', 'slp-vectorizer', 'instcombine')
 
-    def collector(node, sources):
-        used_functions.add((node, (node.function, sources)))
-        return node.function.evaluate(TypeSet, node.project(sources))
+Optimization = collections.namedtuple('Optimization', [
+    'name', 'before', 'after', 'instructions_before', 'instructions_after'
+])
 
-    for method in function.methods:
-        if not method.is_buildin:
-            method.guard.visit(collector, initial)
-            method.statement.visit(collector, initial)
 
-    return used_functions
+def instruction_count(llvm_function):
+    """ Returns the number of instructions in a llvm function """
+    return sum(len(block.instructions) for block in llvm_function.basic_blocks)
 
 
 class LLVMBackend(object):
     """
-    This is the LLVM backend for fbml
+    This is the LLVM backend for fbml. The backend owns an execution engine,
+    so the compiled functions can be called from python using
+    :meth:`callable`.
+
+    :param cache: An optional :class:`fbml.backend.cache.DiskCache`. Each
+        compiled function is then built in a module of its own, which is
+        stored in the cache, and later compilations of an equal function
+        with the same types loads the module instead.
+
+    :param opt_level: The optimization level, from 0 to 3, of the standard
+        llvm pipeline.
+
+    :param passes: A list of llvm pass names, used instead of the standard
+        pipeline if given. The passes in :data:`MODULE_PASSES` only run with
+        the module scope.
+
+    :param vectorize: Enables the loop and SLP vectorizers of the standard
+        pipeline, used with the loops of :meth:`array_callable` and
+        :func:`fbml.backend.ufunc.vectorize`.
+
+    :param scope: Either ``'function'`` where each function is optimized
+        when it is build, or ``'module'`` where the module is optimized
+        after a call to :meth:`compile`, allowing interprocedural passes
+        like inlining.
+
+    The IR and the number of instructions of each function before and after
+    the optimization is recorded in :attr:`reports` as an
+    :class:`Optimization`, keyed by the name of the llvm function.
     """
 
-    def __init__(self):
+    def __init__(self, cache=None, opt_level=0, passes=None,
+                 scope='function', vectorize=False):
+        if scope not in ('function', 'module'):
+            raise ValueError('Unknown optimization scope %r' % scope)
         self.module = llvmc.Module.new('sandbox')
+        self.engine = llvmee.ExecutionEngine.new(self.module)
         self.functions = {}
-
-    def build_function(self, function, type_map, name):
+        self.cache = cache
+        self.opt_level = opt_level
+        self.passes = passes
+        self.scope = scope
+        self.vectorize = vectorize
+        self.reports = {}
+        self.target = None
+        self.managers = {}
+        self.loop_managers = {}
+
+    @property
+    def optimizing(self):
+        return bool(self.passes) or self.opt_level > 0
+
+    def target_machine(self):
+        """ :returns: the target machine of the backend, created once """
+        if self.target is None:
+            self.target = llvmee.TargetMachine.new(opt=self.opt_level)
+        return self.target
+
+    def pass_managers(self, module):
         """
-        Creates a LLVM function from all of these methods. Assumes that the
-        methods have the same argument names.
+        :returns: the module and the function pass managers of the module,
+            which are created once for each module.
         """
-        return_type = TypeSet().visit_function(function, type_map)
-
-        if not return_type:
-            raise Exception(
-                'Function not valid for arguments',
-                function, type_map
+        try:
+            return self.managers[module]
+        except KeyError:
+            pass
+        if self.passes:
+            pm = llvmpasses.PassManager.new()
+            fpm = llvmpasses.FunctionPassManager.new(module)
+            for name in self.passes:
+                pm.add(name)
+                if name not in MODULE_PASSES:
+                    fpm.add(name)
+        else:
+            pms = llvmpasses.build_pass_managers(
+                tm=self.target_machine(), opt=self.opt_level, mod=module,
+                loop_vectorize=self.vectorize, slp_vectorize=self.vectorize
             )
+            pm, fpm = pms.pm, pms.fpm
+        self.managers[module] = pm, fpm
+        return pm, fpm
+
+    def loop_pass_manager(self, module):
+        """
+        :returns: the function pass manager of the loops in the module, see
+            :meth:`build_loop`. The standard pipeline only optimizes loops in
+            its module pass manager, so the loop passes are added to the
+            function passes.
+        """
+        try:
+            return self.loop_managers[module]
+        except KeyError:
+            pass
+        if self.passes:
+            fpm = self.pass_managers(module)[1]
+        else:
+            fpm = llvmpasses.build_pass_managers(
+                tm=self.target_machine(), opt=self.opt_level, mod=module,
+                pm=False
+            ).fpm
+            for name in LOOP_PASSES:
+                fpm.add(name)
+            if self.vectorize:
+                for name in VECTORIZE_PASSES:
+                    fpm.add(name)
+        self.loop_managers[module] = fpm
+        return fpm
+
+    def record(self, llvm_function, before, count):
+        """ Records the optimization of the function """
+        report = Optimization(
+            llvm_function.name, before, str(llvm_function),
+            count, instruction_count(llvm_function)
+        )
+        L.debug('Optimized %s from %s to %s instructions', report.name,
+                report.instructions_before, report.instructions_after)
+        self.reports[report.name] = report
 
-        build_functions = {
-            node: self.build_function(depfunc, deptypes, str(id(depfunc)))
-            for node, (depfunc, deptypes) in depends(function, type_map)
-            if depfunc != function and len(depfunc.methods) > 1
-        }
-        names, types = zip(*sorted(type_map.items(), key=itemgetter(1)))
-        arg_types = [llvm_type(arg).internal for arg in types]
-        return_type = llvm_type(return_type).internal
+    def optimize_function(self, llvm_function, fpm=None):
+        """
+        Optimizes a single function with the function passes, as default
+        those of its module.
+        """
+        before = str(llvm_function), instruction_count(llvm_function)
+        if fpm is None:
+            pm, fpm = self.pass_managers(llvm_function.module)
+        fpm.initialize()
+        fpm.run(llvm_function)
+        fpm.finalize()
+        self.record(llvm_function, *before)
+
+    def optimize_module(self, module):
+        """ Optimizes every defined function in the module """
+        functions = [
+            llvm_function for llvm_function in module.functions
+            if not llvm_function.is_declaration
+        ]
+        before = [
+            (str(llvm_function), instruction_count(llvm_function))
+            for llvm_function in functions
+        ]
+        pm, fpm = self.pass_managers(module)
+        pm.run(module)
+        for llvm_function, (ir, count) in zip(functions, before):
+            self.record(llvm_function, ir, count)
 
-        func_type = llvmc.Type.function(return_type, arg_types)
-        func_name = \
-            name + '_' + ''.join(llvm_type(arg).char for arg in types)
+    def cache_key(self, function, type_map, name):
+        """
+        The key of the function in the cache, the fingerprint of the
+        function, the type signature, the name of the llvm function and the
+        versions and options of the backend.
+        """
+        names, types = split_arguments(type_map)
+        return self.cache.key(
+            function.fingerprint,
+            ' '.join(
+                argument + ':' + llvm_type(type_).char
+                for argument, type_ in zip(names, types)
+            ),
+            name, BACKEND_VERSION, llvm.__version__,
+            self.scope, str(self.opt_level), ' '.join(self.passes or ()),
+            str(self.vectorize)
+        )
 
-        L.debug("Building: %s %s", func_name, func_type)
+    def build_function(self, function, type_map, name, module=None):
+        """
+        Creates a LLVM function from all of these methods, together with
+        the functions it calls, see :meth:`build_program`. The functions are
+        build in the module, as default the module of the backend.
+        """
+        return self.build_program(function, type_map, name, module)
 
-        llvm_function = llvmc.Function.new(self.module, func_type, func_name)
+    def build_program(self, function, type_map, name=None, module=None):
+        """
+        Builds the function, and every function it calls which is not
+        inlined, specialized to the types of their arguments using
+        :func:`specialize`. Every function is declared before the bodies
+        are build, so they are build in one module, as default the module
+        of the backend.
 
-        self.functions[(function, types)] = llvm_function
-        values = initial_values(names, function.bound_values, llvm_function)
+        :returns: the llvm function of the function
+        """
+        if module is None:
+            module = self.module
+        if not name:
+            name = function.code
+
+        program = specialize(function, type_map)
+        functions, declared = {}, []
+        for (callee, types), specialization in program.items():
+            func_type = llvmc.Type.function(
+                llvm_type(specialization.result).internal,
+                [llvm_type(arg).internal for arg in types]
+            )
+            func_name = function_name(
+                name if callee is function else callee.code, types
+            )
+            L.debug("Declaring: %s %s", func_name, func_type)
+            llvm_function = llvmc.Function.new(module, func_type, func_name)
+            # The calls find the function by the types of the compiled
+            # values, where a list is compiled as its elements
+            functions[(callee, tuple(
+                TYPE_SETS[llvm_type(arg).char] for arg in types
+            ))] = llvm_function
+            declared.append((callee, specialization, llvm_function))
+
+        for callee, specialization, llvm_function in declared:
+            values = initial_values(
+                callee.signature.parameters,
+                specialization.model.bound_values, llvm_function
+            )
+            L.debug("Assigned Variables %s", values)
 
-        L.debug("Assigned Variables %s", values)
+            entry = llvm_function.append_basic_block('entry')
+            bldr = llvmc.Builder.new(entry)
 
-        entry = llvm_function.append_basic_block('entry')
-        bldr = llvmc.Builder.new(entry)
+            compiler = LLVMCompiler(values, functions, bldr)
+            result = compiler.compile_function(specialization.model)
 
-        compiler = LLVMCompiler(values, build_functions, bldr)
-        result = compiler.compile_function(function)
+            result.bldr.ret(result.data)
 
-        result.bldr.ret(result.data)
+            try:
+                llvm_function.verify()
+            except llvm.LLVMException as exc:
+                L.error(eval(str(exc)).decode(encoding='UTF-8'))
 
-        try:
-            llvm_function.verify()
-        except llvm.LLVMException as exc:
-            L.error(eval(str(exc)).decode(encoding='UTF-8'))
+        if self.optimizing and self.scope == 'function':
+            for _, _, llvm_function in declared:
+                self.optimize_function(llvm_function)
 
-        return llvm_function
+        entry = next(iter(program))
+        self.functions[entry] = declared[0][2]
+        return declared[0][2]
 
     def compile(self, function, type_map, name=None):
         """ Compiles a FBML function to a LLVM Function """
         if not name:
-            name = 'f' +  hex(id(function))
+            name = function.code
 
         L.debug('Compiling %s %s', name, type_map)
-        type_id = tuple(
-            type_ for name, type_ in sorted(
-                type_map.items(), key=itemgetter(1)
-            )
-        )
+        names, type_id = split_arguments(type_map)
         key = (function, type_id)
         if key in self.functions:
             result = self.functions[key]
+        elif self.cache is not None:
+            result = self.compile_cached(function, type_map, name)
         else:
             result = self.build_function(function, type_map, name)
+            if self.optimizing and self.scope == 'module':
+                self.optimize_module(self.module)
 
         L.debug('%s -> %s', name, result)
         return result
+
+    def compile_cached(self, function, type_map, name):
+        """
+        Compiles the function in a module of its own using the cache. On a
+        hit the module is loaded from the bitcode, without analysing or
+        building the function.
+        """
+        names, types = split_arguments(type_map)
+        func_name = function_name(name, types)
+        cache_key = self.cache_key(function, type_map, name)
+
+        entry = self.cache.load(cache_key)
+        if entry is not None:
+            module = llvmc.Module.from_bitcode(io.BytesIO(entry.bitcode))
+            result = module.get_function_named(func_name)
+            self.functions[(function, types)] = result
+        else:
+            module = llvmc.Module.new(func_name)
+            result = self.build_function(function, type_map, name, module)
+            if self.optimizing and self.scope == 'module':
+                self.optimize_module(module)
+            self.cache.store(cache_key, module.to_bitcode(), str(module))
+
+        self.engine.add_module(module)
+        return result
+
+    def callable(self, function, type_map, name=None):
+        """
+        Compiles a FBML function, and returns a :class:`NativeFunction`
+        which calls the compiled code using the execution engine of the
+        backend.
+
+        :param function: The function to compile
+
+        :param type_map: The TypeSet of each argument of the function
+        """
+        llvm_function = self.compile(function, type_map, name)
+        names, types = signature_arguments(function, type_map)
+
+        prototype = ctypes.CFUNCTYPE(
+            ctype_of(llvm_function.type.pointee.return_type),
+            *(llvm_type(type_).ctype for type_ in types)
+        )
+        address = self.engine.get_pointer_to_function(llvm_function)
+        return NativeFunction(
+            function, names, llvm_function, prototype(address)
+        )
+
+    def build_loop(self, kernel, names, lists, noalias=False):
+        """
+        Builds a function which calls the kernel for each index of the
+        lists. The function takes a pointer for each list argument and a
+        value for each scalar argument, in the order of the names, followed
+        by the length and a pointer to the output.
+
+        If noalias is set the output may not overlap the lists, which lets
+        the loop vectorizer emit vector instructions. When optimizing, the
+        kernel is inlined into the loop, and only the loop is optimized with
+        the :meth:`loop_pass_manager`.
+        """
+        module = kernel.module
+        result = llvm_type_of(kernel.type.pointee.return_type)
+        parameters = [
+            llvmc.Type.pointer(list_type.storage)
+            if list_type is not None else argument.type
+            for list_type, argument in zip(lists, kernel.args)
+        ] + [INDEX_TYPE, llvmc.Type.pointer(result.storage)]
+        loop = module.add_function(
+            llvmc.Type.function(llvmc.Type.void(), parameters),
+            kernel.name + '_loop'
+        )
+        for name, arg in zip(names + ('length', 'out'), loop.args):
+            arg.name = name
+        length, out = loop.args[-2:]
+        if noalias:
+            for arg in loop.args:
+                if arg.type.kind == llvmc.TYPE_POINTER:
+                    arg.add_attribute(llvmc.ATTR_NO_ALIAS)
+
+        entry = loop.append_basic_block('entry')
+        cond = loop.append_basic_block('cond')
+        body = loop.append_basic_block('body')
+        done = loop.append_basic_block('done')
+
+        bldr = llvmc.Builder.new(entry)
+        bldr.branch(cond)
+
+        bldr.position_at_end(cond)
+        index = bldr.phi(INDEX_TYPE, 'index')
+        index.add_incoming(llvmc.Constant.int(INDEX_TYPE, 0), entry)
+        bldr.cbranch(
+            bldr.icmp(llvmc.ICMP_SLT, index, length), body, done
+        )
+
+        bldr.position_at_end(body)
+        values = []
+        for list_type, arg, param in zip(lists, loop.args, kernel.args):
+            if list_type is None:
+                values.append(arg)
+                continue
+            value = bldr.load(bldr.gep(arg, [index]))
+            if value.type != param.type:
+                value = bldr.trunc(value, param.type)
+            values.append(value)
+        call = value = bldr.call(kernel, values)
+        if value.type != result.storage:
+            value = bldr.zext(value, result.storage)
+        bldr.store(value, bldr.gep(out, [index]))
+        index.add_incoming(
+            bldr.add(index, llvmc.Constant.int(INDEX_TYPE, 1)), body
+        )
+        bldr.branch(cond)
+
+        bldr.position_at_end(done)
+        bldr.ret_void()
+
+        loop.verify()
+        if self.optimizing:
+            llvmc.inline_function(call)
+            self.optimize_function(loop, self.loop_pass_manager(module))
+        return loop
+
+    def array_callable(self, function, type_map, name=None):
+        """
+        Compiles a FBML function over lists into a native loop, and returns
+        an :class:`ArrayFunction`. The function is compiled as a kernel on
+        the elements, where the map methods are the identity, and the loop
+        calls the kernel once for each element.
+
+        :param function: The function to compile, where the map methods
+            have been cleaned with the list types.
+
+        :param type_map: The TypeSet of each argument of the function, at
+            least one of which must be a list type.
+        """
+        names, types = split_arguments(type_map)
+        lists = tuple(
+            llvm_type(element_type(type_)) if is_list(type_) else None
+            for type_ in types
+        )
+        if all(list_type is None for list_type in lists):
+            raise ValueError('No list arguments in %s' % type_map)
+
+        kernel = self.compile(function, type_map, name)
+        loop = self.build_loop(kernel, names, lists)
+        result = llvm_type_of(kernel.type.pointee.return_type)
+
+        prototype = ctypes.CFUNCTYPE(None, *(
+            [ctypes.POINTER(list_type.ctype) if list_type is not None
+             else llvm_type(type_).ctype
+             for list_type, type_ in zip(lists, types)] +
+            [ctypes.c_int64, ctypes.POINTER(result.ctype)]
+        ))
+        address = self.engine.get_pointer_to_function(loop)
+        return ArrayFunction(
+            function, names, lists, result, loop, prototype(address)
+        )
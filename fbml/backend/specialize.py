@@ -0,0 +1,133 @@
+"""
+.. currentmodule:: fbml.backend.specialize
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+Whole program specialization. Starting from a function and the types of
+its arguments, every function which is called, and not inlined, by the
+compiled code is found together with the types of its arguments, and each
+is cleaned for those types, so a polymorphic function is compiled to a
+monomorphic function for each of its uses.
+
+"""
+import collections
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml.model import BadBound
+from fbml.analysis import TypeSet
+from fbml.visitor import Cleaner
+
+
+def signature_arguments(function, type_map):
+    """
+    :returns: the names and the values of the arguments, in the order of
+        the parameters of the signature of the function.
+
+    :raises BadBound: if the arguments are not the free variables.
+    """
+    signature = function.signature
+    if type_map.keys() != signature.free:
+        raise BadBound(function, set(signature.free), type_map)
+    return (
+        signature.parameters,
+        tuple(type_map[name] for name in signature.parameters)
+    )
+
+
+def call_arguments(function, arguments):
+    """
+    :returns: the arguments of a call to the function, the arguments of a
+        node which are not parameters of a cleaned function are dropped.
+    """
+    try:
+        return {
+            name: arguments[name] for name in function.signature.parameters
+        }
+    except KeyError:
+        raise BadBound(function, function.free_variables(), arguments)
+
+
+def depends(function, type_map):
+    """
+    Finds the calls of the function which are compiled as calls, which are
+    the nodes calling a function with more than one method. Functions with
+    one method are inlined, so the calls of their method are included.
+
+    :returns: a dictionary from the callee and the types of its arguments,
+        in the order of its signature, to the type_map of the call.
+    """
+    evaluator = TypeSet()
+    calls = {}
+
+    def visit(function, initial):
+        for method in function.methods:
+            if method.is_buildin:
+                continue
+            for root in (method.guard, method.statement):
+                variables, steps = root.schedule
+                registers = [initial[name] for name in variables]
+                for step in steps:
+                    current = step.node
+                    callee = current.function
+                    types = current.arguments(
+                        [registers[index] for index in step.sources]
+                    )
+                    if len(callee.methods) > 1:
+                        calls[(callee, types)] = dict(
+                            zip(callee.signature.parameters, types)
+                        )
+                    elif not callee.is_buildin:
+                        visit(callee, callee.bind_positional(
+                            types, evaluator.transform
+                        ))
+                    registers.append(evaluator.visit_values(callee, types))
+
+    visit(function, function.bind_variables(type_map, evaluator.transform))
+    return calls
+
+
+Specialization = collections.namedtuple('Specialization', [
+    'function', 'type_map', 'model', 'result'
+])
+
+
+def specialize(function, type_map):
+    """
+    Specializes the function, and every function it calls which is not
+    inlined, to the types of their arguments. The call graph is walked from
+    the function using :func:`depends`, and each pair of a callee and the
+    types of its arguments is cleaned once using ``Cleaner(TypeSet())``.
+
+    :returns: an ordered dictionary from the function and the types of its
+        arguments to the :class:`Specialization`, starting with the
+        function.
+    """
+    cleaner = Cleaner(TypeSet())
+    specializations = collections.OrderedDict()
+    pending = [(function, type_map)]
+    while pending:
+        function, type_map = pending.pop()
+        names, types = signature_arguments(function, type_map)
+        if (function, types) in specializations:
+            continue
+        clean = cleaner.visit_function(function, {
+            name: cleaner.transform(name, value)
+            for name, value in type_map.items()
+        })
+        if not clean.result:
+            raise Exception(
+                'Function not valid for arguments', function, type_map
+            )
+        specializations[(function, types)] = Specialization(
+            function, type_map, clean.model, clean.result
+        )
+        # Cleaning may remove every method using a parameter, so the model
+        # is only given its own parameters
+        calls = depends(clean.model, call_arguments(clean.model, type_map))
+        pending.extend(
+            (callee, arguments)
+            for (callee, _), arguments in reversed(list(calls.items()))
+        )
+    L.debug('Specialized %s functions', len(specializations))
+    return specializations
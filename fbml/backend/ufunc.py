@@ -0,0 +1,87 @@
+"""
+.. currentmodule:: fbml.backend.ufunc
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+Vectorized native functions. Any scalar function compiled by the
+:class:`fbml.backend.llvm_.LLVMBackend` can be wrapped in a loop over
+arrays, and called like a NumPy ufunc, where the arguments are broadcasted
+against each other and the whole batch is computed in one native call.
+
+"""
+import collections
+import ctypes
+
+import numpy
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml import model
+from fbml.backend import llvm_
+
+DTYPES = {
+    'i': numpy.intc,
+    'r': numpy.double,
+    'b': numpy.bool_,
+}
+
+
+class UFunc(collections.namedtuple('UFunc', [
+        'function', 'names', 'types', 'result', 'llvm_function',
+        'cfunction'])):
+    """
+    A python callable of a compiled loop over arrays. The function is called
+    with the same keyword arguments as the fbml function, each of which may
+    be a scalar or an array. The arguments are broadcasted, and the result
+    has the broadcasted shape.
+    """
+
+    def __call__(self, **arguments):
+        if set(arguments) != set(self.names):
+            raise model.BadBound(self.function, set(self.names), arguments)
+        arrays = numpy.broadcast_arrays(*(
+            numpy.asarray(arguments[name]).astype(
+                DTYPES[type_.char], casting='same_kind', copy=False
+            )
+            for name, type_ in zip(self.names, self.types)
+        ))
+        shape = arrays[0].shape if arrays else ()
+        arrays = [numpy.ascontiguousarray(array) for array in arrays]
+        out = numpy.empty(shape, dtype=DTYPES[self.result.char])
+        self.cfunction(*(
+            [array.ctypes.data_as(ctypes.POINTER(type_.ctype))
+             for array, type_ in zip(arrays, self.types)] +
+            [out.size, out.ctypes.data_as(ctypes.POINTER(self.result.ctype))]
+        ))
+        return out[()] if shape == () else out
+
+
+def vectorize(backend, function, type_map, name=None):
+    """
+    Compiles a scalar FBML function, and wraps it in a loop where every
+    argument is an array. Construct the backend with an ``opt_level`` of 2
+    or more and ``vectorize`` set to get vector instructions in the loop.
+
+    :param backend: The :class:`fbml.backend.llvm_.LLVMBackend` to compile
+        with.
+
+    :param function: The function to compile
+
+    :param type_map: The TypeSet of each argument of the function
+
+    :returns: a :class:`UFunc`
+    """
+    names, types = llvm_.split_arguments(type_map)
+    types = tuple(llvm_.llvm_type(type_) for type_ in types)
+
+    kernel = backend.compile(function, type_map, name)
+    loop = backend.build_loop(kernel, names, types, noalias=True)
+    result = llvm_.llvm_type_of(kernel.type.pointee.return_type)
+
+    prototype = ctypes.CFUNCTYPE(None, *(
+        [ctypes.POINTER(type_.ctype) for type_ in types] +
+        [ctypes.c_int64, ctypes.POINTER(result.ctype)]
+    ))
+    address = backend.engine.get_pointer_to_function(loop)
+    L.debug('vectorized %s as %s', function, loop.name)
+    return UFunc(function, names, types, result, loop, prototype(address))
@@ -0,0 +1,129 @@
+"""
+.. currentmodule:: fbml.batch
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+Batched evaluation of functions using NumPy. Every value is an array of
+lanes, where each lane is one row of arguments, and a mask telling which
+lanes have a value. The build in methods are mapped to ufuncs, so a
+function is visited once per batch instead of once per row.
+
+"""
+from collections import namedtuple
+from functools import reduce
+
+import numpy
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml import visitor
+
+
+def reflex(x):
+    return x
+
+
+Lanes = namedtuple('Lanes', ['value', 'mask'])
+
+Result = namedtuple('Result', ['value', 'failed'])
+
+
+class Batch (visitor.Evaluator):
+
+    """
+    The batched concrete evaluator, it has the same semantics as
+    :class:`fbml.analysis.Value` applied to each lane. The arguments may be
+    arrays or scalars, and are broadcasted against each other.
+
+    :meth:`call` returns a :class:`Result` with the values and a mask of the
+    lanes where no method matched.
+    """
+
+    METHOD_MAPPING = {
+        'load':   reflex,
+        'i_map':  reflex,
+        'i_neg':  numpy.negative,
+        'i_add':  numpy.add,
+        'i_sub':  numpy.subtract,
+        'i_mul':  numpy.multiply,
+        'i_ge':   numpy.greater_equal,
+        'i_lt':   numpy.less,
+        'i_le':   numpy.less_equal,
+        'i_gt':   numpy.greater,
+        'i_eq':   numpy.equal,
+        'r_map':  reflex,
+        'r_neg':  numpy.negative,
+        'r_add':  numpy.add,
+        'r_sub':  numpy.subtract,
+        'r_mul':  numpy.multiply,
+        'r_ge':   numpy.greater_equal,
+        'r_lt':   numpy.less,
+        'r_le':   numpy.less_equal,
+        'r_gt':   numpy.greater,
+        'r_eq':   numpy.equal,
+        'b_not':  numpy.logical_not,
+        'b_and':  numpy.logical_and,
+        'boolean': lambda a: numpy.bool_(a.dtype.kind == 'b'),
+        'integer': lambda a: numpy.bool_(a.dtype.kind in 'iu'),
+        'real':   lambda a: numpy.bool_(a.dtype.kind == 'f'),
+    }
+
+    extremum = None
+
+    def call(self, function, *values, **arguments):
+        if values:
+            arguments = function.name_arguments(values, arguments)
+        shape = numpy.broadcast(*arguments.values()).shape \
+            if arguments else ()
+        lanes = super(Batch, self).call(function, **arguments)
+        if self.failed(lanes):
+            return Result(
+                numpy.zeros(shape), numpy.ones(shape, dtype=bool)
+            )
+        return Result(
+            numpy.broadcast_to(lanes.value, shape),
+            ~numpy.broadcast_to(lanes.mask, shape)
+        )
+
+    def transform(self, name, value):
+        if isinstance(value, Lanes):
+            return value
+        value = numpy.asarray(value)
+        return Lanes(value, numpy.ones(value.shape, dtype=bool))
+
+    def passes(self, test):
+        """ Returns the mask of the lanes where the test is True """
+        if test.value.dtype != bool:
+            return numpy.zeros(test.mask.shape, dtype=bool)
+        return test.value & test.mask
+
+    def allow(self, constraint):
+        """ A method is visited if the guard is True in any lane """
+        return not self.failed(constraint) and \
+            bool(numpy.any(self.passes(constraint)))
+
+    def merge(self, first, second):
+        """ Merges lane by lane, keeping the first value that did not fail """
+        if self.failed(first):
+            return second
+        if self.failed(second):
+            return first
+        return Lanes(
+            numpy.where(first.mask, first.value, second.value),
+            first.mask | second.mask
+        )
+
+    def apply(self, method, args):
+        """ Applies the ufunc of the method on the lanes """
+        if any(self.failed(arg) for arg in args):
+            return self.extremum
+        value = self.METHOD_MAPPING[method.code](
+            *(arg.value for arg in args)
+        )
+        mask = reduce(numpy.logical_and, (arg.mask for arg in args))
+        return Lanes(numpy.asarray(value), mask)
+
+    def exit_method(self, method, guard, statement):
+        if self.failed(statement):
+            return self.extremum
+        return Lanes(statement.value, statement.mask & self.passes(guard))
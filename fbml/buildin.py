@@ -37,6 +37,10 @@ r_eq = BuildInMethod(('a', 'b'), 'r_eq')
 
 load = BuildInMethod(('a', ), 'load')
 
+t_integer = BuildInMethod(('a', ), 'integer')
+t_real = BuildInMethod(('a', ), 'real')
+t_boolean = BuildInMethod(('a', ), 'boolean')
+
 i_map = BuildInMethod(('a', ), 'i_map')
 r_map = BuildInMethod(('a', ), 'r_map')
 
@@ -57,6 +61,10 @@ le = Function({},  [i_le, r_le], 'le')
 gt = Function({},  [i_gt, r_gt], 'gt')
 eq = Function({},  [i_eq, r_eq], 'eq')
 
+integer = Function({}, [t_integer], 'integer')
+real = Function({}, [t_real], 'real')
+boolean = Function({}, [t_boolean], 'boolean')
+
 METHODS = (
     i_neg,
     i_add,
@@ -78,4 +86,7 @@ METHODS = (
     r_eq,
     b_not,
     b_and,
+    t_integer,
+    t_real,
+    t_boolean,
 )
@@ -0,0 +1,153 @@
+"""
+.. currentmodule:: fbml.library
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+A store of named functions in a single file, which is opened with
+:mod:`mmap`, so only the functions which are used are read. Each function
+is a :mod:`fbml.serialize` stream of its own, where the calls to other
+functions of the library are ``EXTERN`` records, and the file ends with an
+index from the names to the streams.
+
+The file is laid out as::
+
+    MAGIC VERSION index-offset(8 bytes) stream... index
+
+where the index is the number of entries followed by the name, the offset
+and the length of each stream.
+
+"""
+import mmap
+import struct
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml import serialize
+
+MAGIC = b'FBLB'
+VERSION = 1
+
+HEADER = struct.Struct('<4sBQ')
+
+
+def write_varint(stream, value):
+    data = bytearray()
+    while value > 0x7f:
+        data.append(value & 0x7f | 0x80)
+        value >>= 7
+    data.append(value)
+    stream.write(data)
+
+
+def read_varint(data, position):
+    """ Returns the varint at the position and the position after it """
+    result, shift = 0, 0
+    while True:
+        byte = data[position]
+        position += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, position
+        shift += 7
+
+
+def write_library(path, functions):
+    """
+    Writes the library file.
+
+    :param path: The path of the file.
+
+    :param functions: A dictionary from the names to the functions of the
+        library.
+    """
+    externs = {}
+    for name, function in sorted(functions.items()):
+        externs.setdefault(function, name)
+
+    index = []
+    with open(path, 'wb') as stream:
+        stream.write(HEADER.pack(MAGIC, VERSION, 0))
+        for name, function in sorted(functions.items()):
+            offset = stream.tell()
+            serialize.Writer(stream, externs).write(function)
+            index.append((name, offset, stream.tell() - offset))
+
+        index_offset = stream.tell()
+        write_varint(stream, len(index))
+        for name, offset, length in index:
+            data = name.encode('UTF-8')
+            write_varint(stream, len(data))
+            stream.write(data)
+            write_varint(stream, offset)
+            write_varint(stream, length)
+
+        stream.seek(0)
+        stream.write(HEADER.pack(MAGIC, VERSION, index_offset))
+    L.debug('Wrote %s functions to %s', len(index), path)
+
+
+class Library(object):
+
+    """
+    A library file opened for reading. The library is a mapping from names
+    to functions, where each function is read the first time it is used,
+    together with the functions of the library it calls, and then kept.
+
+    :param path: The path of a file written by :func:`write_library`.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as stream:
+            self.map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, position = HEADER.unpack_from(self.map)
+        if magic != MAGIC:
+            raise ValueError('Not a fbml library %s' % path)
+        if version != VERSION:
+            raise ValueError('Unsupported version %s' % version)
+
+        self.index = {}
+        count, position = read_varint(self.map, position)
+        for _ in range(count):
+            size, position = read_varint(self.map, position)
+            name = self.map[position:position + size].decode('UTF-8')
+            offset, position = read_varint(self.map, position + size)
+            length, position = read_varint(self.map, position)
+            self.index[name] = offset, length
+        self.cache = {}
+
+    def __getitem__(self, name):
+        try:
+            return self.cache[name]
+        except KeyError:
+            pass
+        offset, length = self.index[name]
+        function = serialize.loads(
+            self.map[offset:offset + length], self.__getitem__
+        )
+        L.debug('Loaded %s from the library', name)
+        self.cache[name] = function
+        return function
+
+    def get(self, name, default=None):
+        try:
+            return self[name]
+        except KeyError:
+            return default
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
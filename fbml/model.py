@@ -9,11 +9,21 @@
 
 The function is a holder of bound_values, ei. constants, and a set of methods.
 
+Fingerprints
+============
+
+Every object in the model has a :attr:`Structure.fingerprint`, a 128 bit
+digest of its structure. It is computed once, when the object is created,
+from the fingerprints of its children, and it is the same across processes
+and runs. Equality and hashing of the model objects uses the fingerprints,
+so neither recurse through the graph.
 
 """
+import weakref
+from hashlib import blake2b
 from itertools import chain
 from operator import itemgetter
-from collections import namedtuple, deque
+from collections import namedtuple
 
 import logging
 L = logging.getLogger(__name__)
@@ -34,7 +44,74 @@ class BadBound(Exception):
                 "received arguments {s.arguments}").format(s=self)
 
 
-class Function(namedtuple('Function', [
+def value_fingerprint(value):
+    """
+    The fingerprint of a value that is not part of the model, calculated
+    from the representation and the class of the value.
+    """
+    return '{0.__class__.__name__}:{0!r}'.format(value).encode('UTF-8')
+
+
+def fingerprint(obj):
+    """
+    :returns: the fingerprint of an object in the model, or of a value.
+    """
+    if isinstance(obj, Structure):
+        return obj.fingerprint
+    else:
+        return value_fingerprint(obj)
+
+
+class Structure(object):
+
+    """
+    The common base of the model objects, which are identified by their
+    fingerprint.
+    """
+
+    __slots__ = ()
+
+    def identify(self, kind, *parts):
+        """
+        Sets the fingerprint of the object, as the digest of the kind and
+        the parts, which should be bytes.
+        """
+        digest = blake2b(kind, digest_size=16)
+        for part in parts:
+            digest.update(len(part).to_bytes(4, 'little'))
+            digest.update(part)
+        self._fingerprint = digest.digest()
+        self._hash = int.from_bytes(self._fingerprint[:8], 'little')
+
+    @property
+    def fingerprint(self):
+        """ The 128 bit fingerprint of the object """
+        return self._fingerprint
+
+    @classmethod
+    def _make(cls, iterable):
+        return cls(*iterable)
+
+    def __hash__(self):
+        return self._hash
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if isinstance(other, Structure):
+            return self._fingerprint == other._fingerprint
+        return NotImplemented
+
+    def __ne__(self, other):
+        equal = self.__eq__(other)
+        return equal if equal is NotImplemented else not equal
+
+    def __getstate__(self):
+        # The cached values are recalculated when unpickled
+        return None
+
+
+class Function(Structure, namedtuple('Function', [
         'bound_value_pairs', 'methods', 'name'])):
     """
     The top object of the bunch.
@@ -42,22 +119,69 @@ class Function(namedtuple('Function', [
     BoundValue = namedtuple('BoundValue', ['name', 'value'])
     BoundValue.__repr__ = lambda self: \
         'Function.BoundValue(name={0.name!r}, value={0.value!r})'.format(self)
+    BoundValue.__qualname__ = 'Function.BoundValue'
+
+    Signature = namedtuple('Signature', [
+        'parameters', 'free', 'bound', 'slots'
+    ])
+    Signature.__doc__ = """
+    The call signature of a function, the parameters are the free variables
+    in alphabetical order, which is the order of the positional arguments,
+    free is the set of them, bound is the bound value pairs, and slots maps
+    every name, parameters first, to its index.
+    """
+    Signature.__qualname__ = 'Function.Signature'
 
     def __new__(cls, bound_value_pairs, methods, name=None):
         # Assumes dictionary to simplify interface
         bound_values = dict(bound_value_pairs).items()
         items = tuple(sorted(bound_values, key=itemgetter(0)))
         s = super(Function, cls).__new__(cls, items, tuple(methods), name)
-        s._hash = hash(s)
+        s.identify(
+            b'Function', value_fingerprint(name),
+            *chain.from_iterable(
+                (value_fingerprint(name), value_fingerprint(value))
+                for name, value in items
+            ),
+            *(fingerprint(method) for method in s.methods)
+        )
         return s
 
     def hash(self):
         return self._hash
 
+    @property
+    def is_buildin(self):
+        """ True if every method of the function is a build in method """
+        return all(method.is_buildin for method in self.methods)
+
     @property
     def bound_values(self):
         return dict(self.bound_value_pairs)
 
+    @property
+    def signature(self):
+        """
+        The :class:`Function.Signature` of the function, computed once and
+        cached on the function.
+        """
+        try:
+            return self._signature
+        except AttributeError:
+            pass
+        variables = set().union(*(
+            method.variables() for method in self.methods
+        ))
+        parameters = tuple(sorted(
+            variables - set(name for name, value in self.bound_value_pairs)
+        ))
+        names = parameters + tuple(name for name, _ in self.bound_value_pairs)
+        self._signature = self.Signature(
+            parameters, frozenset(parameters), self.bound_value_pairs,
+            {name: index for index, name in enumerate(names)}
+        )
+        return self._signature
+
     def free_variables(self):
         """
         Free variables is the variables that needs to be bound to the function
@@ -70,10 +194,7 @@ class Function(namedtuple('Function', [
 
         :returns: The set of free variables of a function.
         """
-
-        free_vars = [method.variables() for method in self.methods]
-        return (set.union(*free_vars) -
-                set(name for name, value in self.bound_value_pairs))
+        return set(self.signature.free)
 
     def bind_variables(self, arguments, transform=lambda n, x: x):
         """
@@ -101,12 +222,52 @@ class Function(namedtuple('Function', [
             bound values of the function, and the presented arguments. All
             values presented in a format allowed by the transform
         """
-        free_variables = self.free_variables()
-        if free_variables != set(arguments):
-            raise BadBound(self, free_variables, arguments)
+        signature = self.signature
+        if arguments.keys() != signature.free:
+            raise BadBound(self, set(signature.free), arguments)
+        return {
+            name: transform(name, value) for name, value in
+            chain(arguments.items(), signature.bound)
+        }
+
+    def name_arguments(self, values, arguments):
+        """
+        Names the positional values, in the order of the parameters of the
+        :attr:`signature`, and adds them to the keyword arguments.
+
+        :raises BadBound: if there are too many values, or a value is also
+            given by keyword.
+        """
+        named = dict(zip(self.signature.parameters, values))
+        if len(named) != len(values) or named.keys() & arguments.keys():
+            raise BadBound(self, set(self.signature.free), values)
+        named.update(arguments)
+        return named
+
+    def order_arguments(self, arguments):
+        """
+        Orders the keyword arguments in the order of the parameters of the
+        :attr:`signature`, see :meth:`bind_positional`.
+
+        :raises BadBound: if the arguments are not the free variables.
+        """
+        signature = self.signature
+        if arguments.keys() != signature.free:
+            raise BadBound(self, set(signature.free), arguments)
+        return tuple(arguments[name] for name in signature.parameters)
+
+    def bind_positional(self, values, transform=lambda n, x: x):
+        """
+        Same as :meth:`bind_variables`, but the arguments are given in the
+        order of the parameters of the :attr:`signature`, like the values of
+        :meth:`Node.arguments`, so only their number is checked.
+        """
+        parameters = self.signature.parameters
+        if len(values) != len(parameters):
+            raise BadBound(self, set(parameters), values)
         return {
             name: transform(name, value) for name, value in
-            chain(arguments.items(), self.bound_value_pairs)
+            chain(zip(parameters, values), self.bound_value_pairs)
         }
 
     def __str__(self):
@@ -119,10 +280,10 @@ class Function(namedtuple('Function', [
         if self.name:
             return self.name
         else:
-            return 'f' + hex(id(self))
+            return 'f' + self.fingerprint.hex()
 
 
-class Method(namedtuple('Method', ['guard', 'statement'])):
+class Method(Structure, namedtuple('Method', ['guard', 'statement'])):
     """
     The method is the branching part of the model, each method contains of a
     guard and a statement, a method will not execute unless a guard evaluates
@@ -132,6 +293,11 @@ class Method(namedtuple('Method', ['guard', 'statement'])):
 
     is_buildin = False
 
+    def __new__(cls, guard, statement):
+        s = super(Method, cls).__new__(cls, guard, statement)
+        s.identify(b'Method', fingerprint(guard), fingerprint(statement))
+        return s
+
     def variables(self):
         """
         A method which finds the variables used by the method to execute,
@@ -150,7 +316,8 @@ class Method(namedtuple('Method', ['guard', 'statement'])):
         return "{0.guard!s} -> {0.statement!s}".format(self)
 
 
-class BuildInMethod(namedtuple('BuildInMethod', ['argmap', 'code'])):
+class BuildInMethod(Structure,
+                    namedtuple('BuildInMethod', ['argmap', 'code'])):
     """
     The build in methods is special methods that does not contain a subflow.
     These entities is therefor build in and unchangeable.
@@ -163,6 +330,14 @@ class BuildInMethod(namedtuple('BuildInMethod', ['argmap', 'code'])):
 
     is_buildin = True
 
+    def __new__(cls, argmap, code):
+        s = super(BuildInMethod, cls).__new__(cls, tuple(argmap), code)
+        s.identify(
+            b'BuildInMethod', value_fingerprint(s.argmap),
+            value_fingerprint(code)
+        )
+        return s
+
     def variables(self):
         """
         Same as in the Method, but in the build in method this is all
@@ -176,7 +351,7 @@ class BuildInMethod(namedtuple('BuildInMethod', ['argmap', 'code'])):
         return self.code
 
 
-class Node (namedtuple('Node', ['function', 'named_sources'])):
+class Node (Structure, namedtuple('Node', ['function', 'named_sources'])):
     """
     Node, if the function is load, then the sources are allowed to be a string
     """
@@ -184,6 +359,10 @@ class Node (namedtuple('Node', ['function', 'named_sources'])):
     Source = namedtuple('Source', ['name', 'node'])
     Source.__repr__ = lambda self: \
         'Node.Source(name={0.name!r}, node={0.node!r})'.format(self)
+    Source.__qualname__ = 'Node.Source'
+
+    Schedule = namedtuple('Schedule', ['variables', 'steps'])
+    Step = namedtuple('Step', ['node', 'sources'])
 
     def __new__(cls, function, named_sources):
         """
@@ -195,17 +374,22 @@ class Node (namedtuple('Node', ['function', 'named_sources'])):
         sorted_sources = tuple(
             sorted(named_sources, key=lambda source: source.name)
         )
-        return super(Node, cls).__new__(cls, function, sorted_sources)
+        s = super(Node, cls).__new__(cls, function, sorted_sources)
+        s.identify(
+            b'Node', fingerprint(function),
+            *chain.from_iterable(
+                (value_fingerprint(name), fingerprint(node))
+                for name, node in sorted_sources
+            )
+        )
+        return s
 
     def dependencies(self):
         """
         Returns the dependencies of executing the node, ei the names of the
         variables that should exist in initial values
         """
-        sources = chain.from_iterable(node.sources for node in self.precedes())
-        return {
-            source for source in sources if not isinstance(source, Node)
-        }
+        return set(self.schedule.variables)
 
     @property
     def names(self):
@@ -215,13 +399,62 @@ class Node (namedtuple('Node', ['function', 'named_sources'])):
     def sources(self):
         return (source.node for source in self.named_sources)
 
+    @property
+    def schedule(self):
+        """
+        The evaluation schedule of the node, computed once and cached on the
+        node. The schedule is a :class:`Node.Schedule` where the variables
+        occupy the first registers, and each step computes the next register
+        from the registers of its sources. Shared nodes are only scheduled
+        once, and the node itself is always the last step.
+        """
+        try:
+            return self._schedule
+        except AttributeError:
+            self._schedule = self._build_schedule()
+            return self._schedule
+
+    def _build_schedule(self):
+        """
+        Builds the schedule with an iterative depth first search, visiting
+        every node and edge once.
+        """
+        variables, visited = {}, {}
+        steps = []
+        stack = [(self, iter(self.sources))]
+        while stack:
+            node, sources = stack[-1]
+            for source in sources:
+                if isinstance(source, Node):
+                    if id(source) not in visited:
+                        stack.append((source, iter(source.sources)))
+                        break
+                elif source not in variables:
+                    variables[source] = len(variables)
+            else:
+                stack.pop()
+                visited[id(node)] = len(steps)
+                steps.append(node)
+
+        offset = len(variables)
+        return self.Schedule(
+            tuple(variables),
+            tuple(
+                self.Step(node, tuple(
+                    offset + visited[id(source)] if isinstance(source, Node)
+                    else variables[source]
+                    for source in node.sources
+                )) for node in steps
+            )
+        )
+
     def precedes(self):
         """
         Returns the set of nodes that precedes the node. A node precedes an
         other node if there is an direct path from the second node to the first
         navigating thru the sources of the node.
 
-        The nodes are returned in order.
+        The nodes are returned in order, the node itself first.
 
         :param self:
             The node from wich to evaluate the dominating set of
@@ -230,18 +463,7 @@ class Node (namedtuple('Node', ['function', 'named_sources'])):
         :returns:
             all the nodes that precedes the node
         """
-        node_numbers = {self: 0}
-
-        visitors = deque((self,))
-        while visitors:
-            next_vistor = visitors.pop()
-            if all(isinstance(s, Node) for s in next_vistor.sources):
-                for source in next_vistor.sources:
-                    node_numbers[source] = node_numbers[next_vistor] + 1
-                visitors.extendleft(next_vistor.sources)
-
-        return [node for node, index in
-                sorted(node_numbers.items(), key=itemgetter(1))]
+        return [step.node for step in reversed(self.schedule.steps)]
 
     def project(self, values):
         """
@@ -252,6 +474,41 @@ class Node (namedtuple('Node', ['function', 'named_sources'])):
         """
         return dict(zip(self.names, values))
 
+    @property
+    def positions(self):
+        """
+        The indices of the sources of the parameters of the function, in the
+        order of the parameters, found once using the slots of the signature
+        and cached on the node. Sources which are not parameters, like those
+        of a function which has been cleaned, are left out.
+
+        :raises BadBound: if a parameter of the function has no source.
+        """
+        try:
+            return self._positions
+        except AttributeError:
+            pass
+        signature = self.function.signature
+        positions = [None] * len(signature.parameters)
+        for index, name in enumerate(self.names):
+            slot = signature.slots.get(name)
+            if slot is not None and slot < len(positions):
+                positions[slot] = index
+        if None in positions:
+            raise BadBound(
+                self.function, set(signature.free), set(self.names)
+            )
+        self._positions = tuple(positions)
+        return self._positions
+
+    def arguments(self, values):
+        """
+        Orders the values of the sources, like the registers of a schedule,
+        as the positional arguments of the function, see
+        :meth:`Function.bind_positional`.
+        """
+        return tuple(values[index] for index in self.positions)
+
     def __str__(self):
         if self.function.code == 'load':
             return str(self.named_sources[0].node)
@@ -262,4 +519,141 @@ class Node (namedtuple('Node', ['function', 'named_sources'])):
     @property
     def code(self):
         """ returns the code of the node """
-        return 'n_' + hex(id(self))
+        return 'n_' + self.fingerprint.hex()
+
+
+class Handle(object):
+
+    """
+    The handle of a canonical object, the interner refers weakly to the
+    handle, while the object keeps it alive.
+    """
+
+    __slots__ = ('obj', '__weakref__')
+
+    def __init__(self, obj):
+        self.obj = obj
+
+
+class Interner(object):
+
+    """
+    A hash consing table of the model. Calling the interner with a
+    :class:`Function`, :class:`Method`, :class:`BuildInMethod` or
+    :class:`Node` returns the canonical instance of all the structurally
+    equal objects it has seen, so equal graphs share all of their objects.
+
+    The table is keyed on the identity of the canonical children of an
+    object, so looking up an object does not recurse through the graph. It
+    only refers weakly to the canonical objects. As the model objects are
+    tuples, which do not support weak references, each canonical object
+    carries a :class:`Handle` which the table refers to instead. The object
+    and its handle is freed by the cyclic garbage collector.
+    """
+
+    def __init__(self):
+        self.table = weakref.WeakValueDictionary()
+
+    def __len__(self):
+        return len(self.table)
+
+    def __call__(self, obj):
+        """
+        :returns: the canonical instance of the object
+        """
+        return self.intern(obj, {})
+
+    def intern(self, obj, seen):
+        """
+        Interns the object, where seen maps the identity of the already
+        interned objects to their canonical instances.
+        """
+        try:
+            return seen[id(obj)]
+        except KeyError:
+            pass
+
+        if isinstance(obj, Node):
+            result = self.intern_node(obj, seen)
+        elif isinstance(obj, Function):
+            result = self.intern_function(obj, seen)
+        elif isinstance(obj, Method):
+            result = self.intern_method(obj, seen)
+        elif isinstance(obj, BuildInMethod):
+            result = self.canonical(('BuildInMethod', ) + obj, lambda: obj)
+        else:
+            result = obj
+
+        seen[id(obj)] = result
+        return result
+
+    def canonical(self, key, create):
+        """
+        Returns the canonical object of the key, if there is none the object
+        returned by create becomes canonical.
+        """
+        handle = self.table.get(key)
+        if handle is not None:
+            return handle.obj
+        obj = create()
+        try:
+            handle = obj._handle
+        except AttributeError:
+            handle = obj._handle = Handle(obj)
+        self.table[key] = handle
+        return obj
+
+    def intern_function(self, function, seen):
+        methods = tuple(
+            self.intern(method, seen) for method in function.methods
+        )
+        key = (
+            'Function',
+            tuple((name, value.__class__, value)
+                  for name, value in function.bound_value_pairs),
+            tuple(id(method) for method in methods),
+            function.name
+        )
+        unchanged = all(a is b for a, b in zip(methods, function.methods))
+        try:
+            return self.canonical(key, lambda: function if unchanged else
+                                  Function(function.bound_value_pairs,
+                                           methods, function.name))
+        except TypeError:
+            # Unhashable bound values can not be interned
+            return function
+
+    def intern_method(self, method, seen):
+        guard = self.intern(method.guard, seen)
+        statement = self.intern(method.statement, seen)
+        return self.canonical(
+            ('Method', id(guard), id(statement)),
+            lambda: method if guard is method.guard and
+            statement is method.statement else Method(guard, statement)
+        )
+
+    def intern_node(self, node, seen):
+        variables, steps = node.schedule
+        registers = list(variables)
+        for step in steps:
+            current = step.node
+            if id(current) in seen:
+                registers.append(seen[id(current)])
+                continue
+            function = self.intern(current.function, seen)
+            sources = tuple(registers[index] for index in step.sources)
+            key = (
+                'Node', id(function), tuple(current.names),
+                tuple(id(source) if isinstance(source, Node) else source
+                      for source in sources)
+            )
+            result = self.canonical(key, lambda: current if (
+                function is current.function and
+                all(a is b for a, b in zip(sources, current.sources))
+            ) else Node(function, zip(current.names, sources)))
+            seen[id(current)] = result
+            registers.append(result)
+        return registers[-1]
+
+
+intern = Interner()
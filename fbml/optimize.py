@@ -0,0 +1,121 @@
+"""
+.. currentmodule:: fbml.optimize
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+Optimizations of functions, each optimization takes a
+:class:`fbml.model.Function` and returns an equivalent function.
+
+"""
+from collections import namedtuple
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml.model import Interner, Function, Method, Node, BadBound
+from fbml.analysis import Value
+from fbml import buildin, node
+
+
+def eliminate_common_subexpressions(function):
+    """
+    Rewrites the function so that structurally equal nodes are shared,
+    within and across the methods of the function and of the functions it
+    calls. The nodes are shared using a hash consing table local to the
+    function, so the shared :data:`fbml.model.intern` table is not
+    touched.
+
+    This is hash consing only. A node shared within a guard or a statement
+    is scheduled, and so evaluated, once, see :attr:`fbml.model.Node.schedule`.
+    The guards and statements are scheduled and evaluated separately, so
+    the nodes shared across them only save memory, and the work of a
+    function called with equal arguments is only shared by a memo, see
+    :meth:`fbml.visitor.Visitor.memoize`.
+
+    :returns: a function equal to the argument
+    """
+    return Interner()(function)
+
+
+Known = namedtuple('Known', ['value', 'name'])
+
+
+def partial_evaluate(function, **arguments):
+    """
+    Partially evaluates the function with a subset of its arguments known.
+    Every node where all the sources are known, either as arguments or as
+    bound values, is evaluated using the :class:`fbml.analysis.Value`
+    evaluator and replaced by a bound value. Methods where the guard is
+    known not to be True, or where the statement is known to fail, are
+    removed, and methods after a method which is known to succeed are
+    unreachable. A node known to fail is a bound value of None, which is
+    passed on to the nodes using it, as in the evaluator.
+
+    :param function: The function to evaluate.
+
+    :param arguments: The known arguments, a subset of the free variables.
+
+    :raises BadBound: if an argument is not a free variable of the function.
+
+    :returns: the residual function, where the known arguments are bound.
+    """
+    free_variables = function.free_variables()
+    if not free_variables >= set(arguments):
+        raise BadBound(function, free_variables, arguments)
+
+    bound = dict(function.bound_value_pairs)
+    bound.update(arguments)
+    constants = {}
+    evaluator = Value()
+
+    def residual(register):
+        """ The node or variable name that represents the register """
+        if isinstance(register, Known):
+            if register.name not in bound:
+                constants[register.name] = register.value
+            return node(register.name)
+        return register
+
+    def fold(root):
+        """ Folds the nodes, returns a Known or the residual node """
+        variables, steps = root.schedule
+        registers = [
+            Known(bound[name], name) if name in bound else name
+            for name in variables
+        ]
+        for step in steps:
+            current = step.node
+            sources = [registers[index] for index in step.sources]
+            if not all(isinstance(source, Known) for source in sources):
+                registers.append(Node(
+                    current.function,
+                    zip(current.names, (residual(s) for s in sources))
+                ))
+            elif current.function == buildin.load:
+                registers.append(sources[0])
+            else:
+                value = evaluator.visit_values(
+                    current.function,
+                    current.arguments([source.value for source in sources])
+                )
+                registers.append(Known(value, current.code))
+        return registers[-1]
+
+    methods = []
+    for method in function.methods:
+        if method.is_buildin:
+            methods.append(method)
+            continue
+        guard = fold(method.guard)
+        if isinstance(guard, Known) and not evaluator.allow(guard.value):
+            L.debug('partial_evaluate removes %s', method)
+            continue
+        statement = fold(method.statement)
+        if isinstance(statement, Known) and evaluator.failed(statement.value):
+            L.debug('partial_evaluate removes %s', method)
+            continue
+        methods.append(Method(residual(guard), residual(statement)))
+        if isinstance(guard, Known) and isinstance(statement, Known):
+            break
+
+    bound.update(constants)
+    return Function(bound, methods, function.name)
@@ -0,0 +1,250 @@
+"""
+.. currentmodule:: fbml.parallel
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+Evaluation of a function over large batches of arguments on a pool of
+processes. The function is pickled once into a shared memory block, keyed by
+its fingerprint, and each worker compiles it to a :class:`fbml.tape.Tape`
+the first time it is used. The arguments and the results are columns in
+shared memory, so a task is only the names of the blocks and the range of
+rows to evaluate.
+
+"""
+import array
+import multiprocessing
+import pickle
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml.analysis import TypeSet
+from fbml.tape import compile_function
+
+FORMATS = {
+    '?': TypeSet.BOOLEAN,
+    'q': TypeSet.INTEGER,
+    'd': TypeSet.REAL,
+}
+
+
+def buffer_format(values):
+    """
+    :returns: the format of a one dimensional buffer of booleans, 64 bit
+        integers or reals, or None if the values is not such a buffer.
+    """
+    try:
+        view = memoryview(values)
+    except TypeError:
+        return None
+    with view:
+        kind = view.format.lstrip('@=<')
+        if view.ndim != 1:
+            return None
+        if kind in ('?', 'd'):
+            return kind
+        if kind in ('l', 'q') and view.itemsize == 8:
+            return 'q'
+    return None
+
+
+def column_format(values):
+    """
+    :returns: the format of a column, '?' for booleans, 'q' for integers and
+        'd' for reals.
+    """
+    fmt = buffer_format(values)
+    if fmt is not None:
+        return fmt
+    types = {value.__class__ for value in values}
+    if types <= {bool}:
+        return '?'
+    if types <= {bool, int}:
+        return 'q'
+    if types <= {bool, int, float}:
+        return 'd'
+    raise TypeError('Can not store values of %s in a column' % types)
+
+
+def pack(values, fmt):
+    """ Returns a memoryview of the values of a column in the format """
+    if buffer_format(values) == fmt:
+        return memoryview(values).cast('B').cast(fmt)
+    if fmt == '?':
+        return memoryview(bytes(bool(value) for value in values)).cast('?')
+    return memoryview(array.array(fmt, values))
+
+
+def result_format(function, formats):
+    """
+    :returns: the format of the results of the function, found using
+        :class:`fbml.analysis.TypeSet`.
+    """
+    types = TypeSet().call(function, **{
+        name: FORMATS[fmt] for name, fmt in formats.items()
+    })
+    for fmt in ('?', 'q', 'd'):
+        if types <= FORMATS[fmt] or fmt == 'd' and \
+                types <= TypeSet.INTEGER | TypeSet.REAL:
+            return fmt
+    raise TypeError('Can not store results of %s in a column' % types)
+
+
+def create_block(size):
+    """ Creates a shared memory block of at least one byte """
+    return SharedMemory(create=True, size=max(size, 1))
+
+
+_TAPES = {}
+
+
+def load_tape(fingerprint, shipped):
+    """ Returns the tape of the shipped function, compiled once per worker """
+    tape = _TAPES.get(fingerprint)
+    if tape is None:
+        memory = SharedMemory(shipped)
+        try:
+            function = pickle.loads(memory.buf)
+        finally:
+            memory.close()
+        tape = _TAPES[fingerprint] = compile_function(function)
+    return tape
+
+
+def evaluate_chunk(task):
+    """ Evaluates the rows of a chunk, in a worker """
+    fingerprint, shipped, columns, output, failed, start, stop = task
+    tape = load_tape(fingerprint, shipped)
+    memories, views = [], []
+
+    def attach(name, fmt):
+        memory = SharedMemory(name)
+        memories.append(memory)
+        views.append(memory.buf.cast(fmt))
+        return views[-1]
+
+    try:
+        names = [name for name, _, _ in columns]
+        values = [attach(block, fmt)[start:stop]
+                  for _, block, fmt in columns]
+        views.extend(values)
+        results = attach(*output)
+        failures = attach(failed, '?')
+        for index, row in enumerate(zip(*values), start):
+            result = tape(**dict(zip(names, row)))
+            if result is None:
+                failures[index] = True
+            else:
+                results[index] = result
+    finally:
+        for view in reversed(views):
+            view.release()
+        for memory in memories:
+            memory.close()
+
+
+class BatchPool(object):
+
+    """
+    A pool of processes evaluating functions over columns of arguments.
+
+    :param processes: The number of processes, defaults to the number of
+        cores.
+
+    :param chunk_size: The number of rows in each task.
+    """
+
+    def __init__(self, processes=None, chunk_size=4096):
+        self.chunk_size = chunk_size
+        # The workers must share the resource tracker of this process, or
+        # they each unlink the shared memory they have seen when they exit.
+        resource_tracker.ensure_running()
+        self.pool = multiprocessing.Pool(processes)
+        self.shipped = {}
+
+    def ship(self, function):
+        """
+        Pickles the function into shared memory, once for each structurally
+        different function.
+
+        :returns: the name of the shared memory block
+        """
+        memory = self.shipped.get(function.fingerprint)
+        if memory is None:
+            data = pickle.dumps(function, pickle.HIGHEST_PROTOCOL)
+            memory = create_block(len(data))
+            memory.buf[:len(data)] = data
+            self.shipped[function.fingerprint] = memory
+            L.debug('Shipped %s in %s bytes', function, len(data))
+        return memory.name
+
+    def evaluate(self, function, **columns):
+        """
+        Evaluates the function on each row of the columns, the columns are
+        sequences or buffers of equal length, one for each free variable of
+        the function.
+
+        :returns: the list of results, None where no method matched.
+        """
+        lengths = {len(column) for column in columns.values()}
+        if len(lengths) > 1:
+            raise ValueError('The columns have different lengths %s' % lengths)
+        length = lengths.pop() if lengths else 0
+        formats = {
+            name: column_format(column) for name, column in columns.items()
+        }
+        fmt = result_format(function, formats)
+        shipped = self.ship(function)
+
+        blocks = []
+        try:
+            specs = []
+            for name, column in sorted(columns.items()):
+                memory = create_block(length * 8)
+                blocks.append(memory)
+                if length:
+                    with memory.buf.cast(formats[name]) as view, \
+                            pack(column, formats[name]) as values:
+                        view[:length] = values
+                specs.append((name, memory.name, formats[name]))
+            output = create_block(length * 8)
+            failed = create_block(length)
+            blocks.extend((output, failed))
+            failed.buf[:length] = bytes(length)
+
+            tasks = [
+                (function.fingerprint, shipped, specs,
+                 (output.name, fmt), failed.name,
+                 start, min(start + self.chunk_size, length))
+                for start in range(0, length, self.chunk_size)
+            ]
+            self.pool.map(evaluate_chunk, tasks)
+
+            with output.buf.cast(fmt) as results, \
+                    failed.buf.cast('?') as failures:
+                return [
+                    None if failure else result
+                    for result, failure in zip(
+                        results[:length].tolist(), failures[:length].tolist()
+                    )
+                ]
+        finally:
+            for memory in blocks:
+                memory.close()
+                memory.unlink()
+
+    def close(self):
+        """ Stops the workers and frees the shipped functions """
+        self.pool.terminate()
+        self.pool.join()
+        for memory in self.shipped.values():
+            memory.close()
+            memory.unlink()
+        self.shipped.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,376 @@
+"""
+.. currentmodule:: fbml.serialize
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+A compact binary format of the model. A stream starts with a header, and is
+followed by a sequence of records. Each record, except ``ROOT``, adds an
+object to a table, and the records refer to the objects before them by
+their index in the table, so shared strings, nodes, methods and functions
+are only written once, and are shared again when read.
+
+All integers are unsigned LEB128 varints. The records are:
+
+``STRING`` length, utf-8 bytes
+    a name or a string value.
+
+``BUILDIN`` code, count, argument names...
+    a :class:`fbml.model.BuildInMethod`, the build in methods of
+    :mod:`fbml.buildin` are read as the same objects.
+
+``NODE`` function, count, (name, source)...
+    a :class:`fbml.model.Node`, where a source is a node or the string of a
+    variable.
+
+``METHOD`` guard, statement
+    a :class:`fbml.model.Method`.
+
+``FUNCTION`` name + 1 or 0, count, (name, value)..., count, methods...
+    a :class:`fbml.model.Function`, where a value is a tag followed by the
+    value, see :data:`VALUE_TAGS`.
+
+``ROOT`` object
+    an object written with :meth:`Writer.write`, the reader yields it.
+
+``EXTERN`` name
+    a function which is not in the stream, resolved by its name when the
+    stream is read, see :mod:`fbml.library`.
+
+"""
+import io
+import struct
+from itertools import chain
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml.model import Function, Method, BuildInMethod, Node
+from fbml import buildin
+
+MAGIC = b'FBML'
+VERSION = 1
+
+STRING, BUILDIN, NODE, METHOD, FUNCTION, ROOT, EXTERN = range(7)
+
+V_NONE, V_FALSE, V_TRUE, V_INT, V_FLOAT, V_STRING = range(6)
+
+VALUE_TAGS = {
+    type(None): V_NONE,
+    bool: V_FALSE,
+    int: V_INT,
+    float: V_FLOAT,
+    str: V_STRING,
+}
+
+DOUBLE = struct.Struct('<d')
+
+CHUNK_SIZE = 2 ** 16
+
+BUILDINS = {
+    obj: obj
+    for function in vars(buildin).values() if isinstance(function, Function)
+    for obj in chain((function, ), function.methods)
+}
+
+
+def children(obj):
+    """ Returns the objects that must be written before the object """
+    if isinstance(obj, Node):
+        return chain((obj.function, ), *obj.named_sources)
+    elif isinstance(obj, Method):
+        return (obj.guard, obj.statement)
+    elif isinstance(obj, Function):
+        return chain(
+            () if obj.name is None else (obj.name, ),
+            chain.from_iterable(
+                (name, value) if isinstance(value, str) else (name, )
+                for name, value in obj.bound_value_pairs
+            ),
+            obj.methods
+        )
+    elif isinstance(obj, BuildInMethod):
+        return chain((obj.code, ), obj.argmap)
+    elif isinstance(obj, str):
+        return ()
+    raise TypeError('Can not serialize %r' % (obj, ))
+
+
+class Writer(object):
+
+    """
+    Writes objects of the model to a binary stream. Objects written by the
+    same writer share the table, so an object is only written once.
+
+    :param externs: A dictionary from functions to names, these functions
+        are written as ``EXTERN`` records, unless they are the written
+        object itself.
+    """
+
+    def __init__(self, stream, externs=None):
+        self.stream = stream
+        self.externs = externs or {}
+        self.root = None
+        self.buffer = bytearray(MAGIC)
+        self.buffer.append(VERSION)
+        self.strings = {}
+        self.objects = {}
+
+    def varint(self, value):
+        buffer = self.buffer
+        while value > 0x7f:
+            buffer.append(value & 0x7f | 0x80)
+            value >>= 7
+        buffer.append(value)
+
+    def index(self, obj):
+        """ Returns the index of an object which has been written """
+        if isinstance(obj, str):
+            return self.strings[obj]
+        return self.objects[obj]
+
+    def is_written(self, obj):
+        if isinstance(obj, str):
+            return obj in self.strings
+        return obj in self.objects
+
+    def extern(self, obj):
+        """ Returns the extern name of the object, or None """
+        if obj is self.root or isinstance(obj, str):
+            return None
+        return self.externs.get(obj)
+
+    def children(self, obj):
+        name = self.extern(obj)
+        return children(obj) if name is None else (name, )
+
+    def value(self, value):
+        """ Writes a tagged value """
+        try:
+            tag = VALUE_TAGS[value.__class__]
+        except KeyError:
+            raise TypeError('Can not serialize the value %r' % (value, ))
+        if tag == V_FALSE and value:
+            tag = V_TRUE
+        self.varint(tag)
+        if tag == V_INT:
+            self.varint(value << 1 if value >= 0 else (-value << 1) - 1)
+        elif tag == V_FLOAT:
+            self.buffer.extend(DOUBLE.pack(value))
+        elif tag == V_STRING:
+            self.varint(self.strings[value])
+
+    def record(self, obj):
+        """ Writes the record of an object, whose children are written """
+        varint, index = self.varint, self.index
+        if isinstance(obj, str):
+            data = obj.encode('UTF-8')
+            varint(STRING)
+            varint(len(data))
+            self.buffer.extend(data)
+            self.strings[obj] = len(self.strings) + len(self.objects)
+            return
+        name = self.extern(obj)
+        if name is not None:
+            varint(EXTERN)
+            varint(index(name))
+        elif isinstance(obj, Node):
+            varint(NODE)
+            varint(index(obj.function))
+            varint(len(obj.named_sources))
+            for name, source in obj.named_sources:
+                varint(index(name))
+                varint(index(source))
+        elif isinstance(obj, Method):
+            varint(METHOD)
+            varint(index(obj.guard))
+            varint(index(obj.statement))
+        elif isinstance(obj, Function):
+            varint(FUNCTION)
+            varint(0 if obj.name is None else index(obj.name) + 1)
+            varint(len(obj.bound_value_pairs))
+            for name, value in obj.bound_value_pairs:
+                varint(index(name))
+                self.value(value)
+            varint(len(obj.methods))
+            for method in obj.methods:
+                varint(index(method))
+        else:
+            varint(BUILDIN)
+            varint(index(obj.code))
+            varint(len(obj.argmap))
+            for name in obj.argmap:
+                varint(index(name))
+        self.objects[obj] = len(self.strings) + len(self.objects)
+
+    def write(self, obj):
+        """
+        Writes the object, and the objects it refers to which have not been
+        written, followed by a ``ROOT`` record.
+        """
+        self.root = obj
+        if not self.is_written(obj):
+            stack = [(obj, iter(self.children(obj)))]
+            while stack:
+                current, pending = stack[-1]
+                for child in pending:
+                    if not self.is_written(child):
+                        stack.append((child, iter(self.children(child))))
+                        break
+                else:
+                    stack.pop()
+                    if not self.is_written(current):
+                        self.record(current)
+        self.varint(ROOT)
+        self.varint(self.index(obj))
+        self.flush()
+
+    def flush(self):
+        self.stream.write(self.buffer)
+        self.buffer = bytearray()
+
+
+class Reader(object):
+
+    """
+    Reads objects of the model from a binary stream, the stream is read in
+    chunks as the records are needed.
+
+    :param resolve: A function returning the function of an ``EXTERN``
+        name.
+    """
+
+    def __init__(self, stream, resolve=None):
+        self.stream = stream
+        self.resolve = resolve
+        self.buffer = b''
+        self.position = 0
+        self.table = []
+        header = self.read(len(MAGIC) + 1)
+        if header[:-1] != MAGIC:
+            raise ValueError('Not a fbml stream')
+        if header[-1] != VERSION:
+            raise ValueError('Unsupported version %s' % header[-1])
+
+    def fill(self, size):
+        """
+        Reads from the stream until size bytes are buffered, returns False
+        if the stream ends before.
+        """
+        while len(self.buffer) - self.position < size:
+            chunk = self.stream.read(CHUNK_SIZE)
+            if not chunk:
+                return False
+            self.buffer = self.buffer[self.position:] + chunk
+            self.position = 0
+        return True
+
+    def read(self, size):
+        if not self.fill(size):
+            raise ValueError('Unexpected end of stream')
+        start = self.position
+        self.position += size
+        return self.buffer[start:self.position]
+
+    def varint(self):
+        result, shift = 0, 0
+        while True:
+            if self.position >= len(self.buffer) and not self.fill(1):
+                raise ValueError('Unexpected end of stream')
+            byte = self.buffer[self.position]
+            self.position += 1
+            result |= (byte & 0x7f) << shift
+            if byte < 0x80:
+                return result
+            shift += 7
+
+    def ref(self):
+        return self.table[self.varint()]
+
+    def value(self):
+        tag = self.varint()
+        if tag == V_NONE:
+            return None
+        elif tag == V_FALSE:
+            return False
+        elif tag == V_TRUE:
+            return True
+        elif tag == V_INT:
+            value = self.varint()
+            return value >> 1 if not value & 1 else -((value + 1) >> 1)
+        elif tag == V_FLOAT:
+            return DOUBLE.unpack(self.read(DOUBLE.size))[0]
+        elif tag == V_STRING:
+            return self.ref()
+        raise ValueError('Unknown value tag %s' % tag)
+
+    def record(self, tag):
+        """ Reads the record after the tag, and returns the object """
+        varint, ref = self.varint, self.ref
+        if tag == STRING:
+            return self.read(varint()).decode('UTF-8')
+        elif tag == NODE:
+            function = ref()
+            return Node(function, [(ref(), ref()) for _ in range(varint())])
+        elif tag == METHOD:
+            return Method(ref(), ref())
+        elif tag == EXTERN:
+            name = ref()
+            if self.resolve is None:
+                raise ValueError('Can not resolve the extern %s' % name)
+            return self.resolve(name)
+        elif tag == FUNCTION:
+            name = varint()
+            name = None if name == 0 else self.table[name - 1]
+            bound = [(ref(), self.value()) for _ in range(varint())]
+            methods = [ref() for _ in range(varint())]
+            function = Function(bound, methods, name)
+        elif tag == BUILDIN:
+            code = ref()
+            function = BuildInMethod([ref() for _ in range(varint())], code)
+        else:
+            raise ValueError('Unknown record tag %s' % tag)
+        return BUILDINS.get(function, function)
+
+    def __iter__(self):
+        """ Yields the objects of the ``ROOT`` records """
+        while self.position < len(self.buffer) or self.fill(1):
+            tag = self.varint()
+            if tag == ROOT:
+                yield self.ref()
+            else:
+                self.table.append(self.record(tag))
+
+
+def dump(obj, stream):
+    """ Writes the object to the binary stream """
+    Writer(stream).write(obj)
+
+
+def dump_all(objects, stream):
+    """ Writes the objects to the binary stream, sharing their parts """
+    writer = Writer(stream)
+    for obj in objects:
+        writer.write(obj)
+
+
+def dumps(obj):
+    """ Returns the bytes of the object """
+    stream = io.BytesIO()
+    dump(obj, stream)
+    return stream.getvalue()
+
+
+def iter_load(stream):
+    """ Yields the objects of the binary stream, as they are read """
+    return iter(Reader(stream))
+
+
+def load(stream, resolve=None):
+    """ Reads the first object of the binary stream """
+    for obj in Reader(stream, resolve):
+        return obj
+    raise ValueError('No object in the stream')
+
+
+def loads(data, resolve=None):
+    """ Reads the first object of the bytes """
+    return load(io.BytesIO(data), resolve)
@@ -0,0 +1,314 @@
+"""
+.. currentmodule:: fbml.session
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+Incremental analysis of a library of named functions. A :class:`Session`
+memoizes the results of a visitor, like ``Cleaner(TypeSet())``, and records
+which results depend on which ``(function, arguments)`` pairs while it
+analyses. When a function is replaced, the functions calling it are
+rewritten to call the new function, and only the results depending on the
+old function are removed, so analysing again only visits what has changed.
+
+As the model is immutable, a function calling a replaced function is a new
+function, which is visited again, but the results of the functions it calls
+which did not change are found in the memo.
+
+"""
+from collections import namedtuple, defaultdict
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml.model import Function, Method, Node
+from fbml.visitor import Hooks, Memo
+
+
+def direct_calls(function):
+    """ Returns the set of functions called by the nodes of the function """
+    calls = set()
+    for method in function.methods:
+        if method.is_buildin:
+            continue
+        for root in (method.guard, method.statement):
+            variables, steps = root.schedule
+            calls.update(step.node.function for step in steps)
+    return calls
+
+
+def substitute(function, replacements, within=None, seen=None):
+    """
+    Rewrites the function so that it calls the replacements instead of the
+    replaced functions.
+
+    :param replacements: A dictionary from the replaced functions to their
+        replacements.
+
+    :param within: The set of functions which may call a replaced function,
+        the other functions are not searched. As default every function is
+        searched.
+
+    :param seen: A dictionary of the already rewritten functions, shared
+        between calls to rewrite each function once.
+
+    :returns: the rewritten function, or the function if it is unchanged
+    """
+    if seen is None:
+        seen = {}
+
+    def rewrite(function):
+        if function in replacements:
+            return replacements[function]
+        if within is not None and function not in within:
+            return function
+        try:
+            return seen[function]
+        except KeyError:
+            pass
+        methods = [
+            method if method.is_buildin else Method(
+                rewrite_node(method.guard), rewrite_node(method.statement)
+            ) for method in function.methods
+        ]
+        if all(a.guard is b.guard and a.statement is b.statement
+               for a, b in zip(methods, function.methods)
+               if not a.is_buildin):
+            result = function
+        else:
+            result = Function(
+                function.bound_value_pairs, methods, function.name
+            )
+        seen[function] = result
+        return result
+
+    def rewrite_node(root):
+        variables, steps = root.schedule
+        registers = list(variables)
+        for step in steps:
+            current = step.node
+            callee = rewrite(current.function)
+            sources = tuple(registers[index] for index in step.sources)
+            if callee is current.function and \
+                    all(a is b for a, b in zip(sources, current.sources)):
+                registers.append(current)
+            else:
+                registers.append(Node(callee, zip(current.names, sources)))
+        return registers[-1]
+
+    return rewrite(function)
+
+
+class Dependencies(Hooks):
+
+    """
+    Hooks recording the dependencies between the results of a memoized
+    visitor. The results are identified by their key in the memo, and a
+    result depends on the results of the functions called while it was
+    visited.
+    """
+
+    def __init__(self):
+        self.stack = []
+        self.dependents = defaultdict(set)
+        self.keys = defaultdict(set)
+        self.functions = {}
+
+    def enter_function(self, visitor, function, arguments):
+        parent = self.stack[-1] if self.stack else None
+        key = visitor.memo_key(function, arguments)
+        if key is None:
+            # The result is not memoized, so the parent depends directly on
+            # the functions it calls
+            self.stack.append(parent)
+            return
+        if parent is not None:
+            self.dependents[key].add(parent)
+        if key not in self.functions:
+            self.functions[key] = function
+            self.keys[function].add(key)
+        self.stack.append(key)
+
+    def exit_function(self, visitor, function, result):
+        self.stack.pop()
+
+    def invalidate(self, function):
+        """
+        Forgets the results of the function, and the results depending on
+        them transitively.
+
+        :returns: the list of the keys of the forgotten results
+        """
+        removed = []
+        pending = list(self.keys.pop(function, ()))
+        while pending:
+            key = pending.pop()
+            owner = self.functions.pop(key, None)
+            if owner is None:
+                continue
+            keys = self.keys.get(owner)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.keys[owner]
+            removed.append(key)
+            pending.extend(self.dependents.pop(key, ()))
+        return removed
+
+
+class Session(object):
+
+    """
+    An incremental analysis of the functions of a library.
+
+    The session memoizes the results of the visitor in a :class:`Memo` of
+    its own, and instruments the visitor with its :class:`Dependencies`, so
+    the visitor should not be used or instrumented elsewhere.
+
+    :param visitor: The instanciated visitor, like ``Cleaner(TypeSet())``.
+
+    :param library: A mapping from names to functions, like a dictionary or
+        a :class:`fbml.library.Library`. The functions are loaded when they
+        are first used, and the library is never changed.
+
+    :param maxsize: The size of the memo.
+    """
+
+    Statistics = namedtuple('Statistics', [
+        'analyses', 'hits', 'misses', 'invalidated', 'replacements', 'size'
+    ])
+
+    def __init__(self, visitor, library=None, maxsize=2 ** 20):
+        self.visitor = visitor
+        self.library = {} if library is None else library
+        self.functions = {}
+        self.replaced = {}
+        self.callers = defaultdict(set)
+        self.indexed = set()
+        self.memo = visitor.memo = Memo(maxsize)
+        self.dependencies = Dependencies()
+        visitor.instrument(self.dependencies)
+        self.analyses = self.invalidated = self.replacements = 0
+
+    def __getitem__(self, name):
+        """
+        :returns: the function called name, with the replacements made in
+            the session.
+        """
+        try:
+            return self.functions[name]
+        except KeyError:
+            pass
+        function = self.library[name]
+        if self.replaced:
+            function = substitute(function, self.replaced)
+        self.functions[name] = function
+        self.index(function)
+        return function
+
+    def __contains__(self, name):
+        return name in self.functions or name in self.library
+
+    def index(self, function):
+        """ Adds the function, and the functions it calls, to the callers """
+        pending = [function]
+        while pending:
+            current = pending.pop()
+            if current in self.indexed:
+                continue
+            self.indexed.add(current)
+            for callee in direct_calls(current):
+                self.callers[callee].add(current)
+                pending.append(callee)
+
+    def unindex(self, function):
+        self.indexed.discard(function)
+        self.callers.pop(function, None)
+        for callee in direct_calls(function):
+            callers = self.callers.get(callee)
+            if callers is not None:
+                callers.discard(function)
+
+    def affected(self, function):
+        """ Returns the set of functions calling the function transitively """
+        result = set()
+        pending = list(self.callers.get(function, ()))
+        while pending:
+            current = pending.pop()
+            if current not in result:
+                result.add(current)
+                pending.extend(self.callers.get(current, ()))
+        return result
+
+    def analyze(self, name, *values, **arguments):
+        """
+        Analyses the function called name with the arguments, see
+        :meth:`fbml.visitor.Visitor.call`.
+        """
+        function = self[name]
+        self.analyses += 1
+        return self.visitor.call(function, *values, **arguments)
+
+    def replace(self, name, function):
+        """
+        Replaces the function called name. The functions of the session
+        calling it are rewritten to call the new function, and the results
+        depending on the old function are forgotten. A new name is added.
+
+        :returns: the new function, named name.
+        """
+        if function.name != name:
+            function = Function(
+                function.bound_value_pairs, function.methods, name
+            )
+        if name not in self:
+            self.functions[name] = function
+            self.index(function)
+            return function
+        old = self[name]
+        if old == function:
+            return old
+
+        within = self.affected(old)
+        replacements = {old: function}
+        seen = {}
+        for current in within:
+            replacements[current] = substitute(
+                current, {old: function}, within, seen
+            )
+        for key, value in self.functions.items():
+            self.functions[key] = replacements.get(value, value)
+        for key, value in self.replaced.items():
+            self.replaced[key] = replacements.get(value, value)
+        self.replaced.update(replacements)
+
+        for previous, current in replacements.items():
+            removed = self.dependencies.invalidate(previous)
+            for key in removed:
+                self.memo.table.pop(key, None)
+            self.invalidated += len(removed)
+            self.unindex(previous)
+        for current in replacements.values():
+            self.index(current)
+        self.replacements += 1
+        L.debug('Replaced %s, rewriting %s functions', name, len(within))
+        return function
+
+    def add_method(self, name, method, **bound_values):
+        """
+        Adds a method, after the other methods, to the function called name.
+
+        :param bound_values: The values the method binds.
+
+        :returns: the new function
+        """
+        function = self[name]
+        return self.replace(name, Function(
+            dict(function.bound_value_pairs, **bound_values),
+            list(function.methods) + [method], name
+        ))
+
+    @property
+    def statistics(self):
+        return self.Statistics(
+            self.analyses, self.memo.hits, self.memo.misses,
+            self.invalidated, self.replacements, len(self.memo.table)
+        )
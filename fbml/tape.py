@@ -0,0 +1,219 @@
+"""
+.. currentmodule:: fbml.tape
+.. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
+
+The tape is a flat, register based representation of a function, made for
+fast concrete evaluation. :func:`compile_function` lowers a
+:class:`fbml.model.Function` into a :class:`Tape`, inlining every function
+call. Each instruction is one of:
+
+``CALL``
+    calls a resolved build in method with the source registers, and stores
+    the result in the target register, or None if a source is None.
+
+``TEST``
+    jumps to the target if the source register is not True, this is how
+    guards and methods are chained.
+
+``CHECK``
+    jumps to the target if the source register is None, the statement of
+    the method has failed.
+
+``MOVE``
+    copies the source register to the target register.
+
+``JUMP``
+    jumps to the target.
+
+A method which fails jumps to the next method of its function, and a
+function without any matching method results in None. As in the
+:class:`fbml.analysis.Value` evaluator the None is passed on to the nodes
+using it, where another method of a called function may still match. If
+the top function fails the tape returns None.
+
+"""
+from collections import namedtuple
+
+import logging
+L = logging.getLogger(__name__)
+
+from fbml import model
+from fbml.analysis import Value
+
+CALL, TEST, CHECK, MOVE, JUMP = range(5)
+
+
+class Tape (namedtuple('Tape', [
+        'function', 'parameters', 'registers', 'code', 'result'])):
+
+    """
+    A compiled function. The tape is called with the free variables of the
+    function as keyword arguments.
+    """
+
+    def __call__(self, *values, **arguments):
+        """
+        Runs the tape, the arguments are given by name or positionally in
+        the order of the parameters.
+        """
+        if values and not arguments and \
+                len(values) == len(self.parameters):
+            registers = list(values)
+            registers.extend(self.registers[len(values):])
+        else:
+            named = dict(zip(self.parameters, values))
+            if len(named) != len(values) or named.keys() & arguments.keys():
+                raise model.BadBound(
+                    self.function, set(self.parameters), values
+                )
+            arguments.update(named)
+            if len(arguments) != len(self.parameters):
+                raise model.BadBound(
+                    self.function, set(self.parameters), arguments
+                )
+            registers = list(self.registers)
+            try:
+                for index, name in enumerate(self.parameters):
+                    registers[index] = arguments[name]
+            except KeyError:
+                raise model.BadBound(
+                    self.function, set(self.parameters), arguments
+                )
+
+        code, end, pc = self.code, len(self.code), 0
+        while pc < end:
+            opcode, target, method, sources = code[pc]
+            pc += 1
+            if opcode is CALL:
+                arguments = [registers[i] for i in sources]
+                registers[target] = None if None in arguments \
+                    else method(*arguments)
+            elif opcode is TEST:
+                if registers[sources[0]] is not True:
+                    pc = target
+            elif opcode is CHECK:
+                if registers[sources[0]] is None:
+                    pc = target
+            elif opcode is MOVE:
+                registers[target] = registers[sources[0]]
+            else:
+                pc = target
+        return registers[self.result]
+
+
+class TapeBuilder(object):
+
+    """
+    Builds a tape, the builder keeps track of the registers and the code
+    while the function is inlined.
+
+    :param methods: A mapping from the code of a build in method to a python
+        callable.
+    """
+
+    def __init__(self, methods=Value.METHOD_MAPPING):
+        self.methods = methods
+        self.registers = []
+        self.code = []
+
+    def register(self, value=None):
+        """ Allocates a new register with an initial value """
+        self.registers.append(value)
+        return len(self.registers) - 1
+
+    def emit(self, opcode, target=None, method=None, sources=()):
+        """ Emits an instruction, and returns it so it can be patched """
+        instruction = [opcode, target, method, sources]
+        self.code.append(instruction)
+        return instruction
+
+    def build(self, function):
+        """ Builds the tape of the function """
+        parameters = function.signature.parameters
+        arguments = {name: self.register() for name in parameters}
+        result = self.inline_function(function, arguments)
+        return Tape(
+            function, parameters, tuple(self.registers),
+            tuple(tuple(instruction) for instruction in self.code),
+            result
+        )
+
+    def inline_function(self, function, arguments):
+        """
+        Inlines the function, where the arguments are the registers of the
+        free variables.
+
+        :returns: the register of the result, which is None if no method
+            matches
+        """
+        if arguments.keys() != function.signature.free:
+            raise model.BadBound(
+                function, function.free_variables(), arguments
+            )
+
+        initial = dict(arguments)
+        initial.update(
+            (name, self.register(value))
+            for name, value in function.bound_value_pairs
+        )
+
+        first = function.methods[0] if function.methods else None
+        if first and first.is_buildin and first.code == 'load':
+            return initial[first.argmap[0]]
+
+        result = self.register()
+        done = []
+        for index, method in enumerate(function.methods, 1):
+            if method.is_buildin:
+                # A build in method never fails, so the rest is unreachable.
+                self.emit(
+                    CALL, result, self.methods[method.code],
+                    tuple(initial[argname] for argname in method.argmap)
+                )
+                done.append(self.emit(JUMP))
+                break
+
+            next_method = []
+            guard = self.inline_nodes(method.guard, initial)
+            next_method.append(self.emit(TEST, sources=(guard, )))
+            statement = self.inline_nodes(method.statement, initial)
+            if index < len(function.methods):
+                next_method.append(self.emit(CHECK, sources=(statement, )))
+            self.emit(MOVE, result, sources=(statement, ))
+            done.append(self.emit(JUMP))
+            for instruction in next_method:
+                instruction[1] = len(self.code)
+
+        for instruction in done:
+            instruction[1] = len(self.code)
+        return result
+
+    def inline_nodes(self, node, initial):
+        """
+        Inlines the nodes in the order of the schedule.
+
+        :returns: the register of the node
+        """
+        variables, steps = node.schedule
+        registers = [initial[name] for name in variables]
+        for step in steps:
+            registers.append(self.inline_function(
+                step.node.function,
+                step.node.project(registers[i] for i in step.sources)
+            ))
+        return registers[-1]
+
+
+def compile_function(function, methods=Value.METHOD_MAPPING):
+    """
+    Lowers a function to a :class:`Tape`.
+
+    :param function: The function to compile.
+
+    :param methods: A mapping from the code of build in methods to python
+        callables, defaults to the methods of :class:`fbml.analysis.Value`.
+
+    :raises BadBound: if a function in the graph is called with the wrong
+        arguments.
+    """
+    return TapeBuilder(methods).build(function)
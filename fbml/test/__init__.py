@@ -33,3 +33,39 @@ MUL_IF_LESS = Function(
     ],
     'mul_if_less'
 )
+
+# Calls fallback with the number if it is positive, and with the failure of
+# positive otherwise, where the second method of fallback still matches.
+POSITIVE = Function(
+    {'zero': 0},
+    [
+        Method(
+            node(buildin.gt, {'a': node('x'), 'b': node('zero')}),
+            node('x')
+        )
+    ],
+    'positive'
+)
+
+FALLBACK = Function(
+    {'k': 5, 't': True},
+    [
+        Method(
+            node(buildin.gt, {'a': node('x'), 'b': node('k')}),
+            node('x')
+        ),
+        Method(node('t'), node('k'))
+    ],
+    'fallback'
+)
+
+FAILING_ARGUMENT = Function(
+    {'t': True},
+    [
+        Method(
+            node('t'),
+            node(FALLBACK, {'x': node(POSITIVE, {'x': node('number')})})
+        )
+    ],
+    'failing_argument'
+)
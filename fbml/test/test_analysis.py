@@ -3,10 +3,13 @@
 .. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
 
 """
-from nose.tools import assert_equal
+import itertools
+
+from nose.tools import assert_equal, assert_raises
 
 from fbml.test import MUL_IF_LESS, INCR
-from fbml.analysis import TypeSet, FiniteSet
+from fbml.analysis import TypeSet, FiniteSet, Interval
+from fbml.model import BuildInMethod
 from fbml import buildin
 from fbml.visitor import Cleaner
 
@@ -32,6 +35,17 @@ def test_multiply_type_set():
     assert_equal(value, TypeSet.extremum)
 
 
+def test_list_type_set():
+    """
+    Tests that a tuple constant is a list of the type of its elements
+    """
+    assert_equal(TypeSet.const((1, 2)), TypeSet.INTEGER_LIST)
+    assert_equal(TypeSet.const((1.0, )), TypeSet.REAL_LIST)
+    for value in ((), (1, 2.0)):
+        with assert_raises(ValueError):
+            TypeSet.const(value)
+
+
 def test_incr_type_set_clean():
     """ This example tests the cleaning of INCR"""
     function = Cleaner(TypeSet()).call(INCR, number=10)
@@ -42,6 +56,23 @@ def test_incr_type_set_clean():
     assert_equal(function.free_variables(), {'number'})
 
 
+def test_nested_clean():
+    """ Tests that a cleaned callee refers to its own arguments """
+    from fbml.analysis import Value
+    from fbml.model import Function, Method
+    from fbml import node
+    function = Function({'test': True}, [Method(
+        node('test'),
+        node(MUL_IF_LESS, {'number': node(INCR, {'number': node('number')})})
+    )])
+    cleaned = Cleaner(TypeSet()).call(function, number=TypeSet.INTEGER)
+    callee = cleaned.methods[0].statement.function
+    assert_equal(callee.free_variables(), {'number'})
+    for number in (3, 9, 12):
+        assert_equal(Value.run(cleaned, number=number),
+                     Value.run(function, number=number))
+
+
 def test_multiply_finite_set_clean_gt():
     """
     This example tests cleaning of mul_if_lees if greater that or equal 10
@@ -62,3 +93,94 @@ def test_multiply_finite_set_clean_le():
 
     point_of_interest = function.methods[0].statement.function
     assert_equal(point_of_interest.methods, buildin.mul.methods)
+
+
+def test_multiply_interval():
+    """
+    this example test a simple mulitply, tested with Interval
+    """
+    value = Interval.run(MUL_IF_LESS, number=2)
+    assert_equal(value, Interval.const(20))
+
+    value = Interval.run(MUL_IF_LESS, number=Interval.range(0, 9))
+    assert_equal(value, Interval.range(0, 90))
+
+
+def test_multiply_interval_clean():
+    """
+    This example tests cleaning of mul_if_less over ranges of numbers
+    """
+    function = Cleaner(Interval()).call(
+        MUL_IF_LESS, number=Interval.range(-10 ** 6, 9))
+    assert_equal(len(function.methods), 1)
+    point_of_interest = function.methods[0].statement.function
+    assert_equal(point_of_interest.methods, buildin.mul.methods)
+
+    function = Cleaner(Interval()).call(
+        MUL_IF_LESS, number=Interval.range(10, 10 ** 6))
+    assert_equal(len(function.methods), 1)
+    point_of_interest = function.methods[0].statement.function
+    assert_equal(point_of_interest.methods, buildin.load.methods)
+
+
+def test_interval_sound():
+    """
+    Tests that the transfer functions contain every value of FiniteSet
+    """
+    values = (-2, -1, 0, 1, 3, 2.5, True, False)
+    ranges = [
+        (low, high) for low in values for high in values
+        if low <= high and low.__class__ == high.__class__
+    ]
+    unary = {'load', 'i_map', 'i_neg', 'r_neg', 'b_not',
+             'boolean', 'integer', 'real'}
+    finite, interval = FiniteSet(), Interval()
+    for code in FiniteSet.METHOD_MAPPING:
+        method = BuildInMethod(('a', ) if code in unary else ('a', 'b'), code)
+        for args in itertools.product(ranges, repeat=len(method.argmap)):
+            sets = [frozenset(v for v in values if low <= v <= high and
+                              v.__class__ == low.__class__)
+                    for low, high in args]
+            try:
+                expected = finite.apply(method, sets)
+            except TypeError:
+                continue
+            result = interval.apply(
+                method, [Interval.range(low, high) for low, high in args])
+            for value in expected:
+                assert result.low <= value <= result.high, (code, args)
+                assert value.__class__ in result.types, (code, args)
+
+
+def test_multiply_finite_set_limit():
+    """
+    Tests that a FiniteSet with a limit widens to TOP instead of
+    enumerating the product of the arguments
+    """
+    numbers = frozenset({1, 2, 3})
+    value = FiniteSet(limit=3).call(MUL_IF_LESS, number=numbers)
+    assert_equal(value, frozenset({10, 20, 30}))
+
+    value = FiniteSet(limit=3).call(MUL_IF_LESS, number=frozenset(range(4)))
+    assert value is FiniteSet.TOP
+
+    large = frozenset(range(10 ** 6))
+    value = FiniteSet(limit=100).apply(buildin.i_add, (large, large))
+    assert value is FiniteSet.TOP
+
+
+def test_finite_set_top():
+    """
+    Tests that TOP absorbs merges, and that a method with a guard of TOP
+    results in TOP
+    """
+    finite = FiniteSet(limit=2)
+    assert finite.merge(FiniteSet.TOP, frozenset({1})) is FiniteSet.TOP
+    assert finite.merge(frozenset({1, 2}), frozenset({3})) is FiniteSet.TOP
+    assert finite.allow(FiniteSet.TOP)
+    assert finite.exit_method(None, FiniteSet.TOP, frozenset({1})) is \
+        FiniteSet.TOP
+    assert_equal(
+        finite.apply(buildin.i_add, (FiniteSet.TOP, frozenset())),
+        FiniteSet.extremum
+    )
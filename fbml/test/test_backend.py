@@ -2,28 +2,179 @@
 Tests the backend module
 
 """
+from nose.tools import assert_equal, assert_raises
+
 from fbml import test
+from fbml import buildin
 from fbml.backend import llvm_
+from fbml.model import BadBound
 from fbml.analysis import TypeSet
 from fbml.visitor import Cleaner
 
-from unittest import skip
-
 
 def compile_function(function, args):
     """ Compiles a function using LLVM """
-    function = Cleaner(TypeSet()).visit_function(test.INCR, args).model
+    function = Cleaner(TypeSet()).call(function, **args)
     back = llvm_.LLVMBackend()
     llvm_function = back.compile(function, args, "test")
     return llvm_function
 
 
-@skip('Not jet implemented')
 def test_increment():
     """ Test INCR """
     result = compile_function(test.INCR, {'number': TypeSet.INTEGER})
-    assert False
-    #assert str(result) == '', str(result)
+    assert_equal(result.name, 'test_i')
+    incr = llvm_.LLVMBackend().callable(
+        test.INCR, {'number': TypeSet.INTEGER}
+    )
+    assert_equal(incr(number=1), 2)
+    assert_equal(incr(-3), -2)
+
+
+def test_specialize():
+    """ Test that the callees with more than one method are specialized """
+    from fbml.analysis import Value
+    from fbml.test.test_specialize import BOTH, PICK
+    types = {'number': TypeSet.INTEGER}
+    backend = llvm_.LLVMBackend()
+    both = backend.callable(BOTH, types)
+    for number in (3, 9, 12):
+        assert_equal(both(number), Value.run(BOTH, number=number))
+
+    pick = backend.callable(PICK, {'x': TypeSet.INTEGER, 'y': TypeSet.INTEGER})
+    assert_equal(pick(x=1, y=2), 1)
+
+
+def test_native_add():
+    """ Test that a compiled add can be called from python """
+    types = {'a': TypeSet.INTEGER, 'b': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(buildin.add, **types)
+    add = llvm_.LLVMBackend().callable(function, types)
+    assert_equal(add(a=1, b=2), 3)
+    assert_equal(add(a=-10, b=2), -8)
+    with assert_raises(BadBound):
+        add(a=1)
+
+
+def test_native_compare():
+    """ Test that booleans are returned from native code """
+    types = {'a': TypeSet.INTEGER, 'b': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(buildin.lt, **types)
+    lt = llvm_.LLVMBackend().callable(function, types)
+    assert_equal(lt(a=1, b=2), True)
+    assert_equal(lt(a=2, b=1), False)
+
+
+def test_native_real():
+    """ Test that functions on reals are compiled to float instructions """
+    from array import array
+    from fbml.model import Function, Method
+    from fbml import node
+    types = {'a': TypeSet.REAL, 'b': TypeSet.REAL}
+    backend = llvm_.LLVMBackend()
+    for function, expected in ((buildin.add, 3.5), (buildin.sub, -0.5),
+                               (buildin.mul, 3.0), (buildin.lt, True),
+                               (buildin.ge, False), (buildin.eq, False)):
+        function = Cleaner(TypeSet()).call(function, **types)
+        assert_equal(backend.callable(function, types)(a=1.5, b=2.0),
+                     expected)
+    neg = Cleaner(TypeSet()).call(buildin.neg, a=TypeSet.REAL)
+    assert_equal(backend.callable(neg, {'a': TypeSet.REAL})(a=1.5), -1.5)
+
+    function = Function({'test': True}, [Method(
+        node('test'),
+        node(buildin.mul, {
+            'a': node(buildin.map_, {'a': node('xs')}), 'b': node('y')
+        })
+    )], 'scale_each')
+    types = {'xs': TypeSet.REAL_LIST, 'y': TypeSet.REAL}
+    function = Cleaner(TypeSet()).call(function, **types)
+    scale_each = backend.array_callable(function, types)
+    xs = array('d', [1.0, 2.5])
+    assert_equal(scale_each(xs=xs, y=2.0).tolist(), [2.0, 5.0])
+
+
+def test_cached_add():
+    """ Test that a second backend loads the function from the cache """
+    import tempfile
+    from fbml.backend.cache import DiskCache
+
+    types = {'a': TypeSet.INTEGER, 'b': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(buildin.add, **types)
+    with tempfile.TemporaryDirectory() as directory:
+        cache = DiskCache(directory)
+        first = llvm_.LLVMBackend(cache).callable(function, types)
+        assert_equal(len(list(cache.entries())), 1)
+        second = llvm_.LLVMBackend(cache).callable(function, types)
+        assert_equal(second(a=1, b=2), first(a=1, b=2))
+        # Another name or options of the backend are compiled again
+        named = llvm_.LLVMBackend(cache).callable(function, types, 'plus')
+        assert_equal(named(a=1, b=2), 3)
+        vector = llvm_.LLVMBackend(cache, vectorize=True)
+        assert_equal(vector.callable(function, types)(a=1, b=2), 3)
+        assert_equal(len(list(cache.entries())), 3)
+
+
+def test_optimized_add():
+    """ Test that the optimizations are reported and keep the semantics """
+    types = {'a': TypeSet.INTEGER, 'b': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(buildin.add, **types)
+    for options in ({'opt_level': 2},
+                    {'passes': ['mem2reg', 'instcombine']},
+                    {'passes': ['inline', 'mem2reg', 'globaldce']},
+                    {'opt_level': 3, 'scope': 'module'}):
+        backend = llvm_.LLVMBackend(**options)
+        add = backend.callable(function, types, 'add')
+        assert_equal(add(a=1, b=2), 3)
+        report = backend.reports['add_ii']
+        assert report.instructions_after <= report.instructions_before
+        managers = backend.pass_managers(backend.module)
+        assert managers is backend.pass_managers(backend.module)
+    with assert_raises(ValueError):
+        llvm_.LLVMBackend(scope='program')
+
+
+def test_native_map():
+    """ Test that a map over a buffer is compiled to a native loop """
+    from array import array
+    from fbml.model import Function, Method
+    from fbml import node
+    function = Function({'test': True}, [Method(
+        node('test'),
+        node(buildin.add, {
+            'a': node(buildin.map_, {'a': node('xs')}), 'b': node('y')
+        })
+    )], 'add_each')
+    types = {'xs': TypeSet.INTEGER_LIST, 'y': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(function, **types)
+    add_each = llvm_.LLVMBackend().array_callable(function, types)
+    xs = array('i', [1, 2, 3])
+    assert_equal(add_each(xs=xs, y=10).tolist(), [11, 12, 13])
+    out = array('i', [0, 0, 0])
+    add_each.into(out, xs=xs, y=-1)
+    assert_equal(out.tolist(), [0, 1, 2])
+    with assert_raises(TypeError):
+        add_each(xs=array('d', [1.0]), y=1)
+
+
+def test_vectorize():
+    """ Test that a scalar function is callable on broadcasted arrays """
+    import numpy
+    from fbml.backend.ufunc import vectorize
+    types = {'a': TypeSet.INTEGER, 'b': TypeSet.INTEGER}
+    function = Cleaner(TypeSet()).call(buildin.lt, **types)
+    backend = llvm_.LLVMBackend(opt_level=3, vectorize=True)
+    lt = vectorize(backend, function, types)
+    result = lt(a=numpy.arange(6).reshape(2, 3), b=numpy.array([1, 4, 4]))
+    assert_equal(result.tolist(), [[True, True, True], [False, False, False]])
+    assert_equal(lt(a=1, b=2), True)
+    with assert_raises(TypeError):
+        lt(a=1.5, b=2)
+
+    types = {'a': TypeSet.REAL, 'b': TypeSet.REAL}
+    function = Cleaner(TypeSet()).call(buildin.add, **types)
+    add = vectorize(backend, function, types)
+    assert_equal(add(a=numpy.array([0.5, 1.5]), b=1.0).tolist(), [1.5, 2.5])
 
 #def est_abs():
 #    """
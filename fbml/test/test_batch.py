@@ -0,0 +1,40 @@
+"""
+.. currentmodule:: fbml.test.test_batch
+
+"""
+import numpy
+from numpy.testing import assert_array_equal
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.model import Function, Method
+from fbml.analysis import Value
+from fbml.batch import Batch
+from fbml import buildin, node
+
+
+def test_mul_if_less():
+    """ Tests that every lane has the same result as the Value evaluator """
+    numbers = numpy.arange(-5, 20)
+    value, failed = Batch.run(MUL_IF_LESS, number=numbers)
+    assert_array_equal(
+        value, [Value.run(MUL_IF_LESS, number=int(n)) for n in numbers]
+    )
+    assert not failed.any()
+
+
+def test_incr_scalar():
+    """ Tests that scalars are allowed as arguments """
+    value, failed = Batch.run(INCR, number=4)
+    assert_array_equal(value, 5)
+    assert_array_equal(failed, False)
+
+
+def test_no_method_matched():
+    """ Tests the mask of the lanes where no method matched """
+    function = Function({'zero': 0}, [
+        Method(node(buildin.gt, {'a': node('x'), 'b': node('zero')}),
+               node('x'))
+    ])
+    value, failed = Batch.run(function, x=numpy.array([-1, 0, 1, 2]))
+    assert_array_equal(failed, [True, True, False, False])
+    assert_array_equal(value[~failed], [1, 2])
@@ -0,0 +1,58 @@
+"""
+Tests the persistent cache of the backend
+
+"""
+import os
+import tempfile
+
+from nose.tools import assert_equal
+
+from unittest import TestCase
+
+from fbml.backend.cache import DiskCache, Entry
+
+
+class DiskCacheTester (TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_store_load(self):
+        """ Test that an entry can be loaded by an other cache """
+        key = DiskCache.key(b'fingerprint', 'a:i', '1')
+        DiskCache(self.directory.name).store(key, b'\x00bitcode', 'ir')
+        assert_equal(
+            DiskCache(self.directory.name).load(key),
+            Entry(b'\x00bitcode', 'ir')
+        )
+
+    def test_missing(self):
+        """ Test that a missing key is None """
+        cache = DiskCache(self.directory.name)
+        assert_equal(cache.load(cache.key('missing')), None)
+
+    def test_key(self):
+        """ Test that the key depends on all the parts """
+        assert DiskCache.key('a', 'bc') != DiskCache.key('ab', 'c')
+        assert_equal(DiskCache.key('a', 'b'), DiskCache.key('a', 'b'))
+
+    def test_atomic(self):
+        """ Test that no temporary files are left behind """
+        cache = DiskCache(self.directory.name)
+        cache.store(cache.key('a'), b'bitcode', 'ir')
+        assert_equal(
+            os.listdir(self.directory.name), [cache.key('a') + '.fbc']
+        )
+
+    def test_evict(self):
+        """ Test that the least recently used entries are evicted """
+        cache = DiskCache(self.directory.name, max_bytes=250)
+        for index, key in enumerate(('a', 'b', 'c')):
+            cache.store(cache.key(key), b'x' * 100, '')
+            os.utime(cache.path(cache.key(key)), (index, index))
+            cache.evict()
+        assert_equal(cache.load(cache.key('a')), None)
+        assert_equal(cache.load(cache.key('c')), Entry(b'x' * 100, ''))
@@ -0,0 +1,60 @@
+"""
+.. currentmodule:: fbml.test.test_library
+
+"""
+import os
+import tempfile
+
+from nose.tools import assert_equal, assert_raises
+from unittest import TestCase
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.model import Function, Method
+from fbml.library import Library, write_library
+from fbml import node
+
+
+TWICE = Function({'test': True}, [Method(
+    node('test'),
+    node(INCR, {'number': node(INCR, {'number': node('number')})})
+)], 'twice')
+
+
+class LibraryTester(TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'functions.fbl')
+        write_library(self.path, {
+            'incr': INCR, 'twice': TWICE, 'mul_if_less': MUL_IF_LESS
+        })
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_index(self):
+        """ Tests that the names are in the index """
+        with Library(self.path) as library:
+            assert_equal(set(library), {'incr', 'twice', 'mul_if_less'})
+            assert 'incr' in library
+            assert_equal(library.get('decr'), None)
+            assert_equal(library.cache, {})
+
+    def test_lazy(self):
+        """ Tests that functions and their dependencies are loaded once """
+        with Library(self.path) as library:
+            assert_equal(library['mul_if_less'], MUL_IF_LESS)
+            assert_equal(set(library.cache), {'mul_if_less'})
+            twice = library['twice']
+            assert_equal(twice, TWICE)
+            assert_equal(set(library.cache), {'mul_if_less', 'twice', 'incr'})
+            outer = twice.methods[0].statement
+            assert outer.function is library['incr']
+            assert library['twice'] is twice
+
+    def test_bad_file(self):
+        """ Tests that a file which is not a library raises ValueError """
+        with open(self.path, 'wb') as stream:
+            stream.write(b'\0' * 32)
+        with assert_raises(ValueError):
+            Library(self.path)
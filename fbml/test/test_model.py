@@ -2,6 +2,7 @@
 Tests of fbml.model
 """
 from fbml.model import Function, Method, Node, BuildInMethod, BadBound
+from fbml.model import Interner
 from fbml import node
 
 from fbml.test import MUL_IF_LESS
@@ -22,7 +23,7 @@ class FunctionTester(TestCase):
 
     def test_str(self):
         string = str(self.create_function())
-        assert_regexp_matches(string, 'f0x[0-9abcdef]{8}')
+        assert_regexp_matches(string, 'f[0-9abcdef]{32}')
 
     def test_repr(self):
         string = repr(Function({}, []))
@@ -80,6 +81,33 @@ class FunctionTester(TestCase):
         with assert_raises(BadBound):
             function.bind_variables({'y': 10})
 
+    def test_signature(self):
+        """ Test that the signature orders the parameters """
+        function = Function({'x': 4}, [
+            Method(node('x'), node('z')),
+            Method(node('y'), node('z'))
+        ])
+        signature = function.signature
+        assert_equal(signature.parameters, ('y', 'z'))
+        assert_equal(signature.free, {'y', 'z'})
+        assert_equal(signature.slots, {'y': 0, 'z': 1, 'x': 2})
+        assert signature is function.signature
+        assert_equal(Function({}, []).signature.parameters, ())
+
+    def test_bind_positional(self):
+        """ Test binding of values in the order of the parameters """
+        function = Function({'x': 4}, [
+            Method(node('x'), node('y')),
+            Method(node('y'), node('z'))
+        ])
+        assert_equal(function.bind_positional((10, 20)),
+                     function.bind_variables({'y': 10, 'z': 20}))
+        assert_equal(function.order_arguments({'z': 20, 'y': 10}), (10, 20))
+        with assert_raises(BadBound):
+            function.bind_positional((10, ))
+        with assert_raises(BadBound):
+            function.order_arguments({'y': 10})
+
 
 class MethodTester (TestCase):
 
@@ -149,6 +177,143 @@ class NodeTester (TestCase):
         n2 = Node(None, ((0, node('x')), (1, node('y'))))
         assert_equal(n2.dependencies(), {'x', 'y'})
 
+    def test_schedule(self):
+        """
+        Test that the schedule lists the variables first and the node last
+        """
+        from fbml import buildin
+        n = node(buildin.lt,  {'a': node('number'), 'b': node('const')})
+        variables, steps = n.schedule
+        assert_equal(variables, ('number', 'const'))
+        assert_equal(steps[-1], Node.Step(n, (2, 3)))
+        assert_equal(len(steps), 3)
+
+    def test_schedule_shared(self):
+        """
+        Test that a shared node is only scheduled once, and that the
+        schedule is cached
+        """
+        from fbml import buildin
+        shared = node('x')
+        for _ in range(100):
+            shared = node(buildin.add, {'a': shared, 'b': shared})
+        assert_equal(len(shared.schedule.steps), 101)
+        assert shared.schedule is shared.schedule
+
+    def test_precedes(self):
+        """
+        Test that precedes returns the node first and its sources after
+        """
+        from fbml import buildin
+        x = node('x')
+        n = node(buildin.neg, {'a': x})
+        assert_equal(n.precedes(), [n, x])
+
+    def test_arguments(self):
+        """
+        Test that the sources are ordered as the parameters of the function,
+        and that sources which are not parameters are left out
+        """
+        function = Function({'x': 4}, [Method(node('x'), node('y'))])
+        n = node(function, {'y': node('b'), 'extra': node('a')})
+        assert_equal(n.positions, (1, ))
+        assert n.positions is n.positions
+        assert_equal(n.arguments(('a', 'b')), ('b', ))
+        with assert_raises(BadBound):
+            node(function, {'x': node('a')}).positions
+
+
+class FingerprintTester (TestCase):
+
+    def test_stable(self):
+        """ Test that the fingerprint is the same in an other process """
+        import subprocess
+        import sys
+        output = subprocess.check_output(
+            [sys.executable, '-c',
+             'from fbml.test import MUL_IF_LESS;'
+             'print(MUL_IF_LESS.fingerprint.hex())'],
+            env={'PYTHONHASHSEED': '1'}
+        )
+        assert_equal(output.decode().strip(), MUL_IF_LESS.fingerprint.hex())
+
+    def test_bound_value_types(self):
+        """ Test that bound values of different types are not equal """
+        first = Function({'x': 1}, [Method(node('x'), node('y'))])
+        second = Function({'x': 1.0}, [Method(node('x'), node('y'))])
+        assert first.fingerprint != second.fingerprint
+        assert first != second
+
+    def test_code(self):
+        """ Test that nodes with the same structure have the same code """
+        assert_equal(node('x').code, node('x').code)
+        assert node('x').code != node('y').code
+
+    def test_pickle(self):
+        """ Test that pickled objects have the same fingerprint """
+        import pickle
+        function = pickle.loads(pickle.dumps(MUL_IF_LESS))
+        assert_equal(function.fingerprint, MUL_IF_LESS.fingerprint)
+        assert_equal(function, MUL_IF_LESS)
+
+    def test_deep(self):
+        """ Test that deep graphs can be build and hashed """
+        from fbml import buildin
+        top = node('x')
+        for _ in range(10000):
+            top = node(buildin.neg, {'a': top})
+        assert_equal(hash(top), hash(top))
+        assert top != node('x')
+
+
+class InternerTester (TestCase):
+
+    def create_function(self):
+        from fbml import buildin
+        return Function({'const': 10}, [
+            Method(
+                node(buildin.lt,  {'a': node('number'), 'b': node('const')}),
+                node(buildin.mul, {'a': node('number'), 'b': node('const')})
+            )
+        ], 'mul_if_less')
+
+    def test_canonical(self):
+        """ Test that structurally equal functions are interned as one """
+        interner = Interner()
+        first = interner(self.create_function())
+        second = interner(self.create_function())
+        assert first is second
+        assert_equal(first, self.create_function())
+
+    def test_shared_nodes(self):
+        """ Test that equal nodes inside a function share the object """
+        function = Interner()(self.create_function())
+        method, = function.methods
+        assert method.guard.named_sources[0].node is \
+            method.statement.named_sources[0].node
+
+    def test_bound_value_types(self):
+        """ Test that bound values of different types are kept apart """
+        interner = Interner()
+        first = interner(Function({'x': 1}, [Method(node('x'), node('y'))]))
+        second = interner(
+            Function({'x': True}, [Method(node('x'), node('y'))]))
+        assert first is not second
+        assert_equal(second.bound_values, {'x': True})
+
+    def test_weak(self):
+        """ Test that the table does not keep the objects alive """
+        import gc
+        from fbml import buildin
+        interner = Interner()
+        for function in (buildin.lt, buildin.mul, buildin.load):
+            interner(function)
+        size = len(interner)
+        interner(self.create_function())
+        assert len(interner) > size
+        gc.collect()
+        assert_equal(len(interner), size)
+
 
 class UtilsTester (TestCase):
 
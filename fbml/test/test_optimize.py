@@ -2,6 +2,108 @@
 Optimizations tests
 
 """
+from nose.tools import assert_equal, assert_raises
+
+from fbml.test import MUL_IF_LESS, INCR, FAILING_ARGUMENT, POSITIVE
+from fbml.model import Function, Method, BadBound
+from fbml.analysis import FiniteSet, Value
+from fbml.optimize import eliminate_common_subexpressions, partial_evaluate
+from fbml import buildin, node
+
+
+def test_eliminate_common_subexpressions():
+    """ Test that equal nodes in a statement are only scheduled once """
+    def add():
+        return node(buildin.add, {'a': node('x'), 'b': node('y')})
+    function = Function({'test': True}, [
+        Method(node('test'), node(buildin.mul, {'a': add(), 'b': add()}))
+    ])
+    optimized = eliminate_common_subexpressions(function)
+    assert_equal(optimized, function)
+    assert_equal(len(function.methods[0].statement.schedule.steps), 7)
+    assert_equal(len(optimized.methods[0].statement.schedule.steps), 4)
+    assert_equal(
+        FiniteSet.run(optimized, x=1, y=2), FiniteSet.run(function, x=1, y=2)
+    )
+
+
+def test_eliminate_common_subexpressions_evaluations():
+    """ Test that a shared node in a statement is only evaluated once """
+    from fbml.visitor import Profiler
+
+    def add():
+        return node(buildin.add, {'a': node('x'), 'b': node('y')})
+    function = Function({'test': True}, [
+        Method(node('test'), node(buildin.mul, {'a': add(), 'b': add()}))
+    ])
+    optimized = eliminate_common_subexpressions(function)
+    calls = []
+    for f in (function, optimized):
+        profiler = Profiler()
+        assert_equal(Value().instrument(profiler).call(f, x=1, y=2), 9)
+        calls.append(profiler.buildin_calls['i_add'])
+    assert_equal(calls, [2, 1])
+
+
+def test_eliminate_common_subexpressions_across_methods():
+    """ Test that the nodes of MUL_IF_LESS is shared across the methods """
+    optimized = eliminate_common_subexpressions(MUL_IF_LESS)
+    first, second = optimized.methods
+    assert first.guard.named_sources[0].node is second.statement
+    assert first.statement.named_sources[1].node is \
+        second.guard.named_sources[1].node
+
+
+def test_partial_evaluate_mul_if_less():
+    """ Test that a fully known MUL_IF_LESS folds to a constant """
+    function = partial_evaluate(MUL_IF_LESS, number=2)
+    assert_equal(len(function.methods), 1)
+    assert_equal(function.free_variables(), set())
+    assert_equal(Value.run(function), 20)
+
+    function = partial_evaluate(MUL_IF_LESS, number=12)
+    assert_equal(len(function.methods), 1)
+    assert_equal(Value.run(function), 12)
+
+
+def test_partial_evaluate_incr():
+    """ Test that the unknown number is left as a free variable """
+    function = partial_evaluate(INCR)
+    assert_equal(function.free_variables(), {'number'})
+    assert_equal(Value.run(function, number=3), 4)
+
+
+def test_partial_evaluate_bound_values():
+    """ Test that nodes only depending on bound values are folded """
+    function = Function({'a': 2, 'b': 3, 'test': True}, [
+        Method(node('test'), node(buildin.mul, {
+            'a': node(buildin.add, {'a': node('a'), 'b': node('b')}),
+            'b': node('x')
+        }))
+    ])
+    residual = partial_evaluate(function)
+    assert_equal(len(function.methods[0].statement.schedule.steps), 5)
+    assert_equal(len(residual.methods[0].statement.schedule.steps), 3)
+    assert_equal(Value.run(residual, x=4), Value.run(function, x=4))
+
+
+def test_partial_evaluate_failing_node():
+    """
+    Test that a node known to fail is passed on, as another method of the
+    function using it may still match
+    """
+    for number in (-1, 7):
+        function = partial_evaluate(FAILING_ARGUMENT, number=number)
+        assert_equal(Value.run(function),
+                     Value.run(FAILING_ARGUMENT, number=number))
+    assert_equal(Value.run(partial_evaluate(POSITIVE, x=-1)), None)
+
+
+def test_partial_evaluate_bad_bound():
+    """ Test that only free variables can be known """
+    with assert_raises(BadBound):
+        partial_evaluate(MUL_IF_LESS, const=2)
+
 
 # from nose.tools import assert_equal
 #
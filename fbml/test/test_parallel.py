@@ -0,0 +1,51 @@
+"""
+.. currentmodule:: fbml.test.test_parallel
+
+"""
+from nose.tools import assert_equal, assert_raises
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.model import Function, Method
+from fbml.analysis import Value
+from fbml.parallel import BatchPool, column_format
+from fbml import buildin, node
+
+
+def test_evaluate():
+    """ Tests that the pool gives the same results as Value """
+    numbers = list(range(-20, 30))
+    with BatchPool(2, chunk_size=7) as pool:
+        assert_equal(
+            pool.evaluate(MUL_IF_LESS, number=numbers),
+            [Value.run(MUL_IF_LESS, number=n) for n in numbers]
+        )
+        assert_equal(pool.evaluate(INCR, number=[1, 2]), [2, 3])
+        assert_equal(pool.evaluate(buildin.add, a=[1.5], b=[1.0]), [2.5])
+        assert_equal(pool.evaluate(INCR, number=[]), [])
+        assert_equal(len(pool.shipped), 3)
+
+
+def test_failed():
+    """ Tests that the rows where no method matched are None """
+    function = Function({}, [Method(node('test'), node('number'))])
+    with BatchPool(1) as pool:
+        assert_equal(
+            pool.evaluate(function, test=[True, False], number=[1, 2]),
+            [1, None]
+        )
+
+
+def test_buffers():
+    """ Tests that buffers are used as columns """
+    from array import array
+    assert_equal(column_format(array('d', [1.0])), 'd')
+    assert_equal(column_format(array('q', [1])), 'q')
+    assert_equal(column_format([True, 1]), 'q')
+    with assert_raises(TypeError):
+        column_format(['a'])
+    with BatchPool(1) as pool:
+        assert_equal(
+            pool.evaluate(MUL_IF_LESS, number=array('q', [1, 11])), [10, 11]
+        )
+        with assert_raises(ValueError):
+            pool.evaluate(INCR, number=[1], other=[1, 2])
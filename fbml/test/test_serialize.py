@@ -0,0 +1,69 @@
+"""
+.. currentmodule:: fbml.test.test_serialize
+
+"""
+import io
+
+from nose.tools import assert_equal, assert_raises
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.model import Function, Method
+from fbml import serialize, buildin, node
+
+
+def test_round_trip():
+    """ Tests that a function is read as an equal function """
+    function = serialize.loads(serialize.dumps(MUL_IF_LESS))
+    assert_equal(function, MUL_IF_LESS)
+    assert_equal(function.name, 'mul_if_less')
+    assert_equal(function.bound_values, {'const': 10})
+
+
+def test_sharing():
+    """ Tests that shared nodes are written once and read as one object """
+    function = serialize.loads(serialize.dumps(MUL_IF_LESS))
+    guard, statement = function.methods[0]
+    assert guard.named_sources[0].node is statement.named_sources[0].node
+    assert guard.function is buildin.lt
+
+
+def test_values():
+    """ Tests the bound values of each type """
+    values = {
+        'none': None, 'false': False, 'true': True, 'small': -1,
+        'big': 2 ** 70, 'real': -0.5, 'string': 'number'
+    }
+    function = Function(values, [Method(node('true'), node('big'))])
+    read = serialize.loads(serialize.dumps(function))
+    assert_equal(read.bound_values, values)
+    assert_equal(read, function)
+    with assert_raises(TypeError):
+        serialize.dumps(Function({'x': [1]}, []))
+
+
+def test_stream():
+    """ Tests that the objects of a stream share the table """
+    stream = io.BytesIO()
+    serialize.dump_all([MUL_IF_LESS, INCR, MUL_IF_LESS], stream)
+    single = len(serialize.dumps(MUL_IF_LESS))
+    assert len(stream.getvalue()) < 2 * single + len(serialize.dumps(INCR))
+    stream.seek(0)
+    first, second, third = serialize.iter_load(stream)
+    assert_equal((first, second), (MUL_IF_LESS, INCR))
+    assert first is third
+
+
+def test_deep():
+    """ Tests that deep graphs are written and read """
+    top = node('x')
+    for _ in range(10000):
+        top = node(buildin.neg, {'a': top})
+    assert_equal(serialize.loads(serialize.dumps(top)), top)
+
+
+def test_bad_stream():
+    """ Tests that streams which are not fbml raises ValueError """
+    with assert_raises(ValueError):
+        serialize.loads(b'JSON{}')
+    with assert_raises(ValueError):
+        serialize.loads(serialize.dumps(INCR)[:-3])
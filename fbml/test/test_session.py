@@ -0,0 +1,109 @@
+"""
+.. currentmodule:: fbml.test.test_session
+
+"""
+import os
+import tempfile
+
+from nose.tools import assert_equal
+from unittest import TestCase
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.model import Function, Method
+from fbml.analysis import TypeSet, FiniteSet, Value
+from fbml.library import Library, write_library
+from fbml.session import Session, substitute
+from fbml.visitor import Cleaner
+from fbml import buildin, node
+
+
+TWICE = Function({'test': True}, [Method(
+    node('test'),
+    node(INCR, {'number': node(INCR, {'number': node('number')})})
+)], 'twice')
+
+BOTH = Function({'test': True}, [Method(
+    node('test'),
+    node(buildin.add, {
+        'a': node(TWICE, {'number': node('number')}),
+        'b': node(MUL_IF_LESS, {'number': node('number')})
+    })
+)], 'both')
+
+DECR = Function({'test': True, 'value': 1}, [Method(
+    node('test'),
+    node(buildin.sub, {'a': node('number'), 'b': node('value')})
+)], 'incr')
+
+LIBRARY = {
+    'incr': INCR, 'twice': TWICE, 'mul_if_less': MUL_IF_LESS, 'both': BOTH
+}
+
+
+class SessionTester(TestCase):
+
+    def test_analyze(self):
+        """ Test that the results are the results of the visitor """
+        session = Session(FiniteSet(), LIBRARY)
+        numbers = frozenset({1, 20})
+        assert_equal(session.analyze('both', number=numbers),
+                     FiniteSet().call(BOTH, number=numbers))
+        misses = session.statistics.misses
+        session.analyze('both', number=numbers)
+        statistics = session.statistics
+        assert_equal(statistics.misses, misses)
+        assert_equal(statistics.analyses, 2)
+
+    def test_replace(self):
+        """ Test that the callers see the replaced function """
+        session = Session(Value(), LIBRARY)
+        assert_equal(session.analyze('both', 3), 35)
+        session.replace('incr', DECR)
+        assert_equal(session['twice'],
+                     substitute(TWICE, {INCR: DECR}))
+        assert_equal(session.analyze('both', 3), 31)
+        assert_equal(session.analyze('twice', 3), 1)
+        assert_equal(session.statistics.replacements, 1)
+
+    def test_invalidate(self):
+        """ Test that only the results depending on the function are lost """
+        session = Session(Value(), LIBRARY)
+        session.analyze('both', 3)
+        size = session.statistics.size
+        session.replace('incr', DECR)
+        statistics = session.statistics
+        # incr of 3 and 4, twice and both are forgotten
+        assert_equal(statistics.invalidated, 4)
+        assert_equal(statistics.size, size - 4)
+        key = session.visitor.memo_key(MUL_IF_LESS, {'number': 3})
+        assert key in session.memo.table
+        hits = statistics.hits
+        session.analyze('both', 3)
+        assert session.statistics.hits > hits
+
+    def test_add_method(self):
+        """ Test adding a method with bound values """
+        session = Session(Cleaner(TypeSet()), LIBRARY)
+        session.analyze('incr', number=TypeSet.REAL)
+        session.add_method('incr', Method(
+            node('other'),
+            node(buildin.add, {'a': node('number'), 'b': node('half')})
+        ), other=True, half=0.5)
+        function = session.analyze('twice', number=TypeSet.INTEGER)
+        assert_equal(len(function.methods), 1)
+        assert_equal(
+            session.analyze('incr', number=TypeSet.INTEGER).bound_values,
+            {'test': True, 'value': 1, 'other': True, 'half': 0.5}
+        )
+        assert_equal(session.statistics.invalidated, 1)
+
+    def test_library(self):
+        """ Test that functions loaded after a replacement see it """
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'functions.fbl')
+            write_library(path, LIBRARY)
+            with Library(path) as library:
+                session = Session(Value(), library)
+                session.replace('incr', DECR)
+                assert_equal(session.analyze('twice', 3), 1)
+                assert_equal(library['twice'], TWICE)
@@ -0,0 +1,67 @@
+"""
+.. currentmodule:: fbml.test.test_specialize
+
+"""
+from nose.tools import assert_equal, assert_raises
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.analysis import TypeSet
+from fbml.model import Function, Method, BadBound
+from fbml.backend.specialize import depends, specialize
+from fbml import buildin, node
+
+
+BOTH = Function({'test': True}, [Method(
+    node('test'),
+    node(buildin.add, {
+        'a': node(MUL_IF_LESS, {'number': node('number')}),
+        'b': node(MUL_IF_LESS, {
+            'number': node(INCR, {'number': node('number')})
+        })
+    })
+)], 'both')
+
+PICK = Function({}, [
+    Method(node(buildin.integer, {'a': node('x')}), node('x')),
+    Method(node(buildin.real, {'a': node('y')}), node('y')),
+], 'pick')
+
+
+def test_depends():
+    """ Tests that only the calls to functions with more methods are found """
+    calls = depends(BOTH, {'number': TypeSet.INTEGER})
+    callees = {callee.name for callee, _ in calls}
+    assert_equal(callees, {'add', 'mul_if_less'})
+
+
+def test_deduplicated():
+    """ Tests that a callee is specialized once for the same types """
+    program = specialize(BOTH, {'number': TypeSet.INTEGER})
+    assert_equal([key[0].name for key in program], ['both', 'mul_if_less'])
+    for specialization in program.values():
+        assert_equal(specialization.result, TypeSet.INTEGER)
+
+
+def test_pruned_parameter():
+    """ Tests a function where cleaning removes a parameter """
+    types = {'x': TypeSet.INTEGER, 'y': TypeSet.INTEGER}
+    program = specialize(PICK, types)
+    specialization, = program.values()
+    assert_equal(specialization.model.free_variables(), {'x'})
+
+    caller = Function({}, [Method(
+        node(buildin.integer, {'a': node('a')}),
+        node(buildin.add, {
+            'a': node(PICK, {'x': node('a'), 'y': node('a')}),
+            'b': node('a')
+        })
+    )], 'caller')
+    # The cleaned pick has one method, and is inlined
+    program = specialize(caller, {'a': TypeSet.INTEGER})
+    assert_equal([key[0].name for key in program], ['caller'])
+
+
+def test_bad_bound():
+    """ Tests that the types must be given for the free variables """
+    with assert_raises(BadBound):
+        specialize(INCR, {})
@@ -0,0 +1,86 @@
+"""
+.. currentmodule:: fbml.test.test_tape
+
+"""
+from nose.tools import assert_equal, assert_raises
+
+from fbml.test import MUL_IF_LESS, INCR, FAILING_ARGUMENT
+from fbml.model import Function, Method, BadBound
+from fbml.analysis import Value
+from fbml.tape import compile_function
+from fbml import buildin, node
+
+
+def test_incr():
+    """ Tests that the tape of INCR increments """
+    tape = compile_function(INCR)
+    assert_equal(tape(number=10), 11)
+    assert_equal(tape(number=10), Value.run(INCR, number=10))
+
+
+def test_mul_if_less():
+    """ Tests both methods of MUL_IF_LESS against the Value evaluator """
+    tape = compile_function(MUL_IF_LESS)
+    for number in (-3, 2, 9, 10, 11):
+        assert_equal(
+            tape(number=number),
+            Value.run(MUL_IF_LESS, number=number)
+        )
+
+
+def test_no_method():
+    """ Tests that a function where no method matches returns None """
+    function = Function({'test': False}, [
+        Method(node('test'), node('number'))
+    ])
+    assert_equal(compile_function(function)(number=1), None)
+    assert_equal(Value.run(function, number=1), None)
+
+
+def test_failing_call():
+    """
+    Tests that a failing call results in None, so the next method is tried
+    instead.
+    """
+    positive = Function({'zero': 0}, [
+        Method(node(buildin.gt, {'a': node('x'), 'b': node('zero')}),
+               node('x'))
+    ])
+    function = Function({'test': True}, [
+        Method(node('test'), node(positive, {'x': node('number')})),
+        Method(node('test'), node(buildin.neg, {'a': node('number')})),
+    ])
+    tape = compile_function(function)
+    assert_equal(tape(number=4), 4)
+    assert_equal(tape(number=-4), 4)
+    assert_equal(Value.run(function, number=-4), 4)
+
+
+def test_failing_argument():
+    """
+    Tests that the result of a failing call is passed on to the function
+    using it, where another method may still match, as in the evaluator.
+    """
+    tape = compile_function(FAILING_ARGUMENT)
+    assert_equal(Value.run(FAILING_ARGUMENT, number=-1), 5)
+    assert_equal(tape(number=-1), 5)
+    assert_equal(tape(number=7), Value.run(FAILING_ARGUMENT, number=7))
+
+
+def test_bad_bound():
+    """ Tests that a tape must be called with the free variables """
+    tape = compile_function(INCR)
+    with assert_raises(BadBound):
+        tape()
+    with assert_raises(BadBound):
+        tape(numbers=1)
+
+
+def test_positional():
+    """ Tests that a tape can be called in the order of the signature """
+    tape = compile_function(MUL_IF_LESS)
+    assert_equal(tape(3), tape(number=3))
+    with assert_raises(BadBound):
+        tape(3, 4)
+    with assert_raises(BadBound):
+        tape(3, number=3)
@@ -0,0 +1,276 @@
+"""
+.. currentmodule:: fbml.test.test_visitor
+
+"""
+from nose.tools import assert_equal
+
+from unittest import TestCase
+
+from fbml.test import MUL_IF_LESS, INCR
+from fbml.analysis import TypeSet, FiniteSet
+from fbml.visitor import Cleaner, Hooks, Profiler, Tracer
+
+
+class MemoTester (TestCase):
+
+    def tearDown(self):
+        TypeSet.memoize(None)
+        FiniteSet.memoize(None)
+        Cleaner.memoize(None)
+
+    def test_hits(self):
+        """ Test that a second run is answered by the memo """
+        memo = TypeSet.memoize(16)
+        first = TypeSet.run(MUL_IF_LESS, number=2)
+        misses = memo.misses
+        second = TypeSet.run(MUL_IF_LESS, number=2)
+        assert_equal(first, second)
+        assert_equal(memo.misses, misses)
+        assert memo.hits > 0
+
+    def test_shared_callee(self):
+        """ Test that a callee is reused across call sites """
+        memo = TypeSet.memoize(16)
+        TypeSet.run(MUL_IF_LESS, number=2)
+        hits = memo.hits
+        TypeSet.run(INCR, number=2)
+        assert memo.hits > hits
+
+    def test_evictions(self):
+        """ Test that the memo is bounded """
+        memo = TypeSet.memoize(2)
+        TypeSet.run(MUL_IF_LESS, number=2)
+        assert_equal(memo.statistics.size, 2)
+        assert memo.statistics.evictions > 0
+
+    def test_configuration(self):
+        """ Test that evaluators with different limits do not share """
+        FiniteSet.memoize(16)
+        numbers = frozenset({1, 2, 3})
+        assert_equal(
+            FiniteSet().call(MUL_IF_LESS, number=numbers),
+            frozenset({10, 20, 30})
+        )
+        assert (FiniteSet(limit=2).call(MUL_IF_LESS, number=numbers)
+                is FiniteSet.TOP)
+
+    def test_value_types(self):
+        """ Test that equal values of different types do not share """
+        from fbml.analysis import Value
+        from fbml.model import Function, Method
+        from fbml import buildin, node
+        function = Function({}, [Method(
+            node(buildin.real, {'a': node('x')}), node('x')
+        )])
+        for visitor in (FiniteSet, Value):
+            expected = [visitor().call(function, x=x) for x in (1.0, 1, True)]
+            visitor.memoize(16)
+            try:
+                assert_equal(
+                    [visitor().call(function, x=x) for x in (1.0, 1, True)],
+                    expected
+                )
+            finally:
+                visitor.memoize(None)
+
+    def test_cleaner(self):
+        """ Test that the cleaner gives the same result with a memo """
+        Cleaner.memoize(16)
+        TypeSet.memoize(16)
+        first = Cleaner(TypeSet()).call(INCR, number=10)
+        second = Cleaner(TypeSet()).call(INCR, number=10)
+        assert_equal(first, second)
+        assert Cleaner.memo.hits > 0
+
+    def test_disabled(self):
+        """ Test that subclasses use the memo of their class """
+        TypeSet.memoize(16)
+        assert FiniteSet.memo is None
+
+
+class InstrumentTester (TestCase):
+
+    def test_profiler(self):
+        """ Test that the profiler counts the functions and build ins """
+        from fbml.analysis import Value
+        profiler = Profiler()
+        evaluator = Value().instrument(profiler)
+        assert_equal(evaluator.call(MUL_IF_LESS, number=2), 20)
+        assert_equal(profiler.function_calls['mul_if_less'], 1)
+        assert_equal(profiler.buildin_calls['i_lt'], 1)
+        assert_equal(profiler.buildin_calls['i_ge'], 1)
+        assert_equal(profiler.buildin_calls['i_mul'], 1)
+        assert_equal(sum(profiler.node_calls.values()), 9)
+        assert profiler.cumulative['mul_if_less'] >= \
+            profiler.own['mul_if_less']
+        assert_equal(profiler.stack, [])
+        assert 'mul_if_less' in profiler.report()
+
+    def test_cardinalities(self):
+        """ Test that the profiler records the sizes of FiniteSets """
+        profiler = Profiler()
+        FiniteSet().instrument(profiler).call(
+            MUL_IF_LESS, number=frozenset({1, 2, 20})
+        )
+        assert profiler.cardinalities[3] > 0
+        profiler = Profiler()
+        FiniteSet(limit=2).instrument(profiler).call(
+            MUL_IF_LESS, number=frozenset({1, 2, 20})
+        )
+        assert profiler.cardinalities['TOP'] > 0
+
+    def test_cleaner(self):
+        """ Test that a cleaner can be instrumented """
+        profiler = Profiler()
+        cleaner = Cleaner(TypeSet()).instrument(profiler)
+        cleaner.call(INCR, number=TypeSet.INTEGER)
+        assert_equal(profiler.function_calls['incr'], 1)
+        calls = sum(profiler.function_calls.values())
+        assert_equal(profiler.cardinalities[1], calls)
+
+    def test_tracer(self):
+        """ Test that the tracer logs each step """
+        with self.assertLogs('fbml.visitor', 'DEBUG') as logs:
+            TypeSet().instrument(Tracer()).call(INCR, number=TypeSet.INTEGER)
+        assert any('>visit_function' in line for line in logs.output)
+
+    def test_remove(self):
+        """ Test that instrumenting with None removes the hooks """
+        class Failing (Hooks):
+            def enter_function(self, visitor, function, arguments):
+                raise AssertionError('Called')
+        evaluator = TypeSet().instrument(Failing())
+        evaluator.instrument(None)
+        assert 'visit_function' not in vars(evaluator)
+        evaluator.call(INCR, number=TypeSet.INTEGER)
+
+
+class StackTester (TestCase):
+
+    def deep(self, depth):
+        """ A function calling itself depth times, adding one each time """
+        from fbml.model import Function, Method
+        from fbml import buildin, node
+        function = INCR
+        for _ in range(depth):
+            function = Function({'test': True}, [Method(
+                node('test'),
+                node(function, {'number': node(buildin.add, {
+                    'a': node('number'), 'b': node('number')
+                })})
+            )])
+        return function
+
+    def stack(self, visitor):
+        visitor.recursive = False
+        return visitor
+
+    def test_identical(self):
+        """ Test that both engines gives the same results """
+        from fbml.analysis import Value
+        function = self.deep(4)
+        for visitor, number in ((Value(), 3),
+                                (TypeSet(), TypeSet.INTEGER),
+                                (FiniteSet(), frozenset({1, 2, 20}))):
+            for f in (MUL_IF_LESS, function):
+                assert_equal(
+                    self.stack(visitor.__class__()).call(f, number=number),
+                    visitor.call(f, number=number)
+                )
+        cleaner = Cleaner(TypeSet())
+        assert_equal(
+            self.stack(Cleaner(TypeSet())).call(
+                MUL_IF_LESS, number=TypeSet.INTEGER),
+            cleaner.call(MUL_IF_LESS, number=TypeSet.INTEGER)
+        )
+
+    def test_deep(self):
+        """ Test that the explicit stack handles deep calls """
+        function = self.deep(20000)
+        assert_equal(
+            self.stack(TypeSet()).call(function, number=TypeSet.INTEGER),
+            TypeSet.INTEGER
+        )
+        with self.assertRaises(RecursionError):
+            TypeSet().call(function, number=TypeSet.INTEGER)
+
+    def test_memo_and_hooks(self):
+        """ Test that the explicit stack uses the memo and the hooks """
+        memo = TypeSet.memoize(16)
+        try:
+            profiler = Profiler()
+            visitor = self.stack(TypeSet()).instrument(profiler)
+            visitor.call(self.deep(3), number=TypeSet.INTEGER)
+            assert_equal(profiler.function_calls['incr'], 1)
+            assert_equal(profiler.stack, [])
+            visitor.call(self.deep(3), number=TypeSet.INTEGER)
+            assert memo.hits > 0
+        finally:
+            TypeSet.memoize(None)
+
+    def test_errors(self):
+        """ Test that errors in a callee propagates to the caller """
+        from fbml.model import BadBound
+        from fbml.model import Function, Method
+        from fbml import node
+        function = Function({'test': True}, [Method(
+            node('test'), node(INCR, {'other': node('number')})
+        )])
+        with self.assertRaises(BadBound):
+            self.stack(TypeSet()).call(function, number=TypeSet.INTEGER)
+
+    def test_overrides(self):
+        """
+        Test that a visitor overriding a recursive visit method is visited
+        recursively, and that a bad bound is logged by both engines
+        """
+        from fbml.analysis import Value
+        from fbml.model import BadBound
+
+        class Counting (Value):
+            nodes = 0
+
+            def visit_node(self, node, sources):
+                Counting.nodes += 1
+                return super(Counting, self).visit_node(node, sources)
+
+        assert Counting.overrides_recursive()
+        assert not Value.overrides_recursive()
+        assert_equal(self.stack(Counting()).call(INCR, number=1), 2)
+        assert Counting.nodes > 0
+
+        for engine in (Value().visit_values, Value().evaluate_function):
+            with self.assertLogs('fbml.visitor', 'ERROR'):
+                with self.assertRaises(BadBound):
+                    engine(INCR, ())
+
+
+class SignatureTester (TestCase):
+
+    def test_positional(self):
+        """ Test that the arguments can be given positionally """
+        from fbml.analysis import Value
+        from fbml.model import BadBound
+        assert_equal(Value().call(MUL_IF_LESS, 3),
+                     Value().call(MUL_IF_LESS, number=3))
+        assert_equal(TypeSet().call(INCR, TypeSet.INTEGER), TypeSet.INTEGER)
+        with self.assertRaises(BadBound):
+            Value().call(INCR, 1, 2)
+
+    def test_node_arguments(self):
+        """
+        Test that the nodes pass their sources by position, leaving out the
+        sources which are not parameters of a cleaned function
+        """
+        from fbml.analysis import Value
+        from fbml.model import Function, Method
+        from fbml import node
+        function = Function({'test': True}, [Method(
+            node('test'), node(INCR, {
+                'number': node('number'), 'unused': node('number')
+            })
+        )])
+        for recursive in (True, False):
+            visitor = Value()
+            visitor.recursive = recursive
+            assert_equal(visitor.call(function, 3), 4)
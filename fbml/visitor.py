@@ -4,8 +4,36 @@
 Vistor consits of classes cabable of transversing the structure of the model,
 bringing with it an value of any sort.
 
+Instrumentation
+===============
+
+A visitor can be instrumented with :class:`Hooks` using
+:meth:`Visitor.instrument`, which are called when the visitor enters and
+exits functions and nodes, and when it applies build in methods. The
+:class:`Profiler` counts the calls, the time spend and the sizes of the
+resulting sets, and the :class:`Tracer` logs each step. A visitor which is
+not instrumented does not call any hooks.
+
+Engines
+=======
+
+The visitor visits a function recursively, so the depth of the Python stack
+follows the depth of the calls. If :attr:`Visitor.recursive` is False,
+:meth:`Visitor.call` uses :meth:`Visitor.evaluate_function` instead, where
+each function being visited is a generator on an explicit stack. Functions
+of only build in methods are visited directly, as they do not call other
+functions.
+
+Both engines share the memo, the binding of the arguments and the merge of
+the results of the methods, see :meth:`Visitor.lookup`, :meth:`Visitor.bind`
+and :meth:`Visitor.finish`, and call the same ``exit_*`` methods and hooks.
+The explicit stack can not call :meth:`Visitor.visit_method`,
+:meth:`Visitor.visit_nodes` and :meth:`Visitor.visit_node`, as they recurse,
+so a visitor overriding any of them is always visited recursively.
+
 """
-from collections import namedtuple
+import time
+from collections import namedtuple, OrderedDict, Counter, defaultdict
 from functools import reduce
 
 import logging
@@ -14,20 +42,461 @@ L = logging.getLogger(__name__)
 from fbml import model
 
 
+MISSING = object()
+
+
+class Memo(object):
+
+    """
+    A least recently used cache of the results of
+    :meth:`Visitor.visit_values`, keeping count of the hits, misses and
+    evictions.
+
+    :param maxsize: The maximal number of results in the cache.
+    """
+
+    Statistics = namedtuple('Statistics', [
+        'hits', 'misses', 'evictions', 'size', 'maxsize'
+    ])
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.table = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def lookup(self, key):
+        """
+        :returns: the result stored under the key, or MISSING
+        """
+        result = self.table.get(key, MISSING)
+        if result is MISSING:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.table.move_to_end(key)
+        return result
+
+    def store(self, key, result):
+        """ Stores the result, evicting the least recently used result """
+        self.table[key] = result
+        if len(self.table) > self.maxsize:
+            self.table.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self.table.clear()
+        self.hits = self.misses = self.evictions = 0
+
+    @property
+    def statistics(self):
+        return self.Statistics(
+            self.hits, self.misses, self.evictions,
+            len(self.table), self.maxsize
+        )
+
+
+def typed_key(value):
+    """
+    :returns: a key of the value which includes the classes of the value
+        and of the values it contains, so equal values of different types,
+        like ``1``, ``1.0`` and ``True``, have different keys.
+    """
+    if isinstance(value, model.Structure):
+        return value
+    elif isinstance(value, (set, frozenset)):
+        return value.__class__, frozenset(typed_key(item) for item in value)
+    elif isinstance(value, tuple):
+        return value.__class__, tuple(typed_key(item) for item in value)
+    return value.__class__, value
+
+
+def name_values(function, values):
+    """ Returns the dictionary of the positional arguments of a function """
+    return dict(zip(function.signature.parameters, values))
+
+
+class Hooks(object):
+
+    """
+    The hooks of an instrumented visitor, the default hooks does nothing.
+    The result is :data:`MISSING` if the visit raised an exception.
+    """
+
+    def enter_function(self, visitor, function, arguments):
+        pass
+
+    def exit_function(self, visitor, function, result):
+        pass
+
+    def enter_node(self, visitor, node, sources):
+        pass
+
+    def exit_node(self, visitor, node, result):
+        pass
+
+    def buildin_method(self, visitor, method, initial, result):
+        pass
+
+
+class Profiler(Hooks):
+
+    """
+    Hooks collecting the number of calls and the time spend in each function
+    and node, the number of calls of each build in method, and the sizes of
+    the sets resulting from function calls. The functions and nodes are
+    counted by their code.
+
+    The time of a function is both the cumulative time, including the
+    functions it calls, and the own time, excluding them.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.function_calls = Counter()
+        self.node_calls = Counter()
+        self.buildin_calls = Counter()
+        self.cumulative = defaultdict(float)
+        self.own = defaultdict(float)
+        self.node_time = defaultdict(float)
+        self.cardinalities = Counter()
+        self.stack = []
+
+    @staticmethod
+    def cardinality(result):
+        """
+        :returns: the size of a result which is a set, the cardinality
+            attribute of other results, or None
+        """
+        if isinstance(result, Cleaner.Clean):
+            result = result.result
+        if isinstance(result, (set, frozenset)):
+            return len(result)
+        return getattr(result, 'cardinality', None)
+
+    def enter_function(self, visitor, function, arguments):
+        self.stack.append([self.clock(), 0.0])
+
+    def exit_function(self, visitor, function, result):
+        start, children = self.stack.pop()
+        elapsed = self.clock() - start
+        code = function.code
+        self.function_calls[code] += 1
+        self.cumulative[code] += elapsed
+        self.own[code] += elapsed - children
+        if self.stack:
+            self.stack[-1][1] += elapsed
+        size = self.cardinality(result)
+        if size is not None:
+            self.cardinalities[size] += 1
+
+    def enter_node(self, visitor, node, sources):
+        self.stack.append([self.clock(), 0.0])
+
+    def exit_node(self, visitor, node, result):
+        start, children = self.stack.pop()
+        elapsed = self.clock() - start
+        self.node_calls[node.code] += 1
+        self.node_time[node.code] += elapsed
+        if self.stack:
+            # The node only forwards the time of the function it calls
+            self.stack[-1][1] += children
+
+    def buildin_method(self, visitor, method, initial, result):
+        self.buildin_calls[method.code] += 1
+
+    def report(self, limit=10):
+        """
+        :returns: a text report of the functions and nodes which used the
+            most time, the build in methods and the cardinalities.
+        """
+        lines = ['%-40s %8s %12s %12s' % ('function', 'calls', 'cumulative',
+                                           'own')]
+        for code, _ in Counter(self.cumulative).most_common(limit):
+            lines.append('%-40s %8d %12.6f %12.6f' % (
+                code, self.function_calls[code], self.cumulative[code],
+                self.own[code]
+            ))
+        lines.append('')
+        lines.append('%-40s %8s %12s' % ('node', 'calls', 'cumulative'))
+        for code, _ in Counter(self.node_time).most_common(limit):
+            lines.append('%-40s %8d %12.6f' % (
+                code, self.node_calls[code], self.node_time[code]
+            ))
+        lines.append('')
+        lines.append('%-40s %8s' % ('buildin', 'calls'))
+        for code, calls in self.buildin_calls.most_common():
+            lines.append('%-40s %8d' % (code, calls))
+        if self.cardinalities:
+            lines.append('')
+            lines.append('%-40s %8s' % ('cardinality', 'results'))
+            for size, count in sorted(self.cardinalities.items(),
+                                      key=lambda item: str(item[0])):
+                lines.append('%-40s %8d' % (size, count))
+        return '\n'.join(lines)
+
+
+class Tracer(Hooks):
+
+    """
+    Hooks logging every step of the visitor at the debug level.
+
+    :param logger: The logger, the logger of this module as default.
+    """
+
+    def __init__(self, logger=L):
+        self.logger = logger
+
+    def enter_function(self, visitor, function, arguments):
+        self.logger.debug('>visit_function       %s %s', function, arguments)
+
+    def exit_function(self, visitor, function, result):
+        self.logger.debug('<visit_function       %s %s', function, result)
+
+    def enter_node(self, visitor, node, sources):
+        self.logger.debug('>visit_node           %s %s', node, sources)
+
+    def exit_node(self, visitor, node, result):
+        self.logger.debug('<visit_node           %s %s', node, result)
+
+    def buildin_method(self, visitor, method, initial, result):
+        self.logger.debug('=visit_buildin_method %s %s', method, result)
+
+
 class Visitor(object):
 
     extremum = None
 
+    memo = None
+
+    hooks = None
+
+    recursive = True
+
+    INSTRUMENTED = ('visit_values', 'visit_node', 'visit_buildin_method')
+
+    RECURSIVE = ('visit_method', 'visit_nodes', 'visit_node')
+
+    def instrument(self, hooks):
+        """
+        Instruments the visitor with the hooks, by wrapping the visit
+        methods of this instance. Instrumenting with None removes the
+        wrappers again.
+
+        :param hooks: A :class:`Hooks`, or None
+
+        :returns: the visitor
+        """
+        for name in self.INSTRUMENTED:
+            self.__dict__.pop(name, None)
+        self.hooks = hooks
+        if hooks is None:
+            return self
+
+        visit_values = self.visit_values
+        visit_node = self.visit_node
+        visit_buildin_method = self.visit_buildin_method
+
+        def instrumented_values(function, values):
+            hooks.enter_function(
+                self, function, name_values(function, values)
+            )
+            result = MISSING
+            try:
+                result = visit_values(function, values)
+                return result
+            finally:
+                hooks.exit_function(self, function, result)
+
+        def instrumented_node(node, sources):
+            hooks.enter_node(self, node, sources)
+            result = MISSING
+            try:
+                result = visit_node(node, sources)
+                return result
+            finally:
+                hooks.exit_node(self, node, result)
+
+        def instrumented_buildin_method(method, initial):
+            result = visit_buildin_method(method, initial)
+            hooks.buildin_method(self, method, initial, result)
+            return result
+
+        self.visit_values = instrumented_values
+        self.visit_node = instrumented_node
+        self.visit_buildin_method = instrumented_buildin_method
+        return self
+
     @classmethod
     def run(cls, function, **arguments):
         return cls().call(function, **arguments)
 
-    def call(self, function, **arguments):
-        return self.visit_function(
-            function, {
-                name: self.transform(name, arg)
-                for name, arg in arguments.items()
-            })
+    @classmethod
+    def memoize(cls, maxsize=1024):
+        """
+        Enables a memo of the results of :meth:`visit_values`, shared by
+        every instance of the class and its subclasses. The memo is keyed on
+        the function and the transformed arguments, so it is only used when
+        the arguments are hashable.
+
+        :param maxsize: The size of the memo, None disables the memo.
+
+        :returns: the :class:`Memo`
+        """
+        cls.memo = Memo(maxsize) if maxsize else None
+        return cls.memo
+
+    def configuration(self):
+        """
+        Returns a hashable description of the state of the visitor, which
+        changes the results of the visitor. Used in the key of the memo.
+        """
+        return ()
+
+    def memo_key(self, function, arguments):
+        """
+        :returns: the key of the function called with the keyword arguments
+            in the memo, or None if the arguments are not hashable or not
+            the parameters of the function
+        """
+        try:
+            values = tuple(
+                arguments[name] for name in function.signature.parameters
+            )
+        except KeyError:
+            return None
+        return self.values_key(function, values)
+
+    def values_key(self, function, values):
+        """
+        :returns: the key of the function called with the positional
+            arguments in the memo, or None if they are not hashable
+        """
+        key = (
+            self.__class__, self.configuration(), function,
+            tuple(typed_key(value) for value in values)
+        )
+        try:
+            hash(key)
+        except TypeError:
+            return None
+        return key
+
+    def call(self, function, *values, **arguments):
+        """
+        Visits the function with the arguments transformed. The arguments
+        can also be given positionally, in the order of the parameters of
+        the :attr:`fbml.model.Function.signature`.
+        """
+        parameters = function.signature.parameters
+        if arguments or len(values) != len(parameters):
+            values = function.order_arguments(
+                function.name_arguments(values, arguments)
+            )
+        values = tuple(
+            self.transform(name, value)
+            for name, value in zip(parameters, values)
+        )
+        if self.recursive or self.overrides_recursive():
+            return self.visit_values(function, values)
+        return self.evaluate_function(function, values)
+
+    @classmethod
+    def overrides_recursive(cls):
+        """
+        True if the class overrides one of the :attr:`RECURSIVE` methods,
+        which the explicit stack of :meth:`evaluate_function` does not call.
+        """
+        return any(
+            getattr(cls, name) is not getattr(Visitor, name)
+            for name in cls.RECURSIVE
+        )
+
+    def evaluate_function(self, function, values):
+        """
+        Visits the function like :meth:`visit_values`, but without
+        recursion. Each function being visited is a generator from
+        :meth:`function_frame`, which yields the functions it calls and is
+        sent the results.
+        """
+        stack = [self.function_frame(function, values)]
+        result, error = None, None
+        while stack:
+            frame = stack[-1]
+            try:
+                if error is None:
+                    request = frame.send(result)
+                else:
+                    request = frame.throw(error)
+            except StopIteration as stop:
+                stack.pop()
+                result, error = stop.value, None
+            except Exception as exc:
+                stack.pop()
+                if not stack:
+                    raise
+                result, error = None, exc
+            else:
+                stack.append(self.function_frame(*request))
+                result = None
+        return result
+
+    def function_frame(self, function, values):
+        """ The generator of :meth:`evaluate_function` visiting a function """
+        hooks = self.hooks
+        if hooks is not None:
+            hooks.enter_function(
+                self, function, name_values(function, values)
+            )
+        result = MISSING
+        try:
+            key, result = self.lookup(function, values)
+            if result is not MISSING:
+                return result
+
+            initial = self.bind(function, values)
+            results = []
+            for method in function.methods:
+                if method.is_buildin:
+                    results.append(self.visit_buildin_method(method, initial))
+                    continue
+                test_value = yield from self.nodes_frame(method.guard, initial)
+                if self.allow(test_value):
+                    nodes = yield from self.nodes_frame(
+                        method.statement, initial
+                    )
+                    results.append(self.exit_method(method, test_value, nodes))
+                else:
+                    results.append(self.extremum)
+
+            result = self.finish(function, key, results)
+            return result
+        finally:
+            if hooks is not None:
+                hooks.exit_function(self, function, result)
+
+    def nodes_frame(self, node, initial):
+        """ The generator of :meth:`evaluate_function` visiting the nodes """
+        hooks = self.hooks
+        variables, steps = node.schedule
+        registers = [initial[name] for name in variables]
+        for step in steps:
+            current = step.node
+            sources = tuple(registers[index] for index in step.sources)
+            if hooks is not None:
+                hooks.enter_node(self, current, sources)
+            result = MISSING
+            try:
+                arguments = current.arguments(sources)
+                if current.function.is_buildin:
+                    function = self.visit_values(current.function, arguments)
+                else:
+                    function = yield current.function, arguments
+                result = self.exit_node(current, sources, function)
+            finally:
+                if hooks is not None:
+                    hooks.exit_node(self, current, result)
+            registers.append(result)
+        return registers[-1]
 
     def visit_function(self, function, arguments):
         """ visits a function
@@ -38,31 +507,75 @@ class Visitor(object):
             with. A dictionary containing the mapping from the values of the
             arguments to the function.
         """
-        L.debug(">visit_function       %s %s", function, arguments)
         try:
-            initial = function.bind_variables(arguments, self.transform)
+            values = function.order_arguments(arguments)
         except model.BadBound as e:
             L.error("<visit_function       %s %s", function, e)
             raise
-        else:
-            results = [
-                self.visit_buildin_method(method, initial) if method.is_buildin
-                else self.visit_method(method, initial)
-                for method in function.methods
-            ]
-
-            result = self.exit_function(function, results)
-            L.debug("<visit_function       %s %s", function, result)
+        return self.visit_values(function, values)
+
+    def visit_values(self, function, values):
+        """ visits a function called with positional arguments
+
+        :param function: The function to visit
+
+        :param values: The arguments in the order of the parameters of the
+            signature of the function, see
+            :meth:`fbml.model.Function.bind_positional`.
+        """
+        key, result = self.lookup(function, values)
+        if result is not MISSING:
             return result
 
+        initial = self.bind(function, values)
+        results = [
+            self.visit_buildin_method(method, initial) if method.is_buildin
+            else self.visit_method(method, initial)
+            for method in function.methods
+        ]
+        return self.finish(function, key, results)
+
+    def lookup(self, function, values):
+        """
+        Looks the function up in the memo, shared by both engines.
+
+        :returns: the key of the function in the memo, or None, and the
+            result, or MISSING
+        """
+        if self.memo is None:
+            return None, MISSING
+        key = self.values_key(function, values)
+        if key is None:
+            return None, MISSING
+        return key, self.memo.lookup(key)
+
+    def bind(self, function, values):
+        """
+        Binds the values to the function, shared by both engines, see
+        :meth:`fbml.model.Function.bind_positional`.
+        """
+        try:
+            return function.bind_positional(values, self.transform)
+        except model.BadBound as e:
+            L.error("<visit_function       %s %s", function, e)
+            raise
+
+    def finish(self, function, key, results):
+        """
+        Merges the results of the methods with :meth:`exit_function`, and
+        stores the result in the memo under the key, if it is not None.
+        Shared by both engines.
+        """
+        result = self.exit_function(function, results)
+        if key is not None:
+            self.memo.store(key, result)
+        return result
+
     def visit_buildin_method(self, method, initial):
-        L.debug(">visit_buildin_method %s %s", method, initial)
-        result = self.exit_buildin_method(
+        return self.exit_buildin_method(
             method,
             tuple(initial[argname] for argname in method.argmap)
         )
-        L.debug("<visit_buildin_method %s %s", method, result)
-        return result
 
     def visit_method(self, method, initial):
         """ visits a method
@@ -72,37 +585,33 @@ class Visitor(object):
         :param initial: The inital free variables, these variables should
             be a superset of the real need values
         """
-        L.debug(">visit_method         %s %s", method, initial)
         test_value = self.visit_nodes(method.guard, initial)
         if self.allow(test_value):
             nodes = self.visit_nodes(method.statement, initial)
-            result = self.exit_method(method, test_value, nodes)
+            return self.exit_method(method, test_value, nodes)
         else:
-            result = self.extremum
-        L.debug("<visit_method         %s %s", method, result)
-        return result
+            return self.extremum
 
     def visit_nodes(self, node, initial):
-        """ visits a node tree """
-        #L.debug("visit_nodes %s %s", node, initial)
-        mapping = dict(initial)
-        for visit_node in reversed(node.precedes()):
-            sources = tuple(mapping[s] for s in visit_node.sources)
-            mapping[visit_node] = self.visit_node(visit_node, sources)
-        return mapping[node]
+        """ visits a node tree, following the schedule of the node """
+        variables, steps = node.schedule
+        registers = [initial[name] for name in variables]
+        for step in steps:
+            sources = tuple(registers[index] for index in step.sources)
+            registers.append(self.visit_node(step.node, sources))
+        return registers[-1]
 
     def visit_node(self, node, sources):
         """ visits a node
 
         :param node: The head node
 
-        :param sources: The sources in order
+        :param sources: The sources in order, the sources which are not
+            parameters of the function are not passed on, see
+            :meth:`fbml.model.Node.arguments`.
         """
-        L.debug(">visit_node           %s %s", node, sources)
-        function = self.visit_function(node.function, node.project(sources))
-        result = self.exit_node(node, sources, function)
-        L.debug("<visit_node           %s %s", node, result)
-        return result
+        function = self.visit_values(node.function, node.arguments(sources))
+        return self.exit_node(node, sources, function)
 
     def allow(self, test):
         """
@@ -188,8 +697,11 @@ class Cleaner(Visitor):
         self.evaluator = evaluator
         self.extremum = self.Clean(None, self.evaluator.extremum)
 
-    def call(self, function, **arguments):
-        return super(Cleaner, self).call(function, **arguments).model
+    def configuration(self):
+        return (self.evaluator.__class__, self.evaluator.configuration())
+
+    def call(self, function, *values, **arguments):
+        return super(Cleaner, self).call(function, *values, **arguments).model
 
     def unzip(self, values):
         return (
@@ -199,15 +711,14 @@ class Cleaner(Visitor):
 
     def transform(self, name, value):
         if isinstance(value, self.Clean):
-            return value
+            # The model of the called function refers to its own variable,
+            # not to the model of the argument in the caller
+            return self.Clean(name, value.result)
         else:
             return self.Clean(name, self.evaluator.transform(name, value))
 
     def allow(self, test):
-        L.debug('Cleaner.allow %s', test)
-        result = self.evaluator.allow(test.result) and test.model
-        L.debug('Cleaner.allow %s', (result, ))
-        return result
+        return self.evaluator.allow(test.result) and test.model
 
     def exit_function(self, function, results):
         models, results_ = self.unzip(results)
@@ -226,7 +737,6 @@ class Cleaner(Visitor):
         return self.Clean(method, result)
 
     def exit_method(self, method, guard, statement):
-        L.debug('exit_method %s %s %s', method, guard, statement)
         return self.Clean(
             model.Method(guard.model, statement.model),
             self.evaluator.exit_method(method, guard.result, statement.result)
@@ -2,67 +2,403 @@
 .. currentmodule:: flow
 .. moduleauthor:: Christian Gram Kalhauge <christian@kalhauge.dk>
 
+The flow language, a textual frontend to :mod:`fbml`. A program is a
+sequence of methods, and the methods with the same name are the methods of
+one :class:`fbml.model.Function`::
+
+    method clamp (a : N, high : N)
+        c = a < high;
+    return c
+
+The source is split into tokens by a single regular expression, and parsed
+by a predictive parser which builds the model directly. The sets of the
+arguments are turned into the guard of the method, ``N``, ``R`` and ``B``
+test the type of the argument, and a set builder like ``{ x > 0 | x : N }``
+becomes a predicate function called with the argument. Lists, like
+``N{X}``, are not tested.
+
+A name which is called is resolved to a function defined earlier in the
+source, then to a function of :mod:`fbml.buildin`, or else becomes a
+function without methods with that name. As the functions are streamed, a
+function can not be defined after it is called. The arguments of a call are
+positional, and are given the argument names of the build in method or of
+the first method of the function taking that number of arguments, as the
+methods of a function may take different arguments.
+
+A list, like ``[1, 2]``, is a constant tuple of numbers. The numbers of a
+list are reals if any of them is a real, so the elements have one type.
+
 """
+import re
+from collections import namedtuple
+from functools import reduce
+from string import ascii_lowercase
 
 import logging
 L = logging.getLogger(__name__)
 
-from sparse import parser, lexer
+from fbml.model import Function, Method
+from fbml import buildin, node
 
 KEYWORDS = ('method', 'return')
 TOKENS = (
-        ('ID'        , r'[a-zA-Z_]+'),
-        ('SKIP'      , r'[ \t]'),
-        ('NEWLINE'   , r'\n'),
-        ('END'       , r';'),
-        ('L_PAR'    , r'\('),
-        ('R_PAR'    , r'\)'),
-        ('L_CUR'    , r'\{'),
-        ('R_CUR'    , r'\}'),
+    ('NUMBER',  r'\d+\.\d*|\.\d+|\d+'),
+    ('ID',      r'[a-zA-Z_][a-zA-Z_0-9]*'),
+    ('OP',      r'<=|>=|==|[-+*<>=:,|;(){}\[\]]'),
+    ('COMMENT', r'\#.*'),
+    ('SKIP',    r'\s+'),
+    ('ERROR',   r'.'),
+)
+
+GRAMMA = """
+PROGRAM     := METHOD*
+METHOD      := 'method' ID '(' [ARG (',' ARG)*] ')' STATEMENT* 'return' ID
+ARG         := ID ':' SET
+SET         := ('N' | 'R' | 'B') ['{' ID '}']
+             | '{' EXPRESSION '|' ID ':' SET '}'
+STATEMENT   := ID '=' EXPRESSION [';']
+EXPRESSION  := SUM [('<' | '<=' | '>' | '>=' | '==') SUM]
+SUM         := PRODUCT (('+' | '-') PRODUCT)*
+PRODUCT     := UNARY ('*' UNARY)*
+UNARY       := '-' UNARY | ATOM
+ATOM        := NUMBER | LIST | ID ['(' [EXPRESSION (',' EXPRESSION)*] ')']
+             | '(' EXPRESSION ')'
+LIST        := '[' NUMBER (',' NUMBER)* ']'
+"""
+
+LEXER = re.compile('|'.join(
+    '(?P<%s>%s)' % (name, regex) for name, regex in TOKENS
+))
+
+OPERATORS = {
+    '+': buildin.add,
+    '-': buildin.sub,
+    '*': buildin.mul,
+    '<': buildin.lt,
+    '<=': buildin.le,
+    '>': buildin.gt,
+    '>=': buildin.ge,
+    '==': buildin.eq,
+}
+
+COMPARISONS = ('<', '<=', '>', '>=', '==')
+
+TYPE_TESTS = {
+    'N': buildin.integer,
+    'R': buildin.real,
+    'B': buildin.boolean,
+}
+
+BUILDINS = {
+    function.name: function
+    for function in vars(buildin).values() if isinstance(function, Function)
+}
+
+Token = namedtuple('Token', ['kind', 'value', 'line'])
+
+
+def tokenize(source):
+    """
+    Yields the tokens of the source, which is a string or an iterable of
+    lines, like a file. The keywords are tokens of their own kind.
+    """
+    lines = source.splitlines() if isinstance(source, str) else source
+    for line_number, line in enumerate(lines, 1):
+        for match in LEXER.finditer(line):
+            kind, value = match.lastgroup, match.group()
+            if kind == 'SKIP' or kind == 'COMMENT':
+                continue
+            elif kind == 'ERROR':
+                raise SyntaxError(
+                    'Unexpected character %r at line %s'
+                    % (value, line_number)
+                )
+            elif kind == 'ID' and value in KEYWORDS:
+                kind = value
+            elif kind == 'OP':
+                kind = value
+            yield Token(kind, value, line_number)
+    yield Token('EOF', '', None)
+
+
+def argument_names(function, count):
+    """
+    Returns the names of the positional arguments of a function, the
+    argument names of a build in method, or else ``a``, ``b``, ``c``...
+    """
+    if function.methods and function.methods[0].is_buildin:
+        names = function.methods[0].argmap
+        if len(names) != count:
+            raise SyntaxError('%s takes %s arguments, %s given'
+                              % (function.name, len(names), count))
+        return names
+    if count > len(ascii_lowercase):
+        return tuple('a%s' % i for i in range(count))
+    return tuple(ascii_lowercase[:count])
+
+
+class Scope(object):
+
+    """
+    The bound values of a function being build, the constants of the
+    source are bound to names which can not be variables.
+    """
+
+    def __init__(self):
+        self.bound = {}
+
+    def constant(self, value):
+        name = '#' + repr(value)
+        self.bound[name] = value
+        return node(name)
+
+
+class Parser(object):
+
+    """
+    The predictive parser of the flow language, it reads the tokens one at
+    a time, and builds the functions of the source.
+    """
+
+    def __init__(self, tokens):
+        self.tokens = iter(tokens)
+        self.token = next(self.tokens)
+        self.functions = {}
+        self.arguments = {}
+        self.externs = {}
+
+    def error(self, expected):
+        raise SyntaxError('Expected %s but got %r at line %s' % (
+            expected, self.token.value or self.token.kind, self.token.line
+        ))
+
+    def accept(self, kind):
+        """ Consumes the token if it is of the kind, and returns it """
+        token = self.token
+        if token.kind != kind:
+            return None
+        self.token = next(self.tokens)
+        return token
+
+    def expect(self, kind):
+        token = self.accept(kind)
+        if token is None:
+            self.error(repr(kind))
+        return token
+
+    def resolve(self, token):
+        """
+        Returns the function called by the ID token, the externs are kept
+        with the line of their first call.
+        """
+        name = token.value
+        if name in self.functions:
+            return self.functions[name]
+        if name in BUILDINS:
+            return BUILDINS[name]
+        if name not in self.externs:
+            self.externs[name] = Function({}, [], name), token.line
+        return self.externs[name][0]
+
+    def names(self, function, count):
+        """
+        Returns the names of the positional arguments of a function, the
+        arguments of the first method taking that number of arguments if it
+        is defined in the source.
+
+        :raises SyntaxError: if the number of arguments is wrong.
+        """
+        if self.functions.get(function.name) is not function:
+            return argument_names(function, count)
+        arities = self.arguments[function.name]
+        if count not in arities:
+            raise SyntaxError('%s takes %s arguments, %s given at line %s'
+                              % (function.name,
+                                 ' or '.join(str(n) for n in sorted(arities)),
+                                 count, self.token.line))
+        return arities[count]
+
+    def __iter__(self):
+        """
+        Yields the functions of the source, a function is yielded when a
+        method of another function follows it. A function which gets more
+        methods later in the source is yielded again with all its methods.
+        """
+        current = None
+        while self.token.kind != 'EOF':
+            name, method, bound = self.method()
+            if current is not None and current != name:
+                yield self.functions[current]
+            current = name
+            previous = self.functions.get(name)
+            if previous is None:
+                if name in self.externs:
+                    raise SyntaxError(
+                        '%s is called at line %s before it is defined'
+                        % (name, self.externs[name][1])
+                    )
+                methods, bound_values = [method], bound
+            else:
+                methods = list(previous.methods) + [method]
+                bound_values = dict(previous.bound_value_pairs, **bound)
+            self.functions[name] = Function(bound_values, methods, name)
+        if current is not None:
+            yield self.functions[current]
+
+    def method(self):
+        """ METHOD """
+        self.expect('method')
+        name = self.expect('ID').value
+        scope = Scope()
+        self.expect('(')
+        arguments, tests = [], []
+        if self.token.kind != ')':
+            while True:
+                argument, test = self.argument()
+                arguments.append(argument)
+                if test is not None:
+                    tests.append(test)
+                if not self.accept(','):
+                    break
+        self.expect(')')
+        self.arguments.setdefault(name, {}).setdefault(
+            len(arguments), tuple(arguments)
         )
-GRAMMA = {
-        'PROGRAM' : (
-            (list, 'METHOD+'),
-            ),
-        'METHOD'  : (
-            (ast.Method,      'method ID ( ARGS ) STATEMENTS return ID'),
-            ),
-        'ARGS'    : (
-            (lambda a, args: list([a] + args), 'ARG ARGX*'),
-            ),
-        'ARGX'    : (
-            (parser.reflex,   ', ARG'),
-            ),
-        'ARG'     : (
-            (ast.Argument,    'ID : SET')
-            ),
-        'STATEMENTS' : (
-            (list, 'STATEMENT+'),
-            ),
-        'STATEMENT' : (
-            (ast.Statement, 'ID = FUNCTION_CALL'),
-            ),
-        'FUNCTION_CALL' : (
-            (ast.FunctionCall, 'ID ( F_ARGS ) '),
-            ),
-        'F_ARGS'    : (
-            (lambda a, args: list([a] + args), 'ARG ARGX*'),
-            ),
-        'F_ARGX'    : (
-            (parser.reflex,   ', ARG'),
-            ),
-        'F_ARG'    : (
-            (parser.reflex,   'FUNCTION_CALL'),
-            (ast.FuncArg,   'ID'),
-            ),
-    }
-
-
-def parse(program_str):
+
+        env = {argument: node(argument) for argument in arguments}
+        while self.token.kind != 'return':
+            target = self.expect('ID').value
+            self.expect('=')
+            env[target] = self.expression(env, scope)
+            self.accept(';')
+        self.expect('return')
+        result = self.expect('ID').value
+        statement = env[result] if result in env else node(result)
+
+        guard = reduce(
+            lambda a, b: node(buildin.and_, {'a': a, 'b': b}), tests
+        ) if tests else scope.constant(True)
+        return name, Method(guard, statement), scope.bound
+
+    def argument(self):
+        """ ARG, returns the name and the test of the argument """
+        name = self.expect('ID').value
+        self.expect(':')
+        test = self.set()
+        return name, None if test is None else test(node(name))
+
+    def set(self):
+        """ SET, returns a function from a node to its test, or None """
+        if self.accept('{'):
+            scope = Scope()
+            predicate = self.expression({}, scope)
+            self.expect('|')
+            variable = self.expect('ID').value
+            self.expect(':')
+            test = self.set()
+            self.expect('}')
+            guard = scope.constant(True) if test is None else \
+                test(node(variable))
+            function = Function(scope.bound, [Method(guard, predicate)])
+            return lambda argument: node(function, {variable: argument})
+
+        token = self.expect('ID')
+        if token.value not in TYPE_TESTS:
+            self.error('a set')
+        if self.accept('{'):
+            self.expect('ID')
+            self.expect('}')
+            return None
+        function = TYPE_TESTS[token.value]
+        return lambda argument: node(function, {'a': argument})
+
+    def expression(self, env, scope):
+        """ EXPRESSION """
+        left = self.sum(env, scope)
+        if self.token.kind in COMPARISONS:
+            operator = self.accept(self.token.kind).kind
+            right = self.sum(env, scope)
+            left = node(OPERATORS[operator], {'a': left, 'b': right})
+        return left
+
+    def sum(self, env, scope):
+        """ SUM """
+        left = self.product(env, scope)
+        while self.token.kind in ('+', '-'):
+            operator = self.accept(self.token.kind).kind
+            right = self.product(env, scope)
+            left = node(OPERATORS[operator], {'a': left, 'b': right})
+        return left
+
+    def product(self, env, scope):
+        """ PRODUCT """
+        left = self.unary(env, scope)
+        while self.accept('*'):
+            right = self.unary(env, scope)
+            left = node(buildin.mul, {'a': left, 'b': right})
+        return left
+
+    def unary(self, env, scope):
+        """ UNARY """
+        if self.accept('-'):
+            return node(buildin.neg, {'a': self.unary(env, scope)})
+        return self.atom(env, scope)
+
+    def atom(self, env, scope):
+        """ ATOM """
+        token = self.accept('NUMBER')
+        if token:
+            return scope.constant(self.number(token))
+        if self.accept('['):
+            values = [self.number(self.expect('NUMBER'))]
+            while self.accept(','):
+                values.append(self.number(self.expect('NUMBER')))
+            self.expect(']')
+            if any(isinstance(value, float) for value in values):
+                values = [float(value) for value in values]
+            return scope.constant(tuple(values))
+        if self.accept('('):
+            result = self.expression(env, scope)
+            self.expect(')')
+            return result
+
+        token = self.expect('ID')
+        name = token.value
+        if not self.accept('('):
+            return env[name] if name in env else node(name)
+        arguments = []
+        if self.token.kind != ')':
+            arguments.append(self.expression(env, scope))
+            while self.accept(','):
+                arguments.append(self.expression(env, scope))
+        self.expect(')')
+        function = self.resolve(token)
+        return node(function, zip(self.names(function, len(arguments)),
+                                  arguments))
+
+    @staticmethod
+    def number(token):
+        return float(token.value) if '.' in token.value else int(token.value)
+
+
+def iter_parse(source):
     """
-    Parses a flow program
+    Parses a flow program, and yields the functions as they are parsed, see
+    :meth:`Parser.__iter__`.
+
+    :param source: A string or an iterable of lines, like a file.
     """
-    tokens = lexer.tokenize(program_str, TOKENS, KEYWORDS)
-    return parser.parse('PROGRAM', tokens, GRAMMA)
+    return iter(Parser(tokenize(source)))
 
 
+def parse(source):
+    """
+    Parses a flow program
+
+    :returns: the list of the functions of the program, in the order they
+        are defined.
+    """
+    functions = {}
+    for function in iter_parse(source):
+        functions[function.name] = function
+    return list(functions.values())
@@ -54,3 +54,81 @@ def test_fibonati():
     """
     parse(program)
 
+
+def test_evaluate_add():
+    """
+    Ensures that the parsed program evaluates, and that the sets guard it.
+    """
+    from fbml.analysis import Value
+    my_add, = parse("""
+    method my_add (a : N, b : N)
+        c = add(a, b) * 2 - 1;  # infix operators
+    return c
+    """)
+    assert Value.run(my_add, a=1, b=2) == 5
+    assert Value.run(my_add, a=1.0, b=2) is None
+
+
+def test_set_builder():
+    """
+    Ensures that a set builder becomes a predicate in the guard.
+    """
+    from fbml.analysis import Value
+    positive, = parse("""
+    method positive (a : { x > 0 | x : N })
+    return a
+    """)
+    assert Value.run(positive, a=3) == 3
+    assert Value.run(positive, a=-3) is None
+
+
+def test_iter_parse():
+    """
+    Ensures that methods with the same name are one function, and that the
+    functions are streamed from the lines of a file.
+    """
+    from io import StringIO
+    from flow import iter_parse
+    source = StringIO("""
+    method one (a : N) return a
+    method one (a : R) return a
+    method two (a : B) b = one(a) return b
+    """)
+    one, two = iter_parse(source)
+    assert len(one.methods) == 2
+    assert two.methods[0].statement.function is one
+
+
+def test_syntax_error():
+    """
+    Ensures that bad programs raise a SyntaxError.
+    """
+    from nose.tools import assert_raises
+    for program in ('method (a : N) return a',
+                    'method f (a : Q) return a',
+                    'method f (a : N) b = add(a) return b',
+                    'method f (a : N) b = a $ 1 return b',
+                    'method f (a : N) b = g(a) return b\n'
+                    'method g (a : N) return a',
+                    'method f (a : N) b = induct([], a) return b',
+                    'method g (a : N, b : N) return a\n'
+                    'method f (a : N) b = g(a) return b'):
+        with assert_raises(SyntaxError):
+            parse(program)
+
+
+def test_list():
+    """
+    Ensures that a list is a constant with elements of one type.
+    """
+    from fbml.analysis import TypeSet
+    program = """
+    method first (a : N)
+        b = [1, 2];
+        c = [1, 2.5];
+    return b
+    """
+    first, = parse(program)
+    assert sorted(value for name, value in first.bound_value_pairs) == \
+        [(1, 2), (1.0, 2.5)]
+    assert TypeSet.run(first, a=1) == TypeSet.INTEGER_LIST